@@ -4,12 +4,13 @@ from riptide.anneal.anneal_config import Config
 
 @tf.custom_gradient
 def AlphaClip(x, alpha):
-    output = tf.clip_by_value(x, 0, alpha)
+    clip = tf.cast(alpha, x.dtype)
+    output = tf.clip_by_value(x, 0, clip)
 
     def grad_fn(dy):
-        x_grad_mask = tf.cast(tf.logical_and(x >= 0, x <= alpha), tf.float32)
-        alpha_grad_mask = tf.cast(x >= alpha, tf.float32)
-        alpha_grad = tf.reduce_sum(dy * alpha_grad_mask)
+        x_grad_mask = tf.cast(tf.logical_and(x >= 0, x <= clip), dy.dtype)
+        alpha_grad_mask = tf.cast(x >= clip, dy.dtype)
+        alpha_grad = tf.cast(tf.reduce_sum(dy * alpha_grad_mask), alpha.dtype)
         x_grad = dy * x_grad_mask
 
         return [x_grad, alpha_grad]
@@ -19,6 +20,8 @@ def AlphaClip(x, alpha):
 
 @tf.custom_gradient
 def AlphaQuantize(x, alpha, bits):
+    alpha = tf.cast(alpha, x.dtype)
+    bits = tf.cast(bits, x.dtype)
     output = tf.round(x * ((2**bits - 1) / alpha)) * (alpha / (2**bits - 1))
 
     def grad_fn(dy):
@@ -51,11 +54,13 @@ class PACT(tf.keras.layers.Layer):
 
     def call(self, inputs):
         if self.quantize:
-            outputs = AlphaClip(inputs, self.alpha)
+            # Read alpha once, in the compute dtype under mixed precision.
+            alpha = tf.convert_to_tensor(self.alpha)
+            outputs = AlphaClip(inputs, alpha)
             if not self.fixed:
                 tf.summary.histogram('alpha', self.alpha)
             with tf.name_scope('QA'):
-                outputs = AlphaQuantize(outputs, self.alpha, self.bits)
+                outputs = AlphaQuantize(outputs, alpha, self.bits)
                 tf.summary.histogram('activation', inputs)
                 tf.summary.histogram('quantized_activation', outputs)
         else:
@@ -79,6 +84,8 @@ def get_sawb_coefficients(bits):
 
 @tf.custom_gradient
 def SAWBQuantize(x, alpha, bits):
+    alpha = tf.cast(alpha, x.dtype)
+    bits = tf.cast(bits, x.dtype)
     # Clip between -alpha and alpha
     clipped = tf.clip_by_value(x, -alpha, alpha)
     # Rescale to [0, alpha]
@@ -106,24 +113,36 @@ class SAWBConv2D(tf.keras.layers.Conv2D):
         self.bits = float(self.bits)
         if self.quantize:
             self.c1, self.c2 = get_sawb_coefficients(self.bits)
+        # Set by gradient accumulation to reuse one quantization of the
+        # kernel for several micro-batches.
+        self.quantized_kernel = None
         # optional for converting, reference to the layer that
         # quantized the outputs
         self.parent = parent 
         
 
+    def quantize_kernel(self):
+        # The latent kernel is read in the compute dtype under a mixed
+        # precision policy, also when called outside of `call`.
+        latent = tf.cast(tf.convert_to_tensor(self.kernel), self._compute_dtype)
+        if not self.quantize:
+            return latent
+        # Compute proper scale for our weights.
+        alpha = self.c1 * tf.sqrt(tf.reduce_mean(
+            latent**2)) + self.c2 * tf.reduce_mean(
+                tf.abs(latent))
+        # Quantize kernel
+        with tf.name_scope("QW"):
+            kernel = SAWBQuantize(latent, alpha, self.bits)
+            tf.summary.histogram("weight", self.kernel)
+            tf.summary.histogram("quantized_weight", kernel)
+        return kernel
+
     def call(self, inputs):
-        if self.quantize:
-            # Compute proper scale for our weights.
-            alpha = self.c1 * tf.sqrt(tf.reduce_mean(
-                self.kernel**2)) + self.c2 * tf.reduce_mean(
-                    tf.abs(self.kernel))
-            # Quantize kernel
-            with tf.name_scope("QW"):
-                kernel = SAWBQuantize(self.kernel, alpha, self.bits)
-                tf.summary.histogram("weight", self.kernel)
-                tf.summary.histogram("quantized_weight", kernel)
+        if self.quantized_kernel is not None:
+            kernel = self.quantized_kernel
         else:
-            kernel = self.kernel
+            kernel = self.quantize_kernel()
 
         # Invoke convolution
         outputs = self._convolution_op(inputs, kernel)
@@ -152,18 +171,32 @@ class SAWBDense(tf.keras.layers.Dense):
             self.bits = self.scope.w_bits
         if self.quantize:
             self.c1, self.c2 = get_sawb_coefficients(self.bits)
+        # Set by gradient accumulation to reuse one quantization of the
+        # kernel for several micro-batches.
+        self.quantized_kernel = None
+
+    def quantize_kernel(self):
+        # The latent kernel is read in the compute dtype under a mixed
+        # precision policy, also when called outside of `call`.
+        latent = tf.cast(tf.convert_to_tensor(self.kernel), self._compute_dtype)
+        if not self.quantize:
+            return latent
+        # Compute proper scale for our weights.
+        alpha = self.c1 * tf.sqrt(tf.reduce_mean(
+            latent**2)) + self.c2 * tf.reduce_mean(
+                tf.abs(latent))
+        # Quantize kernel
+        with tf.name_scope("QW"):
+            kernel = SAWBQuantize(latent, alpha, self.bits)
+            tf.summary.histogram("weight", self.kernel)
+            tf.summary.histogram("quantized_weight", kernel)
+        return kernel
 
     def call(self, inputs):
-        if self.quantize:
-            alpha = self.c1 * tf.sqrt(tf.reduce_mean(
-                self.kernel**2)) + self.c2 * tf.reduce_mean(
-                    tf.abs(self.kernel))
-            with tf.name_scope("QW"):
-                kernel = SAWBQuantize(self.kernel, alpha, self.bits)
-                tf.summary.histogram("weight", self.kernel)
-                tf.summary.histogram("quantized_weight", kernel)
+        if self.quantized_kernel is not None:
+            kernel = self.quantized_kernel
         else:
-            kernel = self.kernel
+            kernel = self.quantize_kernel()
 
         rank = len(inputs.shape)
         if rank > 2:
@@ -2,7 +2,7 @@ import tensorflow as tf
 from .learning_schedules import *
 
 
-def get_optimizer(name, global_step, batch_size, num_gpus=1):
+def get_optimizer(name, global_step, batch_size, num_gpus=1, accum_steps=1):
     schedules = {
         'adam': adam_piecewise,
         'sgd': sgd_piecewise,
@@ -19,4 +19,4 @@ def get_optimizer(name, global_step, batch_size, num_gpus=1):
     else:
         name = 'sgd'
 
-    return schedules[name](global_step, batch_size, num_gpus)
+    return schedules[name](global_step, batch_size, num_gpus, accum_steps)
@@ -5,19 +5,24 @@ from .clr import cyclic_learning_rate
 _NUM_IMAGES = 1281167
 
 
-def adjust_start_lr(lr, batch_size, num_gpus, batch_denom=128):
+def adjust_start_lr(lr, batch_size, num_gpus, batch_denom=128, accum_steps=1):
     if num_gpus == 0:
         num_gpus = 1
 
-    batch_size = batch_size * num_gpus
+    # Gradients accumulated over accum_steps micro-batches form one step
+    # of the effective batch.
+    batch_size = batch_size * num_gpus * accum_steps
 
     lr_adjustment = batch_size / batch_denom
     starting_lr = lr * lr_adjustment
     return starting_lr, _NUM_IMAGES / batch_size
 
 
-def adam_piecewise(global_step, batch_size, num_gpus):
-    starting_lr, steps_per_epoch = adjust_start_lr(1e-4, batch_size, num_gpus)
+def adam_piecewise(global_step, batch_size, num_gpus, accum_steps=1):
+    starting_lr, steps_per_epoch = adjust_start_lr(1e-4,
+                                                   batch_size,
+                                                   num_gpus,
+                                                   accum_steps=accum_steps)
 
     lr_decay = 0.2
     lr_values = [
@@ -32,11 +37,12 @@ def adam_piecewise(global_step, batch_size, num_gpus):
     return optimizer, lr_schedule
 
 
-def sgd_piecewise(global_step, batch_size, num_gpus):
+def sgd_piecewise(global_step, batch_size, num_gpus, accum_steps=1):
     starting_lr, steps_per_epoch = adjust_start_lr(0.1,
                                                    batch_size,
                                                    num_gpus,
-                                                   batch_denom=256)
+                                                   batch_denom=256,
+                                                   accum_steps=accum_steps)
 
     lr_scales = [1, 1e-1, 1e-2, 1e-3, 1e-4]
     lr_values = [starting_lr] * len(lr_scales)
@@ -50,11 +56,12 @@ def sgd_piecewise(global_step, batch_size, num_gpus):
     return optimizer, lr_schedule
 
 
-def cosine_decay(global_step, batch_size, num_gpus):
+def cosine_decay(global_step, batch_size, num_gpus, accum_steps=1):
     starting_lr, steps_per_epoch = adjust_start_lr(.0128,
                                                    batch_size,
                                                    num_gpus,
-                                                   batch_denom=128)
+                                                   batch_denom=128,
+                                                   accum_steps=accum_steps)
 
     lr_schedule = tf.compat.v1.train.cosine_decay_restarts(
         starting_lr, global_step, 1000)
@@ -66,11 +73,12 @@ def cosine_decay(global_step, batch_size, num_gpus):
     return optimizer, lr_schedule
 
 
-def cyclic(global_step, batch_size, num_gpus):
+def cyclic(global_step, batch_size, num_gpus, accum_steps=1):
     max_lr, steps_per_epoch = adjust_start_lr(.1,
                                               batch_size,
                                               num_gpus,
-                                              batch_denom=128)
+                                              batch_denom=128,
+                                              accum_steps=accum_steps)
 
     step_size = 4 * steps_per_epoch
 
@@ -83,12 +91,16 @@ def cyclic(global_step, batch_size, num_gpus):
     # Momentum should vary inversely to learning rate.
     max_momentum = 0.9
     min_momentum = 0.0
-    momentum_schedule = max_momentum - cyclic_learning_rate(
-        global_step,
-        learning_rate=min_momentum,
-        max_lr=max_momentum,
-        step_size=step_size,
-        mode='triangular')
+    momentum_cycle = cyclic_learning_rate(global_step,
+                                         learning_rate=min_momentum,
+                                         max_lr=max_momentum,
+                                         step_size=step_size,
+                                         mode='triangular')
+    if callable(momentum_cycle):
+        # Eager execution returns schedules as functions.
+        momentum_schedule = lambda: max_momentum - momentum_cycle()
+    else:
+        momentum_schedule = max_momentum - momentum_cycle
 
     optimizer = tf.compat.v1.train.MomentumOptimizer(
         learning_rate=lr_schedule,
@@ -1,5 +1,6 @@
 import tensorflow as tf
 import tensorflow.keras.layers as nn
+from riptide.binary.binary_layers import summary_histogram
 from riptide.anneal.anneal_funcs import *
 from tensorflow.keras.regularizers import l2
 
@@ -252,6 +253,6 @@ class SqueezeNet(tf.keras.models.Model):
 
         y = self.avgpool(y)
         y = self.classifier(y)
-        tf.compat.v1.summary.histogram('output', y)
+        summary_histogram('output', y)
 
         return y
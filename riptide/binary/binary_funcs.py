@@ -1,11 +1,12 @@
 import numpy as np
+from functools import partial
 import tensorflow as tf
 import tensorflow.keras as keras
 from .bit_approximations import load_clusters, load_bits
 
 
 def log2(x):
-    return tf.math.log(x) / tf.math.log(2.0)
+    return tf.math.log(x) / tf.math.log(tf.constant(2.0, x.dtype))
 
 
 @tf.custom_gradient
@@ -79,7 +80,7 @@ def get_quantize_bits(x):
     # Fix dimensions of mean
     for i in range(len(x.shape) - 1):
         mean = tf.expand_dims(mean, axis=0)
-    bits = tf.cast(x >= 0, tf.float32)
+    bits = tf.cast(x >= 0, x.dtype)
     bits = (2 * bits) - 1
     with tf.name_scope("AP2"):
         approximate_mean = AP2(mean)
@@ -101,7 +102,7 @@ def FixedPointQuantize(inputs, scale, bits, rescale):
     y = tf.cond(rescale, true_fn=lambda: y * bit_value, false_fn=lambda: y)
 
     def grad_fn(dy):
-        grad_mask = tf.cast(tf.abs(inputs) <= scale, tf.float32)
+        grad_mask = tf.cast(tf.abs(inputs) <= scale, dy.dtype)
         dx = grad_mask * dy
         return [dx, None, None, None]
 
@@ -118,12 +119,12 @@ def XQuantize(x):
         # This can effect the scales based on the means of kernels.
         # Likely has no significant effect though.
         gradient_cutoff = 10.0
-        grad_mask = tf.cast(tf.abs(x) <= gradient_cutoff, tf.float32)
+        grad_mask = tf.cast(tf.abs(x) <= gradient_cutoff, dy.dtype)
         # Allow weights to move off away from 1 if needed.
         leaky_grad_mask = tf.cast(
             tf.logical_or(
                 tf.logical_and(x > gradient_cutoff, dy > 0),
-                tf.logical_and(x < -gradient_cutoff, dy < 0)), tf.float32)
+                tf.logical_and(x < -gradient_cutoff, dy < 0)), dy.dtype)
         dx = grad_mask * dy + 0.1 * leaky_grad_mask * dy
         return [dx]
 
@@ -132,7 +133,7 @@ def XQuantize(x):
 
 @tf.custom_gradient
 def Quantize(x):
-    bits = tf.cast(x >= 0, tf.float32)
+    bits = tf.cast(x >= 0, x.dtype)
     bits = (2 * bits) - 1
 
     y = bits
@@ -142,7 +143,7 @@ def Quantize(x):
         #grad_mask_lesser = tf.cast(tf.abs(x) <= 1, tf.float32)
         # Let big values leak a little
         #grad_mask = 0.1 * grad_mask_greater + grad_mask_lesser
-        grad_mask = tf.cast(tf.abs(x) <= 1, tf.float32)
+        grad_mask = tf.cast(tf.abs(x) <= 1, dy.dtype)
         dx = grad_mask * dy
         return [dx]
 
@@ -172,7 +173,7 @@ def HWGQuantize(x, clusters):
         max_cluster = tf.reduce_max(clusters)
         min_cluster = tf.reduce_min(clusters)
         grad_filter = tf.logical_and(min_cluster <= x, x <= max_cluster)
-        dx = dy * tf.cast(grad_filter, tf.float32)
+        dx = dy * tf.cast(grad_filter, dy.dtype)
         return [dx, None]
 
     return y, grad_fn
@@ -184,6 +185,8 @@ def DQ(x, bits, bipolar):
     # Use small adjustment to avoid rounding inconsistency.
     # Adjust for bipolar if needed.
     x = tf.cond(bipolar, lambda: (x + 1.0) / 2.0, lambda: x)
+    # Quantize in the precision of the activations.
+    bits = tf.cast(bits, x.dtype)
 
     epsilon = 1e-5
     # Round to nearest linear bin in [0, 1].
@@ -239,3 +242,46 @@ def DBits2Value(x, bits):
 def DBits2ValueW(x, bits):
     approx = DBits2Value(x, bits)
     return 2.0 * (approx - 0.5)
+
+
+def identity(x, *args, **kwargs):
+    return x
+
+
+# Quantizers by name, used to serialize the quantizers of binary layers.
+_QUANTIZERS = {}
+
+
+def register_quantizer(fn, name=None):
+    """Makes a quantizer serializable by binary layer configs."""
+    _QUANTIZERS[name or fn.__name__] = fn
+    return fn
+
+
+def get_quantizer(identifier):
+    """Returns the quantizer for a name, functions are returned as is."""
+    if identifier is None or callable(identifier):
+        return identifier
+    if identifier not in _QUANTIZERS:
+        raise ValueError('Unknown quantizer %s, register it with '
+                         'register_quantizer.\n\t%s' %
+                         (identifier, '\n\t'.join(sorted(_QUANTIZERS))))
+    return _QUANTIZERS[identifier]
+
+
+def quantizer_name(fn):
+    """Returns the registered name of a quantizer, unwrapping partials."""
+    while isinstance(fn, partial):
+        fn = fn.func
+    for name, quantizer in _QUANTIZERS.items():
+        if quantizer is fn:
+            return name
+    raise ValueError('Quantizer %s can not be serialized, register it with '
+                     'register_quantizer.' % fn)
+
+
+for _quantizer in [
+        identity, XQuantize, Quantize, HWGQuantize, DQuantize, DQuantizeW,
+        FixedPointQuantize
+]:
+    register_quantizer(_quantizer)
@@ -6,7 +6,6 @@ from tensorflow.python.keras import backend as K
 from tensorflow.python.keras import constraints
 from tensorflow.python.keras import initializers
 from tensorflow.python.keras import regularizers
-from tensorflow.python.framework import common_shapes
 from tensorflow.python.keras.engine.base_layer import InputSpec
 from tensorflow.python.keras.engine.base_layer import Layer
 from tensorflow.python.keras.utils import tf_utils
@@ -64,8 +63,8 @@ class Config(object):
                  use_qadd=False):
         if actQ is not None:
             actQ = partial(actQ, bipolar=bipolar)
-        self.actQ = actQ if actQ else lambda x: x
-        self.weightQ = weightQ if weightQ else lambda x: x
+        self.actQ = actQ if actQ else identity
+        self.weightQ = weightQ if weightQ else identity
         self.bits = bits
         self.use_bn = use_bn
         self.use_act = use_act
@@ -83,30 +82,100 @@ class Config(object):
         Config.current = self._old_manager
 
 
+def _scope_value(value, name, default=None):
+    # Explicit layer arguments, as passed by from_config, take precedence
+    # over the current Config scope.
+    if value is not None:
+        return value
+    if Config.current is not None:
+        return getattr(Config.current, name)
+    return default
+
+
+def _activation_quantizer(actQ, bipolar):
+    if actQ is None:
+        if Config.current is not None:
+            return Config.current.actQ
+        actQ = identity
+    return partial(get_quantizer(actQ), bipolar=bipolar)
+
+
+def summary_histogram(name, values):
+    # Histograms are only collected by graph mode drivers such as the
+    # Estimator. In eager and tf.function training they would be dropped
+    # and string summary ops can not be compiled by XLA.
+    if not tf.compat.v1.executing_eagerly_outside_functions():
+        tf.compat.v1.summary.histogram(name, values)
+
+
+def _serialize_bits(bits):
+    return None if bits is None else float(bits)
+
+
 class BinaryConv2D(keras.layers.Conv2D):
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 actQ=None,
+                 weightQ=None,
+                 bits=None,
+                 bipolar=None,
+                 use_act=None,
+                 **kwargs):
         super(BinaryConv2D, self).__init__(*args, **kwargs)
         self.scope = Config.current
-        self.actQ = self.scope.actQ
-        self.weightQ = self.scope.weightQ
-        self.bits = self.scope.bits
-        self.use_act = self.scope.use_act
+        self.bipolar = _scope_value(bipolar, 'bipolar', False)
+        self.actQ = _activation_quantizer(actQ, self.bipolar)
+        self.weightQ = get_quantizer(_scope_value(weightQ, 'weightQ',
+                                                  identity))
+        self.bits = _scope_value(bits, 'bits')
+        self.use_act = _scope_value(use_act, 'use_act', True)
+        self._default_activation = False
         if self.use_act and self.activation is None:
             self.activation = Activation('relu')
-        self.bipolar = self.scope.bipolar
+            self._default_activation = True
+        # Set by gradient accumulation to reuse one quantization of the
+        # kernel for several micro-batches.
+        self.quantized_kernel = None
+
+    def get_config(self):
+        activation = self.activation
+        if self._default_activation:
+            # Recreated from use_act on deserialization.
+            self.activation = None
+        try:
+            config = super(BinaryConv2D, self).get_config()
+        finally:
+            self.activation = activation
+        config.update({
+            'actQ': quantizer_name(self.actQ),
+            'weightQ': quantizer_name(self.weightQ),
+            'bits': _serialize_bits(self.bits),
+            'bipolar': self.bipolar,
+            'use_act': self.use_act,
+        })
+        return config
+
+    def quantize_kernel(self):
+        # The latent kernel is quantized in the compute dtype under a mixed
+        # precision policy, also when called outside of `call`.
+        kernel = tf.cast(tf.convert_to_tensor(self.kernel), self._compute_dtype)
+        return self.weightQ(kernel)
 
     def call(self, inputs):
         with tf.name_scope("actQ"):
-            tf.compat.v1.summary.histogram('prebinary_activations', inputs)
+            summary_histogram('prebinary_activations', inputs)
             if self.bits is not None:
                 inputs = self.actQ(inputs, float(self.bits))
             else:
                 inputs = self.actQ(inputs)
-            tf.compat.v1.summary.histogram('binary_activations', inputs)
+            summary_histogram('binary_activations', inputs)
         with tf.name_scope("weightQ"):
-            kernel = self.weightQ(self.kernel)
-            tf.compat.v1.summary.histogram('weights', self.kernel)
-            tf.compat.v1.summary.histogram('binary_weights', kernel)
+            if self.quantized_kernel is not None:
+                kernel = self.quantized_kernel
+            else:
+                kernel = self.quantize_kernel()
+            summary_histogram('weights', self.kernel)
+            summary_histogram('binary_weights', kernel)
 
         # If bipolar quantization is used, pad with -1 instead of 0.
         if self.bipolar:
@@ -133,35 +202,76 @@ class BinaryConv2D(keras.layers.Conv2D):
 
 
 class BinaryDense(keras.layers.Dense):
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 actQ=None,
+                 weightQ=None,
+                 bits=None,
+                 bipolar=None,
+                 use_act=None,
+                 **kwargs):
         super(BinaryDense, self).__init__(*args, **kwargs)
         self.scope = Config.current
-        self.actQ = self.scope.actQ
-        self.weightQ = self.scope.weightQ
-        self.bits = self.scope.bits
-        self.use_act = self.scope.use_act
+        self.bipolar = _scope_value(bipolar, 'bipolar', False)
+        self.actQ = _activation_quantizer(actQ, self.bipolar)
+        self.weightQ = get_quantizer(_scope_value(weightQ, 'weightQ',
+                                                  identity))
+        self.bits = _scope_value(bits, 'bits')
+        self.use_act = _scope_value(use_act, 'use_act', True)
+        self._default_activation = False
         if self.use_act and self.activation is None:
             self.activation = Activation('relu')
+            self._default_activation = True
+        # Set by gradient accumulation to reuse one quantization of the
+        # kernel for several micro-batches.
+        self.quantized_kernel = None
+
+    def get_config(self):
+        activation = self.activation
+        if self._default_activation:
+            # Recreated from use_act on deserialization.
+            self.activation = None
+        try:
+            config = super(BinaryDense, self).get_config()
+        finally:
+            self.activation = activation
+        config.update({
+            'actQ': quantizer_name(self.actQ),
+            'weightQ': quantizer_name(self.weightQ),
+            'bits': _serialize_bits(self.bits),
+            'bipolar': self.bipolar,
+            'use_act': self.use_act,
+        })
+        return config
+
+    def quantize_kernel(self):
+        # The latent kernel is quantized in the compute dtype under a mixed
+        # precision policy, also when called outside of `call`.
+        kernel = tf.cast(tf.convert_to_tensor(self.kernel), self._compute_dtype)
+        return self.weightQ(kernel)
 
     def call(self, inputs):
         inputs = tf.convert_to_tensor(inputs, dtype=self.dtype)
         with tf.name_scope("actQ"):
-            tf.compat.v1.summary.histogram('prebinary_activations', inputs)
+            summary_histogram('prebinary_activations', inputs)
             if self.bits is not None:
                 inputs = self.actQ(inputs, float(self.bits))
             else:
                 inputs = self.actQ(inputs)
-            tf.compat.v1.summary.histogram('binary_activations', inputs)
+            summary_histogram('binary_activations', inputs)
         with tf.name_scope("weightQ"):
-            kernel = self.weightQ(self.kernel)
-            tf.compat.v1.summary.histogram('weights', self.kernel)
-            tf.compat.v1.summary.histogram('binary_weights', kernel)
-        rank = common_shapes.rank(inputs)
+            if self.quantized_kernel is not None:
+                kernel = self.quantized_kernel
+            else:
+                kernel = self.quantize_kernel()
+            summary_histogram('weights', self.kernel)
+            summary_histogram('binary_weights', kernel)
+        rank = len(inputs.shape)
         if rank > 2:
             # Broadcasting is required for the inputs.
             outputs = tf.tensordot(inputs, kernel, [[rank - 1], [0]])
             # Reshape the output back to the original ndim of the input.
-            if not context.executing_eagerly():
+            if not tf.executing_eagerly():
                 shape = inputs.get_shape().as_list()
                 output_shape = shape[:-1] + [self.units]
                 outputs.set_shape(output_shape)
@@ -178,27 +288,40 @@ class BinaryDense(keras.layers.Dense):
 
 
 class Scalu(keras.layers.Layer):
-    def __init__(self, scale=0.001):
-        super(Scalu, self).__init__()
+    def __init__(self, scale=0.001, **kwargs):
+        super(Scalu, self).__init__(**kwargs)
+        self.initial_scale = scale
         self.scale = scale
 
     def build(self, input_shape):
         self.scale = self.add_variable(
             'scale',
             shape=[1],
-            initializer=tf.keras.initializers.Constant(value=self.scale))
+            initializer=tf.keras.initializers.Constant(
+                value=self.initial_scale))
+
+    def get_config(self):
+        config = super(Scalu, self).get_config()
+        config['scale'] = self.initial_scale
+        return config
 
     def call(self, input):
         return input * self.scale
 
 
 class QAdd(keras.layers.Layer):
-    def __init__(self):
-        super(QAdd, self).__init__()
+    def __init__(self,
+                 actQ=None,
+                 bits=None,
+                 bipolar=None,
+                 use_qadd=None,
+                 **kwargs):
+        super(QAdd, self).__init__(**kwargs)
         self.scope = Config.current
-        self.bits = self.scope.bits
-        self.act = self.scope.actQ
-        self.use_q = self.scope.use_qadd
+        self.bipolar = _scope_value(bipolar, 'bipolar', False)
+        self.bits = _scope_value(bits, 'bits')
+        self.act = _activation_quantizer(actQ, self.bipolar)
+        self.use_q = _scope_value(use_qadd, 'use_qadd', False)
 
     def build(self, input_shape):
         self.scale = self.add_variable('scale', shape=[1], initializer='ones')
@@ -216,18 +339,36 @@ class QAdd(keras.layers.Layer):
             output = x + y
         return output
 
+    def get_config(self):
+        config = super(QAdd, self).get_config()
+        config.update({
+            'actQ': quantizer_name(self.act),
+            'bits': _serialize_bits(self.bits),
+            'bipolar': self.bipolar,
+            'use_qadd': self.use_q,
+        })
+        return config
+
 
 class EnterInteger(keras.layers.Layer):
-    def __init__(self, scale):
-        super(EnterInteger, self).__init__()
+    def __init__(self, scale, bits=None, **kwargs):
+        super(EnterInteger, self).__init__(**kwargs)
         self.scale = scale
         self.scope = Config.current
-        self.bits = self.scope.bits
-        self.quantize = self.scope.bits != None
+        self.bits = _scope_value(bits, 'bits')
+        self.quantize = self.bits != None
 
     def call(self, inputs):
         return self.scale * inputs
 
+    def get_config(self):
+        config = super(EnterInteger, self).get_config()
+        config.update({
+            'scale': self.scale,
+            'bits': _serialize_bits(self.bits)
+        })
+        return config
+
 class ExitInteger(keras.layers.Layer):
     def call(self, inputs):
         return inputs
@@ -243,7 +384,7 @@ class SpecialBatchNormalization(keras.layers.BatchNormalization):
 
 class ResidualConnect(Layer):
     def __init__(self, *args, **kwargs):
-        super(ResidualConnect, self).__init__()
+        super(ResidualConnect, self).__init__(**kwargs)
 
     def call(self, inputs):
         return tf.concat(inputs, axis=-1)
@@ -351,22 +492,35 @@ class ShiftNormalization(Layer):
                  renorm_momentum=0.99,
                  trainable=True,
                  name=None,
+                 bits=None,
+                 shiftnorm_scale=None,
+                 binary_dense=None,
                  **kwargs):
         super(ShiftNormalization, self).__init__(
             name=name, trainable=trainable, **kwargs)
         self.scope = Config.current
-        self.bits = self.scope.bits
+        self.bits = _scope_value(bits, 'bits')
+        if isinstance(previous_layer, str):
+            # Deserialized models reference the previous layer by name, it
+            # is looked up among the layers feeding this one when called.
+            self.previous_layer_name = previous_layer
+            previous_layer = None
+        else:
+            self.previous_layer_name = (previous_layer.name
+                                        if previous_layer is not None else
+                                        None)
         self.previous_layer = previous_layer
+        self._binary_dense = binary_dense
         if isinstance(axis, list):
             self.axis = axis[:]
         else:
             self.axis = axis
-        self.binary_dense = isinstance(previous_layer, BinaryDense)
         self.momentum = momentum
         self.epsilon = epsilon
         self.center = center
         self.scale = scale
-        self.extra_scale = self.scope.shiftnorm_scale
+        self.extra_scale = _scope_value(shiftnorm_scale, 'shiftnorm_scale',
+                                        1.0)
         self.beta_initializer = initializers.get(beta_initializer)
         self.gamma_initializer = initializers.get(gamma_initializer)
         self.moving_mean_initializer = initializers.get(
@@ -391,6 +545,45 @@ class ShiftNormalization(Layer):
             self.renorm_clipping = renorm_clipping
             self.renorm_momentum = renorm_momentum
 
+    def _find_previous_layer(self, inputs):
+        # Walks the layers of the owning model upstream of the inputs.
+        if self.previous_layer_name is None:
+            raise ValueError(
+                '%s has no previous layer, pass the layer whose kernel it '
+                'normalizes or its name.' % self.name)
+        pending = [
+            t for t in tf.nest.flatten(inputs)
+            if hasattr(t, '_keras_history')
+        ]
+        seen = set()
+        while pending:
+            layer, node_index, _ = pending.pop()._keras_history
+            if layer.name == self.previous_layer_name:
+                return layer
+            if (id(layer), node_index) in seen:
+                continue
+            seen.add((id(layer), node_index))
+            node = layer._inbound_nodes[node_index]
+            pending.extend(
+                t for t in tf.nest.flatten(node.input_tensors)
+                if hasattr(t, '_keras_history'))
+        raise ValueError('Previous layer %s of %s is not an input of it.' %
+                         (self.previous_layer_name, self.name))
+
+    def __call__(self, inputs, *args, **kwargs):
+        if self.previous_layer is None:
+            self.previous_layer = self._find_previous_layer(inputs)
+        return super(ShiftNormalization, self).__call__(
+            inputs, *args, **kwargs)
+
+    @property
+    def binary_dense(self):
+        # Serialized with the config, so deserialized layers can be built
+        # before their previous layer is resolved.
+        if self._binary_dense is not None:
+            return self._binary_dense
+        return isinstance(self.previous_layer, BinaryDense)
+
     def build(self, input_shape):
         input_shape = tf.TensorShape(input_shape)
         if not input_shape.ndims:
@@ -446,6 +639,7 @@ class ShiftNormalization(Layer):
                 name='gamma',
                 shape=param_shape,
                 dtype=param_dtype,
+                experimental_autocast=False,
                 initializer=self.gamma_initializer,
                 regularizer=self.gamma_regularizer,
                 constraint=self.gamma_constraint,
@@ -458,6 +652,7 @@ class ShiftNormalization(Layer):
                 name='beta',
                 shape=param_shape,
                 dtype=param_dtype,
+                experimental_autocast=False,
                 initializer=self.beta_initializer,
                 regularizer=self.beta_regularizer,
                 constraint=self.beta_constraint,
@@ -476,6 +671,7 @@ class ShiftNormalization(Layer):
                 name='moving_mean',
                 shape=param_shape,
                 dtype=param_dtype,
+                experimental_autocast=False,
                 initializer=self.moving_mean_initializer,
                 synchronization=tf.VariableSynchronization.ON_READ,
                 trainable=False,
@@ -485,6 +681,7 @@ class ShiftNormalization(Layer):
                 name='moving_variance',
                 shape=param_shape,
                 dtype=param_dtype,
+                experimental_autocast=False,
                 initializer=self.moving_variance_initializer,
                 synchronization=tf.VariableSynchronization.ON_READ,
                 trainable=False,
@@ -503,6 +700,7 @@ class ShiftNormalization(Layer):
                         name=name,
                         shape=shape,
                         dtype=param_dtype,
+                        experimental_autocast=False,
                         initializer=tf.zeros_initializer(),
                         synchronization=tf.VariableSynchronization.ON_READ,
                         trainable=False,
@@ -611,7 +809,7 @@ class ShiftNormalization(Layer):
 
     def call(self, inputs, training=None):
         # Extract weights of previous layer to compute proper scale.
-        previous_weights = self.previous_layer.weights[0].value()
+        previous_weights = tf.convert_to_tensor(self.previous_layer.kernel)
         original_training_value = training
         if training is None:
             training = K.learning_phase()
@@ -656,8 +854,12 @@ class ShiftNormalization(Layer):
             # but not a constant. However, this makes the code simpler.
             keep_dims = len(self.axis) > 1
 
+            # Statistics of reduced precision inputs are computed in the
+            # dtype of the moving averages.
             mean, variance = tf.compat.v1.nn.moments(
-                inputs, reduction_axes, keep_dims=keep_dims)
+                tf.cast(inputs, self.moving_mean.dtype),
+                reduction_axes,
+                keep_dims=keep_dims)
 
             # When norming the output of a binary dense layer,
             # need to make sure shape is maintained.
@@ -705,22 +907,26 @@ class ShiftNormalization(Layer):
         else:
             mean, variance = self.moving_mean, self.moving_variance
 
-        mean = tf.cast(mean, inputs.dtype)
-        variance = tf.cast(variance, inputs.dtype)
+        if scale is not None:
+            scale = tf.cast(scale, inputs.dtype)
         if offset is not None:
             offset = tf.cast(offset, inputs.dtype)
         #outputs = nn.batch_normalization(inputs, _broadcast(mean),
         #                                 _broadcast(variance), offset, scale,
         #                                 self.epsilon)
 
+        # Shifts are derived in the dtype of the latent weights and only the
+        # results are cast to the dtype of the activations.
         approximate_std, quantized_means = compute_quantized_shiftnorm(
-            variance,
-            mean,
+            tf.cast(variance, previous_weights.dtype),
+            tf.cast(mean, previous_weights.dtype),
             self.epsilon,
             previous_weights,
             self.extra_scale,
             self.bits,
             rescale=True)
+        approximate_std = tf.cast(approximate_std, inputs.dtype)
+        quantized_means = tf.cast(quantized_means, inputs.dtype)
 
         outputs = inputs - quantized_means
         outputs = outputs * approximate_std
@@ -742,6 +948,14 @@ class ShiftNormalization(Layer):
 
     def get_config(self):
         config = {
+            'previous_layer':
+            self.previous_layer_name,
+            'bits':
+            _serialize_bits(self.bits),
+            'shiftnorm_scale':
+            self.extra_scale,
+            'binary_dense':
+            self.binary_dense,
             'axis':
             self.axis,
             'momentum':
@@ -783,3 +997,28 @@ NormalDense = keras.layers.Dense
 NormalConv2D = keras.layers.Conv2D
 NormalMaxPool2D = keras.layers.MaxPool2D
 NormalBatchNormalization = keras.layers.BatchNormalization
+
+
+def Conv2DBatchNorm(*args, **kwargs):
+    """Full precision convolution followed by batch normalization.
+
+    Used as the first layer of binary networks, which sees real valued
+    images. Returns a layer list to be run with `riptide.utils.sequential`.
+    """
+    axis = 1 if kwargs.get('data_format') == 'channels_first' else -1
+    return [NormalConv2D(*args, **kwargs), NormalBatchNormalization(axis=axis)]
+
+# Pass as `custom_objects` to `tf.keras.models.load_model` or
+# `tf.keras.models.model_from_config` to restore models of binary layers.
+CUSTOM_OBJECTS = {
+    'BinaryConv2D': BinaryConv2D,
+    'BinaryDense': BinaryDense,
+    'Scalu': Scalu,
+    'QAdd': QAdd,
+    'EnterInteger': EnterInteger,
+    'ExitInteger': ExitInteger,
+    'SpecialBatchNormalization': SpecialBatchNormalization,
+    'ResidualConnect': ResidualConnect,
+    'UnfusedBatchNorm': UnfusedBatchNorm,
+    'ShiftNormalization': ShiftNormalization,
+}
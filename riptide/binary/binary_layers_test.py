@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import tensorflow as tf
+from tensorflow.core.protobuf import trackable_object_graph_pb2
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_funcs import DQuantize, XQuantize
+
+
+def _model():
+    with nn.Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=2.0,
+            use_act=False,
+            use_bn=False):
+        inputs = tf.keras.Input(shape=(8, 8, 4))
+        x = nn.EnterInteger(1.0)(inputs)
+        conv = nn.BinaryConv2D(
+            8, 3, padding='same', use_bias=False, name='conv')
+        x = nn.BatchNormalization(conv, name='norm')(conv(x))
+        x = tf.keras.layers.GlobalAveragePooling2D()(x)
+        dense = nn.BinaryDense(4, use_bias=False, name='dense')
+        x = nn.BatchNormalization(dense, name='dense_norm')(dense(x))
+        return tf.keras.Model(inputs, x)
+
+
+class BinaryLayersTest(tf.test.TestCase):
+    def setUp(self):
+        self.images = np.random.uniform(size=[2, 8, 8, 4]).astype(np.float32)
+
+    def test_config_round_trip(self):
+        model = _model()
+        # Deserialization must not depend on the Config scope.
+        restored = tf.keras.Model.from_config(
+            model.get_config(), custom_objects=nn.CUSTOM_OBJECTS)
+        restored.set_weights(model.get_weights())
+        layer = restored.layers[2]
+        self.assertIs(layer.weightQ, XQuantize)
+        self.assertEqual(layer.bits, 2.0)
+        self.assertIs(restored.layers[3].previous_layer, layer)
+
+        self.assertAllClose(
+            model(self.images, training=False),
+            restored(self.images, training=False))
+
+    def test_previous_layer_of_owning_model(self):
+        # Both models use the same layer names, each must bind to its own.
+        first = _model()
+        second = _model()
+        config = first.get_config()
+        restored = [
+            tf.keras.Model.from_config(
+                config, custom_objects=nn.CUSTOM_OBJECTS) for _ in range(2)
+        ]
+        for model in [first, second] + restored:
+            norm = model.get_layer('norm')
+            self.assertIs(norm.previous_layer, model.get_layer('conv'))
+            dense_norm = model.get_layer('dense_norm')
+            self.assertIs(dense_norm.previous_layer, model.get_layer('dense'))
+            self.assertTrue(dense_norm.binary_dense)
+
+    def test_unknown_previous_layer(self):
+        norm = nn.ShiftNormalization('missing', bits=2.0)
+        with self.assertRaises(ValueError):
+            norm(tf.keras.Input(shape=(4, )))
+
+    def test_no_previous_layer(self):
+        norm = nn.ShiftNormalization(None, bits=2.0)
+        self.assertIsNone(norm.previous_layer_name)
+        with self.assertRaisesRegex(ValueError, 'no previous layer'):
+            norm(tf.keras.Input(shape=(4, )))
+
+    def test_checkpoint_keys(self):
+        model = _model()
+        path = tf.train.Checkpoint(model=model).save(
+            os.path.join(self.get_temp_dir(), 'ckpt'))
+        graph = trackable_object_graph_pb2.TrackableObjectGraph()
+        graph.ParseFromString(
+            tf.train.load_checkpoint(path).get_tensor(
+                '_CHECKPOINTABLE_OBJECT_GRAPH'))
+        names = set(
+            child.local_name for node in graph.nodes
+            for child in node.children)
+        self.assertIn('previous_layer', names)
+        self.assertNotIn('_previous_layer', names)
+
+    def test_saved_model_round_trip(self):
+        model = _model()
+        expected = model(self.images, training=False)
+        path = os.path.join(self.get_temp_dir(), 'saved_model')
+        model.save(path, save_format='tf')
+
+        loaded = tf.saved_model.load(path)
+        self.assertAllClose(expected, loaded(self.images, training=False))
+
+        restored = tf.keras.models.load_model(
+            path, custom_objects=nn.CUSTOM_OBJECTS)
+        self.assertIs(
+            restored.get_layer('norm').previous_layer,
+            restored.get_layer('conv'))
+        self.assertAllClose(expected, restored(self.images, training=False))
+
+
+if __name__ == '__main__':
+    tf.test.main()
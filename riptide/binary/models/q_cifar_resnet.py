@@ -14,7 +14,7 @@ def _conv3x3(channels, stride, normal=False):
             padding="same",
             use_bias=False)
     else:
-        return nn.Conv2D(
+        return nn.BinaryConv2D(
             channels,
             kernel_size=3,
             strides=stride,
@@ -54,7 +54,7 @@ class CIFARBasicBlockV1(tf.keras.Model):
         self.body.append(_conv3x3(channels, 1))
         if self.downsample is not None:
             self.downsample.append(
-                nn.Conv2D(
+                nn.BinaryConv2D(
                     channels, kernel_size=1, strides=stride, use_bias=False))
         self.add = nn.QAdd()
 
@@ -105,7 +105,7 @@ class CIFARBasicBlockV2(tf.keras.Model):
         self.body.append(_conv3x3(channels, 1))
         if self.downsample is not None:
             self.downsample.append(
-                nn.Conv2D(
+                nn.BinaryConv2D(
                     channels, kernel_size=1, strides=stride, use_bias=False))
         self.add = nn.QAdd()
 
@@ -162,7 +162,7 @@ class CIFARResNetV1(tf.keras.Model):
             self.features.append(nn.GlobalAveragePooling2D())
 
             self.output_layer = []
-            self.output_layer.append(nn.Dense(classes, use_bias=False))
+            self.output_layer.append(nn.BinaryDense(classes, use_bias=False))
             self.output_layer.append(nn.Scalu())
 
     def _make_layer(self,
@@ -227,7 +227,7 @@ class CIFARResNetV2(tf.keras.Model):
         self.features.append(nn.Flatten())
 
         self.output_layer = []
-        self.output_layer.append(nn.Dense(classes, use_bias=False))
+        self.output_layer.append(nn.BinaryDense(classes, use_bias=False))
         self.output_layer.append(nn.Scalu())
 
     def _make_layer(self,
@@ -22,9 +22,11 @@ class BasicBlockV1b(tf.keras.Model):
                  norm_layer=None,
                  norm_kwargs={},
                  data_format='channels_last',
+                 recompute=False,
                  **kwargs):
         super(BasicBlockV1b, self).__init__()
-        self.conv1 = nn.Conv2D(
+        self.recompute = recompute
+        self.conv1 = nn.BinaryConv2D(
             filters=planes,
             kernel_size=3,
             strides=strides,
@@ -32,7 +34,7 @@ class BasicBlockV1b(tf.keras.Model):
             dilation_rate=dilation,
             use_bias=False,
             data_format=data_format)
-        self.conv2 = nn.Conv2D(
+        self.conv2 = nn.BinaryConv2D(
             filters=planes,
             kernel_size=3,
             strides=1,
@@ -44,6 +46,12 @@ class BasicBlockV1b(tf.keras.Model):
         self.strides = strides
 
     def call(self, x):
+        # Variables are created on the first call, which is never recomputed.
+        if self.recompute and self.built:
+            return tf.recompute_grad(self._forward)(x)
+        return self._forward(x)
+
+    def _forward(self, x):
         residual = x
 
         out = forward(x, self.conv1)
@@ -74,14 +82,16 @@ class BottleneckV1b(tf.keras.Model):
                  norm_kwargs={},
                  last_gamma=False,
                  data_format='channels_last',
+                 recompute=False,
                  **kwargs):
         super(BottleneckV1b, self).__init__()
-        self.conv1 = nn.Conv2D(
+        self.recompute = recompute
+        self.conv1 = nn.BinaryConv2D(
             filters=planes,
             kernel_size=1,
             use_bias=False,
             data_format=data_format)
-        self.conv2 = nn.Conv2D(
+        self.conv2 = nn.BinaryConv2D(
             filters=planes,
             kernel_size=3,
             strides=strides,
@@ -89,7 +99,7 @@ class BottleneckV1b(tf.keras.Model):
             dilation_rate=dilation,
             use_bias=False,
             data_format=data_format)
-        self.conv3 = nn.Conv2D(
+        self.conv3 = nn.BinaryConv2D(
             filters=planes * 4,
             kernel_size=1,
             use_bias=False,
@@ -99,6 +109,12 @@ class BottleneckV1b(tf.keras.Model):
         self.strides = strides
 
     def call(self, x):
+        # Variables are created on the first call, which is never recomputed.
+        if self.recompute and self.built:
+            return tf.recompute_grad(self._forward)(x)
+        return self._forward(x)
+
+    def _forward(self, x):
         residual = x
 
         out = forward(x, self.conv1)
@@ -141,6 +157,12 @@ class ResNetV1b(tf.keras.Model):
         Whether to use average pooling for projection skip connection between stages/downsample.
     final_drop : float, default 0.0
         Dropout ratio before the final classification layer.
+    recompute : bool, default False
+        Whether to rematerialize the activations of every residual block
+        during backpropagation instead of keeping them alive, trading about
+        one extra forward pass for a much smaller activation footprint.
+        Normalization layers run twice per step in training mode, so their
+        moving statistics are updated twice.
 
 
     Reference:
@@ -166,11 +188,13 @@ class ResNetV1b(tf.keras.Model):
                  avg_down=False,
                  final_drop=0.0,
                  name_prefix='',
+                 recompute=False,
                  **kwargs):
         self.inplanes = stem_width * 2 if deep_stem else 64
         self.data_format = data_format
         super(ResNetV1b, self).__init__(name=name_prefix)
         self.norm_kwargs = norm_kwargs
+        self.recompute = recompute
         with tf.name_scope(self.name):
             if not deep_stem:
                 self.conv1 = nn.Conv2DBatchNorm(
@@ -191,7 +215,7 @@ class ResNetV1b(tf.keras.Model):
                         use_bias=False,
                         data_format=data_format))
                 self.conv1.append(
-                    nn.Conv2D(
+                    nn.BinaryConv2D(
                         filters=stem_width,
                         kernel_size=3,
                         strides=1,
@@ -199,7 +223,7 @@ class ResNetV1b(tf.keras.Model):
                         use_bias=False,
                         data_format=data_format))
                 self.conv1.append(
-                    nn.Conv2D(
+                    nn.BinaryConv2D(
                         filters=stem_width * 2,
                         kernel_size=3,
                         strides=1,
@@ -278,9 +302,9 @@ class ResNetV1b(tf.keras.Model):
             self.flat = nn.Flatten()
             self.drop = None
             if final_drop > 0.0:
-                self.drop = nn.Dropout(final_drop)
+                self.drop = tf.keras.layers.Dropout(final_drop)
             self.fc = []
-            self.fc.append(nn.Dense(units=classes, use_bias=False))
+            self.fc.append(nn.BinaryDense(units=classes, use_bias=False))
             self.fc.append(nn.Scalu())
 
     def _make_layer(self,
@@ -300,20 +324,20 @@ class ResNetV1b(tf.keras.Model):
             if avg_down:
                 if dilation == 1:
                     downsample.append(
-                        nn.AveragePooling2D(
+                        tf.keras.layers.AveragePooling2D(
                             pool_size=strides,
                             strides=strides,
                             padding='same',
                             data_format=data_format))
                 else:
                     downsample.append(
-                        nn.AveragePooling2D(
+                        tf.keras.layers.AveragePooling2D(
                             pool_size=1,
                             strides=1,
                             padding='same',
                             data_format=data_format))
                 downsample.append(
-                    nn.Conv2D(
+                    nn.BinaryConv2D(
                         filters=planes * block.expansion,
                         kernel_size=1,
                         strides=1,
@@ -321,7 +345,7 @@ class ResNetV1b(tf.keras.Model):
                         data_format=data_format))
             else:
                 downsample.append(
-                    nn.Conv2D(
+                    nn.BinaryConv2D(
                         filters=planes * block.expansion,
                         kernel_size=1,
                         strides=strides,
@@ -340,7 +364,8 @@ class ResNetV1b(tf.keras.Model):
                     norm_layer=norm_layer,
                     norm_kwargs=self.norm_kwargs,
                     last_gamma=last_gamma,
-                    data_format=data_format))
+                    data_format=data_format,
+                    recompute=self.recompute))
         elif dilation == 4:
             layers.append(
                 block(
@@ -352,7 +377,8 @@ class ResNetV1b(tf.keras.Model):
                     norm_layer=norm_layer,
                     norm_kwargs=self.norm_kwargs,
                     last_gamma=last_gamma,
-                    data_format=data_format))
+                    data_format=data_format,
+                    recompute=self.recompute))
         else:
             raise RuntimeError("=> unknown dilation size: {}".format(dilation))
 
@@ -366,7 +392,8 @@ class ResNetV1b(tf.keras.Model):
                     norm_layer=norm_layer,
                     norm_kwargs=self.norm_kwargs,
                     last_gamma=last_gamma,
-                    data_format=data_format))
+                    data_format=data_format,
+                    recompute=self.recompute))
 
         return layers
 
@@ -0,0 +1,55 @@
+from unittest import mock
+import numpy as np
+import tensorflow as tf
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_funcs import DQuantize, XQuantize
+from riptide.get_models import get_model
+
+
+def _build(recompute):
+    with nn.Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=2.0,
+            use_act=False,
+            use_bn=False,
+            use_maxpool=True):
+        return get_model('q_resnet50', recompute=recompute)
+
+
+class ResNetV1bTest(tf.test.TestCase):
+    def setUp(self):
+        self.images = np.random.uniform(size=[2, 64, 64, 3]).astype(
+            np.float32)
+        self.labels = np.array([1, 3])
+
+    def _gradients(self, model):
+        with tf.GradientTape() as tape:
+            logits = model(self.images, training=True)
+            loss = tf.reduce_mean(
+                tf.keras.losses.sparse_categorical_crossentropy(
+                    self.labels, logits, from_logits=True))
+        return loss, tape.gradient(loss, model.trainable_variables)
+
+    def test_recompute_gradients(self):
+        model = _build(recompute=False)
+        model(self.images[:1])
+        recomputed = _build(recompute=True)
+        recomputed(self.images[:1])
+        recomputed.set_weights(model.get_weights())
+
+        loss, grads = self._gradients(model)
+        with mock.patch.object(
+                tf, 'recompute_grad', wraps=tf.recompute_grad) as wrapped:
+            recomputed_loss, recomputed_grads = self._gradients(recomputed)
+        # One call per residual block.
+        self.assertEqual(wrapped.call_count, 16)
+        self.assertAllClose(loss, recomputed_loss)
+        self.assertEqual(len(grads), len(recomputed_grads))
+        for grad, recomputed_grad in zip(grads, recomputed_grads):
+            self.assertIsNotNone(recomputed_grad)
+            self.assertAllClose(grad, recomputed_grad)
+
+
+if __name__ == '__main__':
+    tf.test.main()
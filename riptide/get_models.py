@@ -1,38 +1,116 @@
-from .models import cifar_resnet
-from .models import resnetv1b as resnet
-from .models import vgg11, vggnet, resnet18, alexnet, alexnet_normal, vggnet_normal, squeezenet, squeezenet_normal, squeezenet_batchnorm
-from .binary.models import q_cifar_resnet
-from .binary.models import q_resnetv1b as q_resnet
-
-
-def get_model(name, **kwargs):
-    models = {
-        'alexnet': alexnet.alexnet,
-        'alexnet_normal': alexnet_normal.alexnet,
-        'q_resnet18': resnet18.resnet18,
-        'q_resnet34': q_resnet.resnet34_v1b,
-        'q_resnet50': q_resnet.resnet50_v1b,
-        'q_resnet101': q_resnet.resnet101_v1b,
-        'q_resnet152': q_resnet.resnet152_v1b,
-        'resnet18': resnet18.resnet18,
-        'resnet34': resnet.resnet34_v1b,
-        'resnet50': resnet.resnet50_v1b,
-        'resnet101': resnet.resnet101_v1b,
-        'resnet152': resnet.resnet152_v1b,
-        'cifarnet20': cifar_resnet.cifar_resnet20_v1,
-        'q_cifarnet20': q_cifar_resnet.cifar_resnet20_v1,
-        'vgg11': vgg11.vgg11,
-        'q_vgg11': vgg11.vgg11,
-        'vggnet': vggnet.vggnet,
-        'q_vggnet': vggnet.vggnet,
-        'vggnet_normal': vggnet_normal.vggnet,
-        'squeezenet': squeezenet.SqueezeNet,
-        'squeezenet_normal': squeezenet_normal.SqueezeNet,
-        'squeezenet_batchnorm': squeezenet_batchnorm.SqueezeNet,
-    }
+import importlib
+
+# Model name to (module, attribute) of its constructor. Modules are only
+# imported when a model is requested so importing this file stays cheap.
+_MODELS = {
+    'alexnet': ('riptide.models.alexnet', 'alexnet'),
+    'alexnet_normal': ('riptide.models.alexnet_normal', 'alexnet'),
+    'q_resnet18': ('riptide.models.resnet18', 'resnet18'),
+    'q_resnet34': ('riptide.binary.models.q_resnetv1b', 'resnet34_v1b'),
+    'q_resnet50': ('riptide.binary.models.q_resnetv1b', 'resnet50_v1b'),
+    'q_resnet101': ('riptide.binary.models.q_resnetv1b', 'resnet101_v1b'),
+    'q_resnet152': ('riptide.binary.models.q_resnetv1b', 'resnet152_v1b'),
+    'resnet18': ('riptide.models.resnet18', 'resnet18'),
+    'resnet34': ('riptide.models.resnetv1b', 'resnet34_v1b'),
+    'resnet50': ('riptide.models.resnetv1b', 'resnet50_v1b'),
+    'resnet101': ('riptide.models.resnetv1b', 'resnet101_v1b'),
+    'resnet152': ('riptide.models.resnetv1b', 'resnet152_v1b'),
+    'cifarnet20': ('riptide.models.cifar_resnet', 'cifar_resnet20_v1'),
+    'q_cifarnet20': ('riptide.binary.models.q_cifar_resnet',
+                     'cifar_resnet20_v1'),
+    'vgg11': ('riptide.models.vgg11', 'vgg11'),
+    'q_vgg11': ('riptide.models.vgg11', 'vgg11'),
+    'vggnet': ('riptide.models.vggnet', 'vggnet'),
+    'q_vggnet': ('riptide.models.vggnet', 'vggnet'),
+    'vggnet_normal': ('riptide.models.vggnet_normal', 'vggnet'),
+    'squeezenet': ('riptide.models.squeezenet', 'SqueezeNet'),
+    'squeezenet_normal': ('riptide.models.squeezenet_normal', 'SqueezeNet'),
+    'squeezenet_batchnorm': ('riptide.models.squeezenet_batchnorm',
+                             'SqueezeNet'),
+}
+
+# Packages can add models by declaring entry points in this group, for
+# example `my_net = my_package.models:MyNet`.
+ENTRY_POINT_GROUP = 'riptide.models'
+_entry_points_loaded = False
+
+
+def register_model(name, target):
+    """Adds a model to the registry.
+
+    Parameters
+    ----------
+    name : str
+        Name passed to `get_model`, case insensitive.
+    target : str or callable
+        Either a model constructor or a 'module:attribute' string that is
+        imported the first time the model is requested.
+    """
+    if isinstance(target, str):
+        module, _, attr = target.partition(':')
+        target = (module, attr)
+    _MODELS[name.lower()] = target
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        if ep.name.lower() not in _MODELS:
+            register_model(ep.name, ep.value)
+
+
+def list_models():
+    _load_entry_points()
+    return sorted(_MODELS.keys())
+
+
+def _resolve(name):
+    target = _MODELS[name]
+    if isinstance(target, tuple):
+        module, attr = target
+        target = importlib.import_module(module)
+        for part in attr.split('.'):
+            target = getattr(target, part)
+        _MODELS[name] = target
+    return target
+
+
+def get_model(name, functional=False, input_shape=None, **kwargs):
+    """Builds a model of the zoo by name.
+
+    Parameters
+    ----------
+    name : str
+        Name of the model, see `list_models`.
+    functional : bool
+        If True, the subclassed model is traced into an equivalent Keras
+        functional model with identical weight naming.
+    input_shape : tuple
+        Shape of a single example used to trace functional models. Defaults
+        to 32x32 images for cifar models and 224x224 images otherwise.
+    """
     name = name.lower()
-    if name not in models:
+    if name not in _MODELS:
+        _load_entry_points()
+    if name not in _MODELS:
         raise ValueError("%s Not in supported models.\n\t%s" %
-                         (name, '\n\t'.join(sorted(models.keys()))))
-    net = models[name](**kwargs)
+                         (name, '\n\t'.join(list_models())))
+    net = _resolve(name)(**kwargs)
+    if functional:
+        from .utils.functional import build_functional
+        if input_shape is None:
+            input_shape = (32, 32, 3) if 'cifar' in name else (224, 224, 3)
+        net = build_functional(net, input_shape)
     return net
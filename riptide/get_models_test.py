@@ -0,0 +1,30 @@
+import sys
+import subprocess
+from unittest import mock
+import tensorflow as tf
+from riptide import get_models
+
+
+class GetModelsTest(tf.test.TestCase):
+    def test_import_is_lazy(self):
+        code = ('import sys; import riptide.get_models; '
+                'print("tensorflow" in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+    def test_register_model(self):
+        # Patch the registry so the dummy entry doesn't leak into other tests.
+        with mock.patch.dict(get_models._MODELS):
+            get_models.register_model('dummy_net', 'collections:OrderedDict')
+            self.assertIn('dummy_net', get_models.list_models())
+            self.assertEqual(
+                get_models.get_model('Dummy_Net', a=1), {'a': 1})
+        self.assertNotIn('dummy_net', get_models.list_models())
+
+    def test_unknown_model(self):
+        with self.assertRaises(ValueError):
+            get_models.get_model('not_a_model')
+
+
+if __name__ == '__main__':
+    tf.test.main()
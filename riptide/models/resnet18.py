@@ -27,7 +27,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block1_bn1 = nn.BatchNormalization()
+        self.block1_bn1 = nn.BatchNormalization(self.block1_conv1)
         self.block1_conv2 = nn.BinaryConv2D(
             filters=64,
             kernel_size=3,
@@ -35,7 +35,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block1_bn2 = nn.BatchNormalization()
+        self.block1_bn2 = nn.BatchNormalization(self.block1_conv2)
         self.block1_res = nn.ResidualConnect()
 
         # BasicBlock 2
@@ -46,7 +46,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block2_bn1 = nn.BatchNormalization()
+        self.block2_bn1 = nn.BatchNormalization(self.block2_conv1)
         self.block2_conv2 = nn.BinaryConv2D(
             filters=64,
             kernel_size=3,
@@ -54,7 +54,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block2_bn2 = nn.BatchNormalization()
+        self.block2_bn2 = nn.BatchNormalization(self.block2_conv2)
         self.block2_res = nn.ResidualConnect()
 
         # BasicBlock 3
@@ -65,7 +65,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block3_bn1 = nn.BatchNormalization()
+        self.block3_bn1 = nn.BatchNormalization(self.block3_conv1)
         self.block3_conv2 = nn.BinaryConv2D(
             filters=128,
             kernel_size=3,
@@ -73,7 +73,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block3_bn2 = nn.BatchNormalization()
+        self.block3_bn2 = nn.BatchNormalization(self.block3_conv2)
         self.block3_down_conv = nn.BinaryConv2D(
             filters=128,
             kernel_size=1,
@@ -81,7 +81,7 @@ class resnet18(tf.keras.Model):
             padding='valid',
             activation=None,
             use_bias=False)
-        self.block3_down_bn = nn.BatchNormalization()
+        self.block3_down_bn = nn.BatchNormalization(self.block3_down_conv)
         self.block3_res = nn.ResidualConnect()
 
         # BasicBlock 4
@@ -92,7 +92,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block4_bn1 = nn.BatchNormalization()
+        self.block4_bn1 = nn.BatchNormalization(self.block4_conv1)
         self.block4_conv2 = nn.BinaryConv2D(
             filters=128,
             kernel_size=3,
@@ -100,7 +100,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block4_bn2 = nn.BatchNormalization()
+        self.block4_bn2 = nn.BatchNormalization(self.block4_conv2)
         self.block4_res = nn.ResidualConnect()
 
         # BasicBlock 5
@@ -111,7 +111,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block5_bn1 = nn.BatchNormalization()
+        self.block5_bn1 = nn.BatchNormalization(self.block5_conv1)
         self.block5_conv2 = nn.BinaryConv2D(
             filters=256,
             kernel_size=3,
@@ -119,7 +119,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block5_bn2 = nn.BatchNormalization()
+        self.block5_bn2 = nn.BatchNormalization(self.block5_conv2)
         self.block5_down_conv = nn.BinaryConv2D(
             filters=256,
             kernel_size=1,
@@ -127,7 +127,7 @@ class resnet18(tf.keras.Model):
             padding='valid',
             activation=None,
             use_bias=False)
-        self.block5_down_bn = nn.BatchNormalization()
+        self.block5_down_bn = nn.BatchNormalization(self.block5_down_conv)
         self.block5_res = nn.ResidualConnect()
 
         # BasicBlock 6
@@ -138,7 +138,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block6_bn1 = nn.BatchNormalization()
+        self.block6_bn1 = nn.BatchNormalization(self.block6_conv1)
         self.block6_conv2 = nn.BinaryConv2D(
             filters=256,
             kernel_size=3,
@@ -146,7 +146,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block6_bn2 = nn.BatchNormalization()
+        self.block6_bn2 = nn.BatchNormalization(self.block6_conv2)
         self.block6_res = nn.ResidualConnect()
 
         # BasicBlock 7
@@ -157,7 +157,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block7_bn1 = nn.BatchNormalization()
+        self.block7_bn1 = nn.BatchNormalization(self.block7_conv1)
         self.block7_conv2 = nn.BinaryConv2D(
             filters=512,
             kernel_size=3,
@@ -165,7 +165,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block7_bn2 = nn.BatchNormalization()
+        self.block7_bn2 = nn.BatchNormalization(self.block7_conv2)
         self.block7_down_conv = nn.BinaryConv2D(
             filters=512,
             kernel_size=1,
@@ -173,7 +173,7 @@ class resnet18(tf.keras.Model):
             padding='valid',
             activation=None,
             use_bias=False)
-        self.block7_down_bn = nn.BatchNormalization()
+        self.block7_down_bn = nn.BatchNormalization(self.block7_down_conv)
         self.block7_res = nn.ResidualConnect()
 
         # BasicBlock 8
@@ -184,7 +184,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block8_bn1 = nn.BatchNormalization()
+        self.block8_bn1 = nn.BatchNormalization(self.block8_conv1)
         self.block8_conv2 = nn.BinaryConv2D(
             filters=512,
             kernel_size=3,
@@ -192,7 +192,7 @@ class resnet18(tf.keras.Model):
             padding='same',
             activation=None,
             use_bias=False)
-        self.block8_bn2 = nn.BatchNormalization()
+        self.block8_bn2 = nn.BatchNormalization(self.block8_conv2)
         self.block8_res = nn.ResidualConnect()
 
         self.avg_pool = nn.GlobalAveragePooling2D()
@@ -210,135 +210,78 @@ class resnet18(tf.keras.Model):
         # Block 1
         residual = x
         x = self.block1_conv1(x)
-        x = self.block1_bn1(
-            x,
-            conv_weights=self.block1_conv1.weights[0].value(),
-            training=training)
+        x = self.block1_bn1(x, training=training)
         x = self.block1_conv2(x)
-        x = self.block1_bn2(
-            x,
-            conv_weights=self.block1_conv2.weights[0].value(),
-            training=training)
+        x = self.block1_bn2(x, training=training)
         next_res = x
         x = self.block1_res([x, residual])
 
         # Block 2
         residual = next_res
         x = self.block2_conv1(x)
-        x = self.block2_bn1(
-            x,
-            conv_weights=self.block2_conv1.weights[0].value(),
-            training=training)
+        x = self.block2_bn1(x, training=training)
         x = self.block2_conv2(x)
-        x = self.block2_bn2(
-            x,
-            conv_weights=self.block2_conv2.weights[0].value(),
-            training=training)
+        x = self.block2_bn2(x, training=training)
         next_res = x
         x = self.block2_res([x, residual])
 
         # Block 3
         residual = next_res
         x = self.block3_conv1(x)
-        x = self.block3_bn1(
-            x,
-            conv_weights=self.block3_conv1.weights[0].value(),
-            training=training)
+        x = self.block3_bn1(x, training=training)
         x = self.block3_conv2(x)
-        x = self.block3_bn2(
-            x,
-            conv_weights=self.block3_conv2.weights[0].value(),
-            training=training)
+        x = self.block3_bn2(x, training=training)
         next_res = x
         residual = self.block3_down_conv(residual)
-        residual = self.block3_down_bn(
-            residual,
-            conv_weights=self.block3_down_conv.weights[0].value(),
-            training=training)
+        residual = self.block3_down_bn(residual, training=training)
         x = self.block3_res([x, residual])
 
         # Block 4
         residual = next_res
         x = self.block4_conv1(x)
-        x = self.block4_bn1(
-            x,
-            conv_weights=self.block4_conv1.weights[0].value(),
-            training=training)
+        x = self.block4_bn1(x, training=training)
         x = self.block4_conv2(x)
-        x = self.block4_bn2(
-            x,
-            conv_weights=self.block4_conv2.weights[0].value(),
-            training=training)
+        x = self.block4_bn2(x, training=training)
         next_res = x
         x = self.block4_res([x, residual])
 
         # Block 5
         residual = next_res
         x = self.block5_conv1(x)
-        x = self.block5_bn1(
-            x,
-            conv_weights=self.block5_conv1.weights[0].value(),
-            training=training)
+        x = self.block5_bn1(x, training=training)
         x = self.block5_conv2(x)
-        x = self.block5_bn2(
-            x,
-            conv_weights=self.block5_conv2.weights[0].value(),
-            training=training)
+        x = self.block5_bn2(x, training=training)
         next_res = x
         residual = self.block5_down_conv(residual)
-        residual = self.block5_down_bn(
-            residual,
-            conv_weights=self.block5_down_conv.weights[0].value(),
-            training=training)
+        residual = self.block5_down_bn(residual, training=training)
         x = self.block5_res([x, residual])
 
         # Block 6
         residual = next_res
         x = self.block6_conv1(x)
-        x = self.block6_bn1(
-            x,
-            conv_weights=self.block6_conv1.weights[0].value(),
-            training=training)
+        x = self.block6_bn1(x, training=training)
         x = self.block6_conv2(x)
-        x = self.block6_bn2(
-            x,
-            conv_weights=self.block6_conv2.weights[0].value(),
-            training=training)
+        x = self.block6_bn2(x, training=training)
         next_res = x
         x = self.block6_res([x, residual])
 
         # Block 7
         residual = next_res
         x = self.block7_conv1(x)
-        x = self.block7_bn1(
-            x,
-            conv_weights=self.block7_conv1.weights[0].value(),
-            training=training)
+        x = self.block7_bn1(x, training=training)
         x = self.block7_conv2(x)
-        x = self.block7_bn2(
-            x,
-            conv_weights=self.block7_conv2.weights[0].value(),
-            training=training)
+        x = self.block7_bn2(x, training=training)
         next_res = x
         residual = self.block7_down_conv(residual)
-        residual = self.block7_down_bn(
-            residual,
-            conv_weights=self.block7_down_conv.weights[0].value(),
-            training=training)
+        residual = self.block7_down_bn(residual, training=training)
         x = self.block7_res([x, residual])
 
         # Block 8
         residual = next_res
         x = self.block8_conv1(x)
-        x = self.block8_bn1(
-            x,
-            conv_weights=self.block8_conv1.weights[0].value(),
-            training=training)
+        x = self.block8_bn1(x, training=training)
         x = self.block8_conv2(x)
-        x = self.block8_bn2(
-            x,
-            conv_weights=self.block8_conv2.weights[0].value(),
-            training=training)
+        x = self.block8_bn2(x, training=training)
         x = self.block8_res([x, residual])
 
         # Output layers
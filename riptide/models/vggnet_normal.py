@@ -1,6 +1,7 @@
 import os
 import tensorflow as tf
 import tensorflow.keras.layers as nn
+from riptide.binary.binary_layers import summary_histogram
 
 class vggnet(tf.keras.Model):
     def __init__(self, classes=1000):
@@ -187,7 +188,7 @@ class vggnet(tf.keras.Model):
         x = self.dense3(x)
         layers.append(x)
         x = self.softmax(x)
-        tf.compat.v1.summary.histogram('output', x)
+        summary_histogram('output', x)
 
         if debug:
             return layers
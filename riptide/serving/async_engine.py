@@ -0,0 +1,168 @@
+"""asyncio front end for riptide inference."""
+import asyncio
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Model built by each worker process of a process pool engine.
+_process_model = None
+
+
+def _init_process_model(builder, args):
+    global _process_model
+    _process_model = builder(*args)
+
+
+def _process_infer(batch):
+    return _process_model(batch)
+
+
+class AsyncInferenceEngine(object):
+    """Runs blocking inference off the event loop with bounded concurrency.
+
+    Inference calls are offloaded to an executor so the event loop keeps
+    serving network and decode work while a batch runs. At most
+    `max_in_flight` batches are submitted at once, further calls to `infer`
+    wait for a free slot which applies backpressure to the producers.
+
+    Parameters
+    ----------
+    model : callable or InferenceServer
+        Model to run. Any callable mapping a batch to outputs works, such
+        as a `ModelReplica`. An `InferenceServer` is used through its own
+        batching queue instead of the executor.
+    executor : concurrent.futures.Executor
+        Executor to run `model` in, defaults to a thread pool of
+        `max_in_flight` threads.
+    max_in_flight : int
+        Maximum number of batches submitted but not yet finished.
+
+    Example
+    -------
+    async with AsyncInferenceEngine(keras_replica('vggnet', config)) as engine:
+        outputs = await engine.infer(images)
+        async for outputs in engine.stream(image_batches):
+            ...
+    """
+
+    def __init__(self, model, executor=None, max_in_flight=4):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self._owns_executor = executor is None and model is not None
+        if self._owns_executor and not hasattr(model, 'submit'):
+            executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.executor = executor
+        self._semaphore = None
+        self.in_flight = 0
+
+    @classmethod
+    def from_process_pool(cls,
+                          builder,
+                          args=(),
+                          num_processes=2,
+                          max_in_flight=None):
+        """Creates an engine whose model runs in separate processes.
+
+        Parameters
+        ----------
+        builder : callable
+            Picklable function called as `builder(*args)` once in every
+            worker process to construct the model.
+        args : tuple
+            Picklable arguments for `builder`.
+        num_processes : int
+            Number of worker processes.
+        max_in_flight : int
+            Maximum number of in flight batches, defaults to
+            `num_processes`.
+        """
+        # Spawn rather than fork since TensorFlow is not fork safe.
+        executor = ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_process_model,
+            initargs=(builder, args))
+        engine = cls(
+            _process_infer,
+            executor=executor,
+            max_in_flight=max_in_flight or num_processes)
+        engine._owns_executor = True
+        return engine
+
+    def _get_semaphore(self):
+        # Created lazily so it binds to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def infer(self, batch):
+        """Runs the model on batch without blocking the event loop.
+
+        Cancelling the returned coroutine cancels the underlying work if
+        it has not started yet and frees its in flight slot either way.
+        """
+        async with self._get_semaphore():
+            self.in_flight += 1
+            try:
+                if hasattr(self.model, 'submit'):
+                    future = asyncio.wrap_future(self.model.submit(batch))
+                else:
+                    loop = asyncio.get_running_loop()
+                    future = loop.run_in_executor(self.executor, self.model,
+                                                  batch)
+                return await future
+            finally:
+                self.in_flight -= 1
+
+    async def stream(self, batches):
+        """Yields model outputs for each batch in order.
+
+        Up to `max_in_flight` batches are processed concurrently while
+        results are consumed. Closing the iterator early cancels all
+        pending work.
+
+        Parameters
+        ----------
+        batches : iterable or async iterable
+            Source of input batches.
+        """
+        pending = []
+        try:
+            async for batch in _aiter(batches):
+                pending.append(asyncio.ensure_future(self.infer(batch)))
+                # Yield completed results in order before reading further.
+                while pending and (pending[0].done() or
+                                   len(pending) >= self.max_in_flight):
+                    yield await pending.pop(0)
+            while pending:
+                yield await pending.pop(0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        if self._owns_executor and self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def aclose(self):
+        """Closes the engine without blocking the event loop.
+
+        Waiting for running batches happens on a default executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, ptype, value, trace):
+        await self.aclose()
+
+
+async def _aiter(batches):
+    if hasattr(batches, '__aiter__'):
+        async for batch in batches:
+            yield batch
+    else:
+        for batch in batches:
+            yield batch
@@ -0,0 +1,77 @@
+import time
+import asyncio
+import threading
+import numpy as np
+import tensorflow as tf
+from riptide.serving.async_engine import AsyncInferenceEngine
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class AsyncInferenceEngineTest(tf.test.TestCase):
+    def test_stream_keeps_order(self):
+        async def main():
+            async with AsyncInferenceEngine(lambda x: 2 * x) as engine:
+                return [
+                    outputs
+                    async for outputs in engine.stream(
+                        np.full([1, 2], i) for i in range(10))
+                ]
+
+        outputs = _run(main())
+        for i, output in enumerate(outputs):
+            self.assertAllEqual(np.full([1, 2], 2 * i), output)
+
+    def test_max_in_flight(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def model(x):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return x
+
+        async def main():
+            async with AsyncInferenceEngine(
+                    model, max_in_flight=2) as engine:
+                await asyncio.gather(
+                    *[engine.infer(np.ones([1])) for _ in range(8)])
+
+        _run(main())
+        self.assertEqual(running[1], 2)
+
+    def test_exit_does_not_block_event_loop(self):
+        release = threading.Event()
+
+        def model(x):
+            release.wait(5)
+            return x
+
+        async def main():
+            engine = AsyncInferenceEngine(model)
+            task = asyncio.ensure_future(engine.infer(np.ones([1])))
+            await asyncio.sleep(0.01)
+            closing = asyncio.ensure_future(engine.__aexit__(None, None, None))
+            # The loop keeps running while the executor shuts down.
+            await asyncio.sleep(0.05)
+            self.assertFalse(closing.done())
+            release.set()
+            await closing
+            self.assertIsNone(engine.executor)
+            return await task
+
+        self.assertAllEqual(np.ones([1]), _run(main()))
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,342 @@
+"""In-process dynamic batching server for riptide models."""
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+
+
+class InferenceRequest(object):
+    """A single client request waiting to be batched.
+
+    Parameters
+    ----------
+    inputs : ndarray
+        Input batch for this request, the leading axis is the batch axis.
+        Single examples should be submitted with a batch axis of size 1.
+    """
+
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.future = Future()
+        self.enqueue_time = time.perf_counter()
+
+    @property
+    def size(self):
+        return self.inputs.shape[0]
+
+
+class RequestQueue(object):
+    """Thread safe FIFO of pending inference requests.
+
+    Parameters
+    ----------
+    max_size : int
+        Maximum number of pending requests. A value of 0 means unbounded,
+        otherwise `put` blocks once the queue is full.
+    """
+
+    def __init__(self, max_size=0):
+        self._queue = queue.Queue(maxsize=max_size)
+
+    def put(self, request, timeout=None):
+        self._queue.put(request, timeout=timeout)
+
+    def get(self, timeout=None):
+        """Returns the next request or None if timeout expires first."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def drain(self):
+        """Removes and returns every pending request."""
+        requests = []
+        while True:
+            try:
+                requests.append(self._queue.get_nowait())
+            except queue.Empty:
+                return requests
+
+
+class DynamicBatcher(object):
+    """Groups queued requests into batches.
+
+    A batch is emitted as soon as it holds `max_batch_size` examples or
+    `max_latency_ms` has passed since its first request was dequeued,
+    whichever happens first.
+
+    Parameters
+    ----------
+    request_queue : RequestQueue
+        Queue to pull requests from.
+    max_batch_size : int
+        Maximum number of examples in a batch.
+    max_latency_ms : float
+        Maximum time to wait for a batch to fill up.
+    """
+
+    def __init__(self, request_queue, max_batch_size=32, max_latency_ms=5.0):
+        self.request_queue = request_queue
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        # A request that did not fit in the previous batch.
+        self._carry = None
+
+    def next_batch(self, timeout=None):
+        """Returns a list of requests, empty if none arrived before timeout."""
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = self.request_queue.get(timeout=timeout)
+            if first is None:
+                return []
+        batch = [first]
+        batch_size = first.size
+        deadline = time.perf_counter() + self.max_latency
+        while batch_size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            request = self.request_queue.get(timeout=remaining)
+            if request is None:
+                break
+            if batch_size + request.size > self.max_batch_size:
+                self._carry = request
+                break
+            batch.append(request)
+            batch_size += request.size
+        return batch
+
+    def drain(self):
+        """Removes and returns every request not yet in a batch."""
+        requests = [self._carry] if self._carry is not None else []
+        self._carry = None
+        return requests + self.request_queue.drain()
+
+
+class ModelReplica(object):
+    """Wraps a model so it can be driven with numpy batches.
+
+    Parameters
+    ----------
+    model : callable
+        Either a tf.keras.Model such as one returned by `get_model` or any
+        callable mapping a numpy batch to a numpy batch of outputs.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._is_keras = _is_keras_model(model)
+
+    def __call__(self, inputs):
+        if self._is_keras:
+            outputs = self.model(inputs, training=False)
+        else:
+            outputs = self.model(inputs)
+        if hasattr(outputs, 'numpy'):
+            outputs = outputs.numpy()
+        return np.asarray(outputs)
+
+
+def _is_keras_model(model):
+    try:
+        import tensorflow as tf
+    except ImportError:
+        return False
+    return isinstance(model, tf.keras.Model)
+
+
+def keras_replica(name, config, input_shape=(224, 224, 3), **kwargs):
+    """Builds a replica around a riptide model from `get_model`.
+
+    Parameters
+    ----------
+    name : str
+        Model name understood by `get_model`.
+    config : Config
+        Quantization scope the model is constructed under.
+    input_shape : tuple
+        Shape of a single example, used to build the model variables.
+    """
+    import tensorflow as tf
+    from riptide.get_models import get_model
+    with config:
+        model = get_model(name, **kwargs)
+    model(tf.zeros([1] + list(input_shape)), training=False)
+    return ModelReplica(model)
+
+
+class LatencyStats(object):
+    """Thread safe latency and throughput counters.
+
+    Parameters
+    ----------
+    window : int
+        Number of most recent request latencies used for percentiles.
+    """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._latencies = []
+            self._num_examples = 0
+            self._num_batches = 0
+            self._start = time.perf_counter()
+
+    def record_batch(self, latencies, num_examples):
+        with self._lock:
+            self._latencies.extend(latencies)
+            if len(self._latencies) > self.window:
+                self._latencies = self._latencies[-self.window:]
+            self._num_examples += num_examples
+            self._num_batches += 1
+
+    def percentile(self, q):
+        with self._lock:
+            if not self._latencies:
+                return 0.0
+            return float(np.percentile(self._latencies, q))
+
+    def summary(self):
+        """Returns latencies in milliseconds and throughput in examples/sec."""
+        elapsed = time.perf_counter() - self._start
+        with self._lock:
+            num_examples = self._num_examples
+            num_batches = self._num_batches
+        return {
+            'p50_ms': 1000.0 * self.percentile(50),
+            'p99_ms': 1000.0 * self.percentile(99),
+            'examples': num_examples,
+            'batches': num_batches,
+            'mean_batch_size': num_examples / max(num_batches, 1),
+            'throughput': num_examples / max(elapsed, 1e-9),
+        }
+
+
+class InferenceServer(object):
+    """Serves a pool of model replicas behind a dynamic batcher.
+
+    Each replica runs in its own thread and pulls batches from a shared
+    batcher, so a slow batch on one replica does not block the others.
+
+    Parameters
+    ----------
+    replicas : list of callable
+        Models to serve, usually `ModelReplica` instances. All replicas
+        must produce identical results for identical inputs.
+    max_batch_size : int
+        Maximum number of examples run in a single model call.
+    max_latency_ms : float
+        Maximum time a request waits for its batch to fill up.
+    max_queue_size : int
+        Maximum number of pending requests, 0 for unbounded.
+
+    Example
+    -------
+    server = InferenceServer([keras_replica('vggnet', config)])
+    with server:
+        outputs = server.infer(images)
+    """
+
+    def __init__(self,
+                 replicas,
+                 max_batch_size=32,
+                 max_latency_ms=5.0,
+                 max_queue_size=0):
+        if not replicas:
+            raise ValueError('InferenceServer requires at least one replica.')
+        self.replicas = replicas
+        self.request_queue = RequestQueue(max_queue_size)
+        self.batcher = DynamicBatcher(self.request_queue, max_batch_size,
+                                      max_latency_ms)
+        self.stats = LatencyStats()
+        # Batches are formed under a lock so replicas never split one.
+        self._batch_lock = threading.Lock()
+        # Stopping and queueing are exclusive so no request is left behind.
+        self._submit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self.stats.reset()
+        for i, replica in enumerate(self.replicas):
+            thread = threading.Thread(
+                target=self._worker,
+                args=(replica, ),
+                name='riptide-replica-%d' % i,
+                daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stops the replicas and fails every request still pending."""
+        with self._submit_lock:
+            self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        error = RuntimeError('InferenceServer stopped before the request ran.')
+        for request in self.batcher.drain():
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(error)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, ptype, value, trace):
+        self.stop()
+
+    def submit(self, inputs):
+        """Queues a batch of inputs and returns a Future of its outputs.
+
+        Raises a RuntimeError once the server is stopped.
+        """
+        request = InferenceRequest(np.asarray(inputs))
+        if request.size > self.batcher.max_batch_size:
+            raise ValueError('Request of size %d exceeds max_batch_size %d.' %
+                             (request.size, self.batcher.max_batch_size))
+        with self._submit_lock:
+            if self._stop.is_set():
+                raise RuntimeError('InferenceServer is stopped.')
+            self.request_queue.put(request)
+        return request.future
+
+    def infer(self, inputs, timeout=None):
+        """Blocking inference on a batch of inputs."""
+        return self.submit(inputs).result(timeout=timeout)
+
+    def _worker(self, replica):
+        while not self._stop.is_set():
+            with self._batch_lock:
+                batch = self.batcher.next_batch(timeout=0.05)
+            if batch:
+                self._run_batch(replica, batch)
+
+    def _run_batch(self, replica, batch):
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            inputs = np.concatenate([r.inputs for r in batch], axis=0)
+            outputs = replica(inputs)
+        except Exception as e:  # pylint: disable=broad-except
+            for r in batch:
+                r.future.set_exception(e)
+            return
+        done = time.perf_counter()
+        offset = 0
+        for r in batch:
+            r.future.set_result(outputs[offset:offset + r.size])
+            offset += r.size
+        self.stats.record_batch([done - r.enqueue_time for r in batch],
+                                offset)
@@ -0,0 +1,63 @@
+import tensorflow as tf
+import numpy as np
+from riptide.serving.batching import InferenceServer, ModelReplica
+from riptide.serving.load_generator import run_synthetic_load
+
+
+class BatchingTest(tf.test.TestCase):
+    def test_outputs_match_inputs(self):
+        server = InferenceServer(
+            [ModelReplica(lambda x: 2 * x)],
+            max_batch_size=8,
+            max_latency_ms=20.0)
+        with server:
+            futures = [server.submit(np.full([1, 4], i)) for i in range(20)]
+            for i, future in enumerate(futures):
+                self.assertAllEqual(np.full([1, 4], 2 * i), future.result(5))
+        self.assertGreater(server.stats.summary()['mean_batch_size'], 1.0)
+
+    def test_max_batch_size(self):
+        sizes = []
+
+        def model(x):
+            sizes.append(x.shape[0])
+            return x
+
+        server = InferenceServer([ModelReplica(model)],
+                                 max_batch_size=4,
+                                 max_latency_ms=20.0)
+        with server:
+            futures = [server.submit(np.ones([3, 2])) for _ in range(5)]
+            for future in futures:
+                future.result(5)
+        self.assertLessEqual(max(sizes), 4)
+        with self.assertRaises(ValueError):
+            server.submit(np.ones([5, 2]))
+
+    def test_stop_fails_pending_requests(self):
+        server = InferenceServer([ModelReplica(lambda x: x)],
+                                 max_batch_size=4)
+        futures = [server.submit(np.ones([3, 2])) for _ in range(3)]
+        # The second request does not fit and is carried to the next batch.
+        self.assertEqual(len(server.batcher.next_batch(timeout=0)), 1)
+        server.stop()
+        for future in futures[1:]:
+            with self.assertRaises(RuntimeError):
+                future.result(0)
+        self.assertEqual(server.request_queue.qsize(), 0)
+        with self.assertRaises(RuntimeError):
+            server.submit(np.ones([1, 2]))
+
+    def test_synthetic_load(self):
+        replicas = [ModelReplica(lambda x: x.sum(axis=-1)) for _ in range(2)]
+        server = InferenceServer(replicas, max_batch_size=16)
+        with server:
+            summary = run_synthetic_load(
+                server, [8], num_clients=8, requests_per_client=10)
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual(80, summary['examples'])
+        self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,71 @@
+"""Synthetic load generation for local serving benchmarks."""
+import time
+import threading
+import numpy as np
+
+
+def run_synthetic_load(server,
+                       example_shape,
+                       num_clients=16,
+                       requests_per_client=100,
+                       request_size=1,
+                       think_time_ms=0.0,
+                       seed=0):
+    """Drives a running InferenceServer with concurrent synthetic clients.
+
+    Each client thread submits `requests_per_client` random requests of
+    `request_size` examples and waits for each result before sleeping for
+    a random interval of up to `think_time_ms` and sending the next one.
+
+    Parameters
+    ----------
+    server : InferenceServer
+        Started server to send requests to.
+    example_shape : tuple
+        Shape of a single input example.
+    num_clients : int
+        Number of concurrent clients.
+    requests_per_client : int
+        Number of requests each client sends.
+    request_size : int
+        Number of examples in each request.
+    think_time_ms : float
+        Maximum random delay between requests of a single client.
+    seed : int
+        Seed for the input and delay generators.
+
+    Returns
+    -------
+    summary : dict
+        The server latency and throughput summary with the number of
+        failed requests and the wall time of the run.
+    """
+    errors = []
+
+    def client(index):
+        rng = np.random.RandomState(seed + index)
+        for _ in range(requests_per_client):
+            inputs = rng.uniform(
+                -1, 1, size=[request_size] + list(example_shape)).astype(
+                    np.float32)
+            try:
+                server.infer(inputs)
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+            if think_time_ms > 0:
+                time.sleep(rng.uniform(0, think_time_ms) / 1000.0)
+
+    server.stats.reset()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=client, args=(i, ))
+        for i in range(num_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = server.stats.summary()
+    summary['wall_time'] = time.perf_counter() - start
+    summary['errors'] = len(errors)
+    return summary
@@ -0,0 +1,404 @@
+"""Multi-process inference workers sharing weights through shared memory."""
+import os
+import mmap
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+# Offsets of arrays in a shared segment are aligned to cache lines.
+_ALIGNMENT = 64
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedWeights(object):
+    """A set of named numpy arrays stored in one shared memory segment.
+
+    The parent process creates the segment once with `create` and passes
+    `handle` to its workers, which `attach` to it and get read only numpy
+    views of the arrays without copying them.
+
+    Parameters
+    ----------
+    shm : SharedMemory
+        Segment holding the array data.
+    manifest : list of tuple
+        (name, dtype, shape, offset) of every array in the segment.
+    metadata : object
+        Picklable data stored alongside the arrays.
+    owner : bool
+        Whether this process created the segment and should unlink it.
+    """
+
+    def __init__(self, shm, manifest, metadata=None, owner=False):
+        self.shm = shm
+        self.manifest = manifest
+        self.metadata = metadata
+        self.owner = owner
+        self.arrays = {}
+        for name, dtype, shape, offset in manifest:
+            array = np.ndarray(
+                shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            if not owner:
+                array.flags.writeable = False
+            self.arrays[name] = array
+
+    @classmethod
+    def create(cls, arrays, metadata=None):
+        """Copies a dict of arrays into a new shared memory segment."""
+        manifest = []
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            manifest.append((name, array.dtype.str, array.shape, offset))
+            offset = _align(offset + array.nbytes)
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        weights = cls(shm, manifest, metadata, owner=True)
+        for name, array in arrays.items():
+            weights.arrays[name][...] = array
+        return weights
+
+    @classmethod
+    def attach(cls, handle):
+        """Maps the segment described by handle into this process."""
+        shm_name, manifest, metadata = handle
+        # Spawned workers share the resource tracker of their parent, so
+        # the segment is only unlinked by the parent's close.
+        shm = shared_memory.SharedMemory(name=shm_name)
+        return cls(shm, manifest, metadata, owner=False)
+
+    @property
+    def handle(self):
+        """Picklable description of the segment for `attach`."""
+        return (self.shm.name, self.manifest, self.metadata)
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def tensor(self, name):
+        """Returns a tensor reading an array in place.
+
+        The segment can not be closed while such tensors are alive.
+        """
+        _, dtype, shape, offset = next(
+            entry for entry in self.manifest if entry[0] == name)
+        # DLPack can not export read only arrays, TensorFlow does not write
+        # to the tensor anyway.
+        return _as_tensor(
+            np.ndarray(
+                shape,
+                dtype=np.dtype(dtype),
+                buffer=self.shm.buf,
+                offset=offset))
+
+    def close(self):
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def pack_model_weights(model):
+    """Extracts model weights, bitpacking binary kernels.
+
+    Kernels of binary layers quantized with `XQuantize` are stored as packed
+    sign bits and per channel power of two scales, which is 32x smaller than
+    the float latent kernel. Since `XQuantize` returns its input unchanged
+    for an already quantized kernel, the unpacked kernel produces the exact
+    same outputs as the latent one.
+
+    Returns
+    -------
+    arrays : dict
+        Name to array mapping, ready for `SharedWeights.create`.
+    layout : list of tuple
+        (name, kind, shape) of every model weight in `model.weights` order,
+        used by `unpack_model_weights`.
+    """
+    from riptide.binary.binary_funcs import XQuantize
+    from riptide.binary.binary_layers import BinaryConv2D, BinaryDense
+    packed_kernels = set()
+    for layer in model.submodules:
+        if isinstance(layer, (BinaryConv2D, BinaryDense)):
+            if layer.weightQ is XQuantize:
+                packed_kernels.add(id(layer.kernel))
+
+    arrays = {}
+    layout = []
+    for i, weight in enumerate(model.weights):
+        name = '%d/%s' % (i, weight.name)
+        value = weight.numpy()
+        if id(weight) in packed_kernels:
+            scale, bits = _pack_kernel(value)
+            arrays[name + '/scale'] = scale
+            arrays[name + '/bits'] = bits
+            layout.append((name, 'packed', value.shape))
+        else:
+            arrays[name] = value
+            layout.append((name, 'float', value.shape))
+    return arrays, layout
+
+
+def unpack_model_weights(arrays, layout):
+    """Returns weights in `model.weights` order from packed arrays."""
+    weights = []
+    for name, kind, shape in layout:
+        if kind == 'packed':
+            weights.append(
+                _unpack_kernel(arrays[name + '/scale'],
+                               arrays[name + '/bits'], shape))
+        else:
+            weights.append(arrays[name])
+    return weights
+
+
+def _pack_kernel(kernel):
+    # Mirrors get_quantize_bits, one scale per output channel for conv
+    # kernels and a single scale for dense kernels.
+    if kernel.ndim > 2:
+        mean = np.abs(kernel.reshape([-1, kernel.shape[-1]])).mean(axis=0)
+    else:
+        mean = np.abs(kernel).mean(keepdims=True)
+    scale = 2.0**np.round(np.log2(mean))
+    bits = np.packbits(kernel.reshape([-1]) >= 0)
+    return scale.astype(np.float32), bits
+
+
+def _unpack_kernel(scale, bits, shape):
+    size = int(np.prod(shape))
+    signs = np.unpackbits(bits, count=size).astype(np.float32)
+    signs = (2 * signs - 1).reshape(shape)
+    return signs * scale
+
+
+def _unpack_kernel_tensor(scale, bits, shape):
+    # TensorFlow version of _unpack_kernel, bits are stored most significant
+    # first as np.packbits does.
+    import tensorflow as tf
+    size = int(np.prod(shape))
+    shifts = tf.constant([7, 6, 5, 4, 3, 2, 1, 0], tf.uint8)
+    signs = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(bits[:, None], shifts), 1)
+    signs = 2 * tf.cast(tf.reshape(signs, [-1])[:size], tf.float32) - 1
+    return tf.reshape(signs, shape) * scale
+
+
+def _as_tensor(array):
+    # Tensors created through DLPack share the memory of a writable, 64 byte
+    # aligned array. Without DLPack support they are a copy.
+    import tensorflow as tf
+    try:
+        return tf.experimental.dlpack.from_dlpack(array.__dlpack__())
+    except AttributeError:
+        return tf.constant(array)
+
+
+def _lazy_variable_creator(next_creator, **kwargs):
+    # Initializes variables with anonymous zero pages, which take no memory
+    # until written, instead of running their initializer. Private mappings
+    # are page aligned and read as the shared zero page.
+    import tensorflow as tf
+    shape = kwargs.get('shape')
+    if (callable(kwargs.get('initial_value')) and shape is not None
+            and kwargs.get('dtype') is not None
+            and tf.TensorShape(shape).is_fully_defined()):
+        dtype = tf.as_dtype(kwargs['dtype'])
+        count = int(np.prod(shape))
+        pages = mmap.mmap(
+            -1, max(count * dtype.size, 1), flags=mmap.MAP_PRIVATE)
+        kwargs['initial_value'] = _as_tensor(
+            np.frombuffer(pages, dtype.as_numpy_dtype,
+                          count=count).reshape(shape))
+    return next_creator(**kwargs)
+
+
+def _kernel_attributes(model, kernels):
+    # Layers read their kernels through attributes, maps every kernel to the
+    # (layer, attribute) pairs holding it.
+    ids = {id(kernel) for kernel in kernels}
+    attributes = {}
+    for layer in [model] + list(model.submodules):
+        for attr, value in vars(layer).items():
+            if id(value) in ids:
+                attributes.setdefault(id(value), []).append((layer, attr))
+    return attributes
+
+
+def _bind_shared_weights(model, weights, input_shape):
+    """Makes a model built under `_lazy_variable_creator` read its weights
+    from attached shared weights.
+
+    Float weights are aliased to the segment and bitpacked kernels are
+    unpacked from it while a batch runs, so a worker holds no copy of the
+    weights. The model must not be trained afterwards. Returns a function of
+    a numpy batch.
+    """
+    import tensorflow as tf
+    layout = weights.metadata
+    attributes = _kernel_attributes(
+        model, [w for w, (_, kind, _) in zip(model.weights, layout)
+                if kind == 'packed'])
+    packed = []
+    for weight, (name, kind, shape) in zip(model.weights, layout):
+        if kind == 'float':
+            # TensorFlow forwards the buffer of the tensor to the variable
+            # instead of copying it.
+            weight.assign(weights.tensor(name))
+        elif id(weight) in attributes:
+            packed.append((weight, attributes[id(weight)],
+                           weights.tensor(name + '/scale'),
+                           weights.tensor(name + '/bits'), shape))
+        else:
+            weight.assign(unpack_model_weights(weights.arrays,
+                                               [(name, kind, shape)])[0])
+
+    @tf.function(input_signature=[
+        tf.TensorSpec([None] + list(input_shape), tf.float32)
+    ])
+    def function(inputs):
+        # Since `XQuantize` returns unpacked kernels unchanged, outputs match
+        # the latent kernels. Attributes are set directly as Keras would
+        # untrack the replaced variables.
+        for _, owners, scale, bits, shape in packed:
+            kernel = _unpack_kernel_tensor(scale, bits, shape)
+            for layer, attr in owners:
+                object.__setattr__(layer, attr, kernel)
+        try:
+            return model(inputs, training=False)
+        finally:
+            for weight, owners, _, _, _ in packed:
+                for layer, attr in owners:
+                    object.__setattr__(layer, attr, weight)
+
+    function.get_concrete_function()
+
+    def call(batch):
+        return function(np.asarray(batch, np.float32))
+
+    return call
+
+
+def keras_model_builder(weights, name, config_kwargs, input_shape):
+    """Builds a riptide model in a worker from attached shared weights.
+
+    Parameters
+    ----------
+    weights : SharedWeights
+        Attached weights created from `pack_model_weights`.
+    name : str
+        Model name understood by `get_model`.
+    config_kwargs : dict
+        Keyword arguments for the binary layer `Config`. Quantizers are
+        given by their name in `binary_funcs` since custom gradient
+        functions can not be pickled.
+    input_shape : tuple
+        Shape of a single example.
+    """
+    import tensorflow as tf
+    from riptide.get_models import get_model
+    from riptide.binary import binary_funcs
+    from riptide.binary.binary_layers import Config
+    from riptide.serving.batching import ModelReplica
+    config_kwargs = dict(config_kwargs)
+    for key in ('actQ', 'weightQ'):
+        if isinstance(config_kwargs.get(key), str):
+            config_kwargs[key] = getattr(binary_funcs, config_kwargs[key])
+    # Variables are only backed by memory once bound to the shared weights.
+    with tf.variable_creator_scope(_lazy_variable_creator):
+        with Config(**config_kwargs):
+            model = get_model(name)
+        model(tf.zeros([1] + list(input_shape)), training=False)
+    return ModelReplica(_bind_shared_weights(model, weights, input_shape))
+
+
+# Per process state of SharedWeightPool workers.
+_worker_weights = None
+_worker_model = None
+
+
+def _init_worker(builder, args, handle, counter, cpus_per_worker):
+    global _worker_weights, _worker_model
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    if cpus_per_worker and hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        start = (index * cpus_per_worker) % len(cpus)
+        worker_cpus = [
+            cpus[(start + i) % len(cpus)] for i in range(cpus_per_worker)
+        ]
+        os.sched_setaffinity(0, worker_cpus)
+        # Keep intra op parallelism within the pinned cores, this must
+        # happen before the builder runs any TensorFlow op.
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(cpus_per_worker)
+    _worker_weights = SharedWeights.attach(handle)
+    _worker_model = builder(_worker_weights, *args)
+
+
+def _worker_infer(batch):
+    return _worker_model(batch)
+
+
+class SharedWeightPool(object):
+    """Pool of inference processes that share one copy of the weights.
+
+    Parameters
+    ----------
+    builder : callable
+        Picklable function called as `builder(weights, *args)` in every
+        worker with the attached `SharedWeights`, returns the model.
+    weights : SharedWeights
+        Weights created by the parent process.
+    args : tuple
+        Extra picklable arguments for `builder`.
+    num_workers : int
+        Number of worker processes.
+    cpus_per_worker : int
+        If set, pins each worker to its own block of this many CPUs and
+        limits its TensorFlow intra op threads to them.
+
+    Example
+    -------
+    arrays, layout = pack_model_weights(model)
+    weights = SharedWeights.create(arrays, layout)
+    pool = SharedWeightPool(keras_model_builder, weights,
+                            args=('vggnet', config_kwargs, (224, 224, 3)))
+    outputs = pool.submit(images).result()
+    """
+
+    def __init__(self,
+                 builder,
+                 weights,
+                 args=(),
+                 num_workers=2,
+                 cpus_per_worker=None):
+        self.weights = weights
+        self.num_workers = num_workers
+        context = multiprocessing.get_context('spawn')
+        counter = context.Value('i', 0)
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(builder, args, weights.handle, counter,
+                      cpus_per_worker))
+
+    def submit(self, batch):
+        return self.executor.submit(_worker_infer, batch)
+
+    def map(self, batches):
+        return self.executor.map(_worker_infer, batches)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ptype, value, trace):
+        self.close()
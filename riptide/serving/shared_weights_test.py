@@ -0,0 +1,193 @@
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from multiprocessing import shared_memory
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_funcs import DQuantize, XQuantize
+from riptide.get_models import register_model
+from riptide.serving.shared_weights import (
+    SharedWeights, SharedWeightPool, keras_model_builder, pack_model_weights,
+    unpack_model_weights, _bind_shared_weights, _lazy_variable_creator,
+    _pack_kernel, _unpack_kernel)
+
+_CONFIG = dict(
+    actQ=DQuantize, weightQ=XQuantize, bits=2.0, use_act=False, use_bn=False)
+
+
+def _binary_model():
+    with nn.Config(**_CONFIG):
+        return tf.keras.Sequential([
+            tf.keras.layers.InputLayer((16, )),
+            nn.BinaryDense(32),
+            tf.keras.layers.Dense(8),
+            nn.BinaryDense(4),
+        ])
+
+
+def _conv_model():
+    # The shift normalization reads the kernel of the binary convolution.
+    conv = nn.BinaryConv2D(8, 3, padding='same')
+    return tf.keras.Sequential([
+        tf.keras.layers.InputLayer((8, 8, 3)),
+        conv,
+        nn.BatchNormalization(conv),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(4),
+    ])
+
+
+def _dense_model():
+    # 128MB of float weights.
+    return tf.keras.Sequential([tf.keras.layers.InputLayer((2048, ))] +
+                               [tf.keras.layers.Dense(2048) for _ in range(8)])
+
+
+def _private_memory():
+    # Memory mapped only by this process, shared weights are not counted.
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean', 'Private_Dirty')):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def _probe_builder(weights, *args):
+    # Runs in spawned workers, reports the memory taken by building the
+    # model next to its outputs.
+    register_model('shared_dense',
+                   'riptide.serving.shared_weights_test:_dense_model')
+    tf.zeros([1]) + 1
+    before = _private_memory()
+    replica = keras_model_builder(weights, *args)
+
+    def probe(batch):
+        outputs = replica(batch)
+        # Lets the other workers take the next batches.
+        time.sleep(0.2)
+        return os.getpid(), _private_memory() - before, outputs
+
+    return probe
+
+
+def _sum_builder(weights, axis):
+    # Runs in spawned workers, returns a model reading the shared array.
+    table = weights.arrays['table']
+    return lambda batch: (batch * table).sum(axis=axis)
+
+
+class SharedWeightsTest(tf.test.TestCase):
+    def test_packed_conv_kernel_is_quantized_kernel(self):
+        kernel = np.random.normal(size=[3, 3, 4, 8]).astype(np.float32)
+        scale, bits = _pack_kernel(kernel)
+        self.assertEqual(scale.shape, (8, ))
+        self.assertEqual(bits.nbytes, kernel.size // 8)
+        self.assertAllEqual(
+            _unpack_kernel(scale, bits, kernel.shape), XQuantize(kernel))
+
+    def test_packed_weights_give_identical_outputs(self):
+        model = _binary_model()
+        arrays, layout = pack_model_weights(model)
+        self.assertEqual([kind for _, kind, _ in layout].count('packed'), 2)
+        weights = SharedWeights.create(arrays, layout)
+        attached = SharedWeights.attach(weights.handle)
+        try:
+            restored = _binary_model()
+            restored.set_weights(
+                unpack_model_weights(attached.arrays, attached.metadata))
+            images = np.random.normal(size=[4, 16]).astype(np.float32)
+            self.assertAllEqual(
+                model(images, training=False),
+                restored(images, training=False))
+        finally:
+            attached.close()
+            weights.close()
+
+    def test_bound_model_gives_identical_outputs(self):
+        with nn.Config(**_CONFIG):
+            model = _conv_model()
+        rng = np.random.RandomState(0)
+        for weight in model.weights:
+            if 'kernel' not in weight.name:
+                weight.assign(rng.uniform(0.5, 1.5, weight.shape))
+        arrays, layout = pack_model_weights(model)
+        self.assertEqual([kind for _, kind, _ in layout].count('packed'), 1)
+        weights = SharedWeights.create(arrays, layout)
+        attached = SharedWeights.attach(weights.handle)
+        with tf.variable_creator_scope(_lazy_variable_creator):
+            with nn.Config(**_CONFIG):
+                bound = _conv_model()
+        function = _bind_shared_weights(bound, attached, (8, 8, 3))
+        images = np.random.normal(size=[2, 8, 8, 3]).astype(np.float32)
+        outputs = model(images, training=False)
+        self.assertGreater(np.abs(outputs).max(), 0)
+        self.assertAllClose(outputs, function(images))
+        # Float weights are read from the segment in place.
+        dense = layout[-2][0]
+        weights.arrays[dense][...] += 1
+        self.assertNotAllClose(outputs, function(images))
+        weights.arrays[dense][...] -= 1
+        del function, bound
+        weights.close()
+
+    def test_segments_are_unlinked(self):
+        weights = SharedWeights.create({'a': np.arange(10.0)}, metadata=1)
+        name = weights.shm.name
+        attached = SharedWeights.attach(weights.handle)
+        self.assertFalse(attached.arrays['a'].flags.writeable)
+        self.assertAllEqual(attached.arrays['a'], np.arange(10.0))
+        # Detaching a worker leaves the segment to its owner.
+        attached.close()
+        shared_memory.SharedMemory(name=name).close()
+        weights.close()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_pool_workers_read_shared_weights(self):
+        weights = SharedWeights.create({'table': np.arange(4.0)})
+        try:
+            with SharedWeightPool(
+                    _sum_builder, weights, args=(-1, ),
+                    num_workers=1) as pool:
+                outputs = list(pool.map([np.ones([2, 4])] * 3))
+        finally:
+            weights.close()
+        for output in outputs:
+            self.assertAllEqual(output, [6.0, 6.0])
+
+
+    def _worker_memory(self, weights, num_workers):
+        args = ('shared_dense', {}, (2048, ))
+        batch = np.ones([4, 2048], np.float32)
+        memory = {}
+        with SharedWeightPool(
+                _probe_builder, weights, args=args,
+                num_workers=num_workers) as pool:
+            for _ in range(20):
+                for pid, used, outputs in pool.map([batch] * num_workers):
+                    memory[pid] = used
+                if len(memory) == num_workers:
+                    break
+        self.assertEqual(len(memory), num_workers)
+        return outputs, list(memory.values())
+
+    def test_worker_memory_does_not_grow_with_weights(self):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            self.skipTest('Needs /proc/self/smaps_rollup.')
+        model = _dense_model()
+        arrays, layout = pack_model_weights(model)
+        weights = SharedWeights.create(arrays, layout)
+        try:
+            for num_workers in (1, 3):
+                outputs, memory = self._worker_memory(weights, num_workers)
+                # A copy of the weights would take all of nbytes per worker.
+                self.assertLess(max(memory), weights.nbytes / 4)
+        finally:
+            weights.close()
+        self.assertAllClose(
+            model(np.ones([4, 2048], np.float32)), outputs, rtol=1e-5)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,191 @@
+"""Streaming video frame inference with batching across streams."""
+import time
+import queue
+import threading
+import numpy as np
+from collections import namedtuple
+from .batching import InferenceRequest, RequestQueue, DynamicBatcher, LatencyStats
+
+FrameResult = namedtuple('FrameResult', ['stream_id', 'frame_index', 'output'])
+
+# Batching knobs used by each pipeline mode when not given explicitly.
+_MODES = {
+    # Flush small batches quickly to bound the time a frame waits.
+    'latency': {
+        'max_batch_size': 8,
+        'max_latency_ms': 5.0
+    },
+    # Wait for full batches to keep the model busy.
+    'throughput': {
+        'max_batch_size': 64,
+        'max_latency_ms': 200.0
+    },
+}
+
+
+def decode_video(path):
+    """Yields RGB uint8 frames of a video file, requires OpenCV."""
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError('decode_video requires OpenCV, install it with '
+                          '`pip install opencv-python`.')
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError('Could not open video %s.' % path)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def subsample(frames, stride=1):
+    """Yields (frame_index, frame) for every stride-th frame."""
+    for i, frame in enumerate(frames):
+        if i % stride == 0:
+            yield i, frame
+
+
+class FrameRequest(InferenceRequest):
+    def __init__(self, inputs, stream_id, frame_index):
+        super(FrameRequest, self).__init__(inputs)
+        self.stream_id = stream_id
+        self.frame_index = frame_index
+
+
+class VideoPipeline(object):
+    """Runs a model over frames of many video streams.
+
+    Every stream is decoded by its own thread into a shared bounded queue,
+    frames from all streams are batched together by a `DynamicBatcher` and
+    results are yielded as each batch completes. Frames of a single stream
+    are always yielded in increasing frame order. An exception raised while
+    decoding or preprocessing a stream stops the pipeline and is re-raised
+    by the iterator.
+
+    Parameters
+    ----------
+    model : callable
+        Maps a numpy batch of preprocessed frames to a batch of outputs,
+        usually a `ModelReplica`.
+    streams : list
+        Video sources, either paths decoded with `decode_video` or
+        iterables of HWC frames.
+    mode : str
+        'latency' flushes small batches quickly, 'throughput' waits for
+        large batches. Explicit batching arguments override the mode.
+    stride : int
+        Only every stride-th frame of each stream is processed.
+    preprocess : callable
+        Applied to every sampled frame in its decode thread, for example
+        resizing and scaling to the model input.
+    max_batch_size : int
+        Maximum number of frames per model call.
+    max_latency_ms : float
+        Maximum time a frame waits for its batch to fill up.
+    max_queued_frames : int
+        Maximum number of decoded frames waiting for the model, decode
+        threads block once this is reached.
+
+    Example
+    -------
+    pipeline = VideoPipeline(replica, ['cam0.mp4', 'cam1.mp4'], stride=5,
+                             preprocess=resize_frame)
+    for result in pipeline:
+        handle(result.stream_id, result.frame_index, result.output)
+    print(pipeline.stats.summary()['throughput'], 'frames/sec')
+    """
+
+    def __init__(self,
+                 model,
+                 streams,
+                 mode='latency',
+                 stride=1,
+                 preprocess=None,
+                 max_batch_size=None,
+                 max_latency_ms=None,
+                 max_queued_frames=256):
+        if mode not in _MODES:
+            raise ValueError('mode must be one of %s, got %s.' %
+                             (sorted(_MODES.keys()), mode))
+        if max_batch_size is None:
+            max_batch_size = _MODES[mode]['max_batch_size']
+        if max_latency_ms is None:
+            max_latency_ms = _MODES[mode]['max_latency_ms']
+        self.model = model
+        self.streams = streams
+        self.stride = stride
+        self.preprocess = preprocess
+        self.request_queue = RequestQueue(max_queued_frames)
+        self.batcher = DynamicBatcher(self.request_queue, max_batch_size,
+                                      max_latency_ms)
+        self.stats = LatencyStats()
+        self._stop = threading.Event()
+        self._error = None
+
+    def _decode(self, stream_id, stream):
+        try:
+            self._decode_frames(stream_id, stream)
+        except Exception as e:
+            # Only the first failure is kept, the others stop with it.
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def _decode_frames(self, stream_id, stream):
+        frames = decode_video(stream) if isinstance(stream, str) else stream
+        for frame_index, frame in subsample(frames, self.stride):
+            if self._stop.is_set():
+                return
+            if self.preprocess is not None:
+                frame = self.preprocess(frame)
+            request = FrameRequest(
+                np.expand_dims(frame, 0), stream_id, frame_index)
+            # Re-check the stop flag while the queue is full.
+            while not self._stop.is_set():
+                try:
+                    self.request_queue.put(request, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def __iter__(self):
+        self._stop.clear()
+        self._error = None
+        self.stats.reset()
+        decoders = [
+            threading.Thread(
+                target=self._decode, args=(i, stream), daemon=True)
+            for i, stream in enumerate(self.streams)
+        ]
+        for decoder in decoders:
+            decoder.start()
+        try:
+            while True:
+                batch = self.batcher.next_batch(timeout=0.05)
+                if self._error is not None:
+                    raise self._error
+                if not batch:
+                    if not any(d.is_alive() for d in decoders) and \
+                            self.request_queue.qsize() == 0:
+                        break
+                    continue
+                inputs = np.concatenate([r.inputs for r in batch], axis=0)
+                outputs = self.model(inputs)
+                done = time.perf_counter()
+                self.stats.record_batch(
+                    [done - r.enqueue_time for r in batch], len(batch))
+                for r, output in zip(batch, outputs):
+                    yield FrameResult(r.stream_id, r.frame_index, output)
+        finally:
+            self._stop.set()
+            for decoder in decoders:
+                decoder.join()
+
+    @property
+    def frames_per_sec(self):
+        return self.stats.summary()['throughput']
@@ -0,0 +1,55 @@
+import numpy as np
+import tensorflow as tf
+from riptide.serving.video import VideoPipeline, subsample
+
+
+def _frames(stream_id, count):
+    return [np.full([2, 2, 3], 100 * stream_id + i) for i in range(count)]
+
+
+def _failing_stream(count):
+    for frame in _frames(0, count):
+        yield frame
+    raise IOError('Corrupt frame.')
+
+
+class VideoPipelineTest(tf.test.TestCase):
+    def test_subsample(self):
+        self.assertEqual([i for i, _ in subsample(range(10), 3)],
+                         [0, 3, 6, 9])
+
+    def test_frames_of_all_streams_in_order(self):
+        streams = [_frames(i, 20) for i in range(3)]
+        pipeline = VideoPipeline(
+            lambda x: x.mean(axis=(1, 2, 3)),
+            streams,
+            stride=2,
+            max_batch_size=4)
+        results = {}
+        for result in pipeline:
+            results.setdefault(result.stream_id, []).append(result)
+        for stream_id in range(3):
+            indices = [r.frame_index for r in results[stream_id]]
+            self.assertEqual(indices, list(range(0, 20, 2)))
+            self.assertAllEqual([r.output for r in results[stream_id]],
+                                [100 * stream_id + i for i in indices])
+        self.assertEqual(pipeline.stats.summary()['examples'], 30)
+
+    def test_decode_error_is_raised(self):
+        pipeline = VideoPipeline(lambda x: x, [_failing_stream(3)])
+        with self.assertRaisesRegex(IOError, 'Corrupt frame'):
+            list(pipeline)
+
+    def test_preprocess_error_is_raised(self):
+        def preprocess(frame):
+            raise ValueError('Bad frame.')
+
+        pipeline = VideoPipeline(
+            lambda x: x, [_frames(0, 5), _frames(1, 5)],
+            preprocess=preprocess)
+        with self.assertRaisesRegex(ValueError, 'Bad frame'):
+            list(pipeline)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,353 @@
+"""Analytical inference cost of riptide models.
+
+Binary layers are costed the way the bitserial kernels execute them.
+Activations are split into `bits` bit planes and packed along the input
+channels into 64 bit words. Each packed word of a bit plane is combined
+with a word of the packed weights by a logical op followed by a popcount.
+Unipolar activations against bipolar weights need two popcounts per word,
+bipolar activations need one.
+"""
+import time
+import numpy as np
+import tensorflow as tf
+from riptide.utils.recording import record_layers
+
+# Number of bits in a packed word.
+WORD_BITS = 64
+
+
+def _first(structure):
+    return [
+        t for t in tf.nest.flatten(structure)
+        if isinstance(t, (tf.Tensor, tf.Variable))
+    ][0]
+
+
+def _elements(shape):
+    return int(np.prod(shape)) if shape else 0
+
+
+def _own_weights(layer):
+    # Keras tracks layers stored as attributes, so the weights of a
+    # ShiftNormalization include the kernel of its previous layer.
+    nested = set()
+    for module in layer.submodules:
+        if isinstance(module, tf.keras.layers.Layer):
+            nested.update(id(w) for w in module.weights)
+    return [w for w in layer.weights if id(w) not in nested]
+
+
+class LayerCost(object):
+    """Operation and memory counts of a single layer.
+
+    Attributes
+    ----------
+    popcounts : int
+        Word popcounts of binary layers.
+    macs : int
+        Float multiply accumulates.
+    elementwise_ops : int
+        Other per element work such as normalization, pooling, activations
+        and the shift and add of bit plane results.
+    pack_ops : int
+        Activation bits packed into words before a binary layer.
+    activation_bytes : int
+        Size of the output activations in their float representation.
+    packed_bytes : int
+        Size of the packed input activations of a binary layer.
+    weight_bytes : int
+        Size of the weights, packed for binary layers.
+    """
+
+    def __init__(self,
+                 popcounts=0,
+                 macs=0,
+                 elementwise_ops=0,
+                 pack_ops=0,
+                 activation_bytes=0,
+                 packed_bytes=0,
+                 weight_bytes=0):
+        self.popcounts = int(popcounts)
+        self.macs = int(macs)
+        self.elementwise_ops = int(elementwise_ops)
+        self.pack_ops = int(pack_ops)
+        self.activation_bytes = int(activation_bytes)
+        self.packed_bytes = int(packed_bytes)
+        self.weight_bytes = int(weight_bytes)
+
+    @property
+    def bitops(self):
+        # The logical op and the popcount each process a full word.
+        return 2 * WORD_BITS * self.popcounts
+
+    def to_dict(self):
+        return {
+            'popcounts': self.popcounts,
+            'bitops': self.bitops,
+            'macs': self.macs,
+            'elementwise_ops': self.elementwise_ops,
+            'pack_ops': self.pack_ops,
+            'activation_bytes': self.activation_bytes,
+            'packed_bytes': self.packed_bytes,
+            'weight_bytes': self.weight_bytes,
+        }
+
+
+def _binary_settings(layer):
+    from riptide.binary.binary_layers import Config
+    scope = getattr(layer, 'scope', None) or Config.current
+    bits = getattr(layer, 'bits', None)
+    bipolar = getattr(layer, 'bipolar', None)
+    if bits is None and scope is not None:
+        bits = scope.bits
+    if bipolar is None:
+        bipolar = scope.bipolar if scope is not None else False
+    return int(round(float(bits))) if bits else 1, bool(bipolar)
+
+
+def layer_cost(layer, inputs, outputs):
+    """Computes the `LayerCost` of a layer from its inputs and outputs.
+
+    Quantization settings are read from the layer, which captured them from
+    the `Config` it was constructed in. Normalization and pooling costs
+    follow from which layers the config produced, for example
+    `ShiftNormalization` instead of batch normalization when `use_bn` is
+    False, or no pooling layer at all without `use_maxpool`.
+    """
+    from riptide.binary import binary_layers as nn
+    input_shape = _first(inputs).shape.as_list()
+    output = _first(outputs)
+    output_shape = output.shape.as_list()
+    out_elements = _elements(output_shape)
+    activation_bytes = out_elements * output.dtype.size
+    float_weight_bytes = sum(
+        w.shape.num_elements() * w.dtype.size for w in _own_weights(layer))
+
+    if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)):
+        in_channels = input_shape[-1] // getattr(layer, 'groups', 1)
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            kh, kw = layer.kernel_size
+            out_channels = layer.filters
+        else:
+            kh, kw = 1, 1
+            out_channels = layer.units
+        # Every output element is one dot product.
+        reduction = kh * kw * in_channels
+        if isinstance(layer, (nn.BinaryConv2D, nn.BinaryDense)):
+            bits, bipolar = _binary_settings(layer)
+            words = kh * kw * int(np.ceil(in_channels / float(WORD_BITS)))
+            popcounts = out_elements * bits * words * (1 if bipolar else 2)
+            input_rows = _elements(input_shape) // input_shape[-1]
+            return LayerCost(
+                popcounts=popcounts,
+                elementwise_ops=out_elements * bits,
+                pack_ops=_elements(input_shape) * bits,
+                activation_bytes=activation_bytes,
+                packed_bytes=input_rows * int(
+                    np.ceil(input_shape[-1] / float(WORD_BITS))) * bits *
+                WORD_BITS // 8,
+                weight_bytes=out_channels * words * WORD_BITS // 8)
+        return LayerCost(
+            macs=out_elements * reduction,
+            activation_bytes=activation_bytes,
+            weight_bytes=float_weight_bytes)
+
+    if isinstance(layer, nn.ShiftNormalization):
+        # Scale and shift are powers of two, a single shift per element.
+        elementwise_ops = out_elements
+    elif isinstance(layer, tf.keras.layers.BatchNormalization):
+        elementwise_ops = 2 * out_elements
+    elif isinstance(layer, (tf.keras.layers.MaxPool2D,
+                            tf.keras.layers.AveragePooling2D)):
+        elementwise_ops = out_elements * _elements(layer.pool_size)
+    elif isinstance(layer, (tf.keras.layers.GlobalAveragePooling2D,
+                            tf.keras.layers.GlobalMaxPool2D)):
+        elementwise_ops = _elements(input_shape)
+    else:
+        elementwise_ops = out_elements
+    return LayerCost(
+        elementwise_ops=elementwise_ops,
+        activation_bytes=activation_bytes,
+        weight_bytes=float_weight_bytes)
+
+
+class Throughput(object):
+    """Per operation throughput constants of a target, in ops per second.
+
+    The defaults are rough figures for a single modern CPU core, use
+    `calibrate` to measure the current host.
+    """
+
+    def __init__(self,
+                 popcounts_per_sec=2e9,
+                 macs_per_sec=8e9,
+                 elementwise_per_sec=2e9,
+                 pack_per_sec=1e9,
+                 bytes_per_sec=1e10):
+        self.popcounts_per_sec = popcounts_per_sec
+        self.macs_per_sec = macs_per_sec
+        self.elementwise_per_sec = elementwise_per_sec
+        self.pack_per_sec = pack_per_sec
+        self.bytes_per_sec = bytes_per_sec
+
+    def latency(self, cost):
+        """Projects the latency in seconds of a `LayerCost`.
+
+        Compute of the different units is assumed to be serialized, and a
+        layer can not run faster than it can stream its memory.
+        """
+        compute = (cost.popcounts / self.popcounts_per_sec +
+                   cost.macs / self.macs_per_sec +
+                   cost.elementwise_ops / self.elementwise_per_sec +
+                   cost.pack_ops / self.pack_per_sec)
+        memory = (cost.activation_bytes + cost.packed_bytes +
+                  cost.weight_bytes) / self.bytes_per_sec
+        return max(compute, memory)
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def calibrate(cls, size=1 << 20, repeats=10):
+        """Measures throughput constants with TensorFlow microbenchmarks."""
+        words = tf.random.uniform([size], maxval=2**31 - 1, dtype=tf.int64)
+        other = tf.random.uniform([size], maxval=2**31 - 1, dtype=tf.int64)
+        values = tf.random.normal([size])
+        side = 256
+        lhs = tf.random.normal([side, side])
+        rhs = tf.random.normal([side, side])
+        shifts = tf.range(WORD_BITS, dtype=tf.int64)
+
+        @tf.function
+        def popcount():
+            return tf.reduce_sum(
+                tf.cast(
+                    tf.raw_ops.PopulationCount(
+                        x=tf.bitwise.bitwise_xor(words, other)), tf.int32))
+
+        @tf.function
+        def matmul():
+            return tf.matmul(lhs, rhs)
+
+        @tf.function
+        def elementwise():
+            return values * 0.5 + 1.0
+
+        @tf.function
+        def pack():
+            bits = tf.cast(tf.reshape(values > 0, [-1, WORD_BITS]), tf.int64)
+            return tf.reduce_sum(tf.bitwise.left_shift(bits, shifts), axis=1)
+
+        @tf.function
+        def stream():
+            return tf.reduce_sum(values)
+
+        def rate(fn, ops):
+            fn().numpy()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fn().numpy()
+            return ops * repeats / (time.perf_counter() - start)
+
+        return cls(
+            popcounts_per_sec=rate(popcount, size),
+            macs_per_sec=rate(matmul, side**3),
+            elementwise_per_sec=rate(elementwise, size),
+            pack_per_sec=rate(pack, size),
+            bytes_per_sec=rate(stream, size * 4))
+
+
+class CostReport(object):
+    """Per layer costs of a model and their projected latencies.
+
+    Parameters
+    ----------
+    layers : list of (str, str, LayerCost)
+        Name, layer type and cost of every layer in execution order.
+    throughput : Throughput
+        Constants used to project latency.
+    """
+
+    def __init__(self, layers, throughput):
+        self.layers = layers
+        self.throughput = throughput
+
+    def latency(self):
+        return sum(self.throughput.latency(c) for _, _, c in self.layers)
+
+    def rank(self):
+        """Returns the layers sorted by decreasing projected latency."""
+        return sorted(
+            self.layers,
+            key=lambda l: self.throughput.latency(l[2]),
+            reverse=True)
+
+    def to_dict(self):
+        layers = []
+        for name, kind, cost in self.layers:
+            entry = {'name': name, 'type': kind}
+            entry.update(cost.to_dict())
+            entry['latency_ms'] = 1000.0 * self.throughput.latency(cost)
+            layers.append(entry)
+        return {
+            'throughput': self.throughput.to_dict(),
+            'latency_ms': 1000.0 * self.latency(),
+            'layers': layers,
+        }
+
+    def table(self, top=None):
+        header = '%-32s %-26s %12s %12s %12s %10s %10s %10s' % (
+            'layer', 'type', 'Mpopcounts', 'MMACs', 'Mother', 'act(KB)',
+            'wgt(KB)', 'proj(ms)')
+        lines = [header, '-' * len(header)]
+        layers = self.rank()[:top] if top else self.layers
+        for name, kind, cost in layers:
+            lines.append('%-32s %-26s %12.2f %12.2f %12.2f %10.1f %10.1f '
+                         '%10.3f' % (name[-32:], kind[:26],
+                                     cost.popcounts / 1e6, cost.macs / 1e6,
+                                     (cost.elementwise_ops + cost.pack_ops) /
+                                     1e6, cost.activation_bytes / 1024.0,
+                                     cost.weight_bytes / 1024.0,
+                                     1000.0 * self.throughput.latency(cost)))
+        lines.append('-' * len(header))
+        lines.append('%-32s %-26s %12s %12s %12s %10s %10s %10.3f' %
+                     ('total', '', '', '', '', '', '',
+                      1000.0 * self.latency()))
+        return '\n'.join(lines)
+
+
+def analyze_model(model, input_shape, batch_size=1, throughput=None):
+    """Computes the inference cost of every layer of a model.
+
+    The model is run once on zeros to find the shape of every layer, no
+    timing is involved.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Model constructed under the `Config` to analyze.
+    input_shape : tuple
+        Shape of a single example.
+    batch_size : int
+        Batch size to count operations for.
+    throughput : Throughput
+        Constants to project latency with, defaults to `Throughput()`.
+
+    Returns
+    -------
+    CostReport
+
+    Example
+    -------
+    with Config(actQ=DQuantize, weightQ=XQuantize, bits=2.0, use_bn=False):
+        model = get_model('vggnet')
+    report = analyze_model(model, (224, 224, 3),
+                           throughput=Throughput.calibrate())
+    print(report.table(top=10))
+    """
+    inputs = tf.zeros([batch_size] + list(input_shape))
+    layers = []
+    for name, layer, recorder in record_layers(model, inputs):
+        cost = layer_cost(layer, recorder.args[0], recorder.outputs)
+        layers.append((name, type(layer).__name__, cost))
+    return CostReport(layers, throughput or Throughput())
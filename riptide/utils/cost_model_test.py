@@ -0,0 +1,56 @@
+import tensorflow as tf
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_funcs import DQuantize, XQuantize
+from riptide.utils.cost_model import layer_cost
+
+
+def _cost(layer, shape):
+    inputs = tf.ones(shape)
+    return layer_cost(layer, inputs, layer(inputs))
+
+
+class LayerCostTest(tf.test.TestCase):
+    def test_conv(self):
+        layer = tf.keras.layers.Conv2D(8, 3, padding='same')
+        cost = _cost(layer, [1, 8, 8, 4])
+        # 8 * 8 * 8 outputs, each a 3 * 3 * 4 dot product.
+        self.assertEqual(cost.macs, 512 * 36)
+        self.assertEqual(cost.popcounts, 0)
+        self.assertEqual(cost.activation_bytes, 512 * 4)
+        self.assertEqual(cost.weight_bytes, (3 * 3 * 4 * 8 + 8) * 4)
+
+    def test_dense(self):
+        layer = tf.keras.layers.Dense(10, use_bias=False)
+        cost = _cost(layer, [2, 16])
+        self.assertEqual(cost.macs, 2 * 10 * 16)
+        self.assertEqual(cost.weight_bytes, 16 * 10 * 4)
+
+    def test_binary_conv(self):
+        with nn.Config(
+                actQ=DQuantize, weightQ=XQuantize, bits=2.0, use_act=False):
+            layer = nn.BinaryConv2D(8, 3, padding='same', use_bias=False)
+        cost = _cost(layer, [1, 4, 4, 64])
+        # 4 * 4 * 8 outputs, 3 * 3 packed words per output for each of the
+        # 2 bit planes, unipolar activations need two popcounts per word.
+        self.assertEqual(cost.macs, 0)
+        self.assertEqual(cost.popcounts, 128 * 2 * 9 * 2)
+        self.assertEqual(cost.bitops, 2 * 64 * cost.popcounts)
+        self.assertEqual(cost.pack_ops, 4 * 4 * 64 * 2)
+        self.assertEqual(cost.packed_bytes, 4 * 4 * 2 * 8)
+        self.assertEqual(cost.weight_bytes, 8 * 9 * 8)
+
+    def test_bipolar_binary_conv(self):
+        with nn.Config(
+                actQ=DQuantize,
+                weightQ=XQuantize,
+                bits=1.0,
+                use_act=False,
+                bipolar=True):
+            layer = nn.BinaryConv2D(8, 3, padding='same', use_bias=False)
+        cost = _cost(layer, [1, 4, 4, 128])
+        # Two words per kernel position, one popcount per word.
+        self.assertEqual(cost.popcounts, 128 * 1 * 18)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -1,25 +1,37 @@
 import os
+import numpy as np
 import tensorflow as tf
 from functools import partial
 from random import shuffle
+from riptide.utils.manifest import load_manifest
+from riptide.utils.record_index import RecordReader, load_index, record_files
+from riptide.utils.preprocessing.cifarnet_preprocessing import (
+    preprocess_batch)
+from riptide.utils.preprocessing.inception_preprocessing import (
+    augment_batch, decode_and_crop_for_train, decode_and_crop_for_eval,
+    decode_jpeg_at_scale)
 
 
-def _get_shard_dataset(record_path, split='train'):
+def _get_shard_dataset(record_path,
+                       split='train',
+                       num_shards=1,
+                       shard_index=0,
+                       shuffle=True):
     pattern = os.path.join(record_path, split + "*")
-    files = tf.data.Dataset.list_files(pattern)
+    # Files are listed in a fixed order so every worker of a cluster
+    # shards the same list, each worker then shuffles its own files.
+    files = record_files(pattern)
+    if not files:
+        raise ValueError('No records match %s.' % pattern)
+    files = tf.data.Dataset.from_tensor_slices(files)
+    if num_shards > 1:
+        files = files.shard(num_shards, shard_index)
+    if shuffle:
+        files = files.shuffle(buffer_size=1024)
     return files
 
 
-def _decode_jpeg(image_buffer, size, scope=None):
-    with tf.name_scope(
-            values=[image_buffer], name=scope, default_name='decode_jpeg'):
-        image = tf.io.decode_jpeg(image_buffer, channels=3)
-        image = tf.image.resize(image, (size, size))
-        image = tf.image.convert_image_dtype(image, dtype=tf.float32)
-    return image
-
-
-def _decode_imagenet(proto, preprocess):
+def _parse_imagenet(proto):
     feature_map = {
         'image': tf.io.FixedLenFeature([], dtype=tf.string, default_value=''),
         'label': tf.io.FixedLenFeature([1], dtype=tf.int64, default_value=-1),
@@ -28,48 +40,374 @@ def _decode_imagenet(proto, preprocess):
     }
 
     parsed_features = tf.io.parse_single_example(proto, feature_map)
-    features = tf.io.decode_jpeg(parsed_features['image'], channels=3)
-    labels = parsed_features['label']
+    return parsed_features['image'], tf.cast(parsed_features['label'],
+                                             tf.int32)
+
+
+def _decode_imagenet(proto, preprocess, decode_size=None):
+    image_buffer, labels = _parse_imagenet(proto)
+    if decode_size:
+        features = decode_jpeg_at_scale(image_buffer, decode_size)
+    else:
+        features = tf.io.decode_jpeg(image_buffer, channels=3)
 
     if preprocess != None:
         features = preprocess(features)
 
-    return features, tf.cast(labels, tf.int32)
+    return features, labels
+
+
+def _decode_and_crop_imagenet(proto,
+                              image_size,
+                              is_training,
+                              decode_size=None):
+    image_buffer, labels = _parse_imagenet(proto)
+    # Only the pixels of the crop are decoded.
+    if is_training:
+        image = decode_and_crop_for_train(image_buffer, min_size=decode_size)
+    else:
+        image = decode_and_crop_for_eval(image_buffer, min_size=decode_size)
+    image = tf.image.resize(image, [image_size, image_size])
+    # Crops stay uint8 until augmentation, batches are a quarter the size.
+    image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    return image, labels
+
+
+def _augment_batch(images, labels, is_training):
+    # Color distortion and flips of the whole batch with per example
+    # parameters, followed by scaling to [-1, 1] as in inception
+    # preprocessing.
+    return augment_batch(images, is_training), labels
+
+
+def _set_deterministic(options, deterministic):
+    if hasattr(options, 'deterministic'):
+        options.deterministic = deterministic
+    else:
+        options.experimental_deterministic = deterministic
+
+
+def _check_decode_args(preprocess,
+                       image_size,
+                       dct_scaling,
+                       decode_size,
+                       device_augment=False):
+    # Returns the decode size to use, None to decode at full resolution.
+    if image_size is not None and preprocess is not None:
+        raise ValueError('Pass either preprocess or image_size, not both.')
+    if device_augment and image_size is None:
+        raise ValueError('device_augment requires image_size.')
+    if not dct_scaling:
+        return None
+    decode_size = decode_size or image_size
+    if decode_size is None:
+        raise ValueError('dct_scaling requires image_size or decode_size.')
+    return decode_size
+
+
+def _echo(ds, echo_factor, buffer_size):
+    # Every element is repeated echo_factor times, then shuffled locally so
+    # the copies are spread out instead of adjacent.
+    def repeat(*element):
+        # Tuple elements are unpacked into arguments, others are not.
+        element = element[0] if len(element) == 1 else element
+        return tf.data.Dataset.from_tensors(element).repeat(echo_factor)
+
+    ds = ds.flat_map(repeat)
+    return ds.shuffle(buffer_size)
+
+
+def _decode_batches(serialized_ds,
+                    batch_size,
+                    is_training,
+                    preprocess,
+                    image_size,
+                    decode_size,
+                    drop_remainder,
+                    device_augment=False,
+                    echo_factor=1,
+                    echo_level='example',
+                    echo_buffer=None):
+    if image_size is not None:
+        decode_fn = partial(
+            _decode_and_crop_imagenet,
+            image_size=image_size,
+            is_training=is_training,
+            decode_size=decode_size)
+    else:
+        decode_fn = partial(
+            _decode_imagenet, preprocess=preprocess, decode_size=decode_size)
+    imagenet_ds = serialized_ds.map(
+        decode_fn, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    if echo_factor > 1 and echo_level == 'example':
+        imagenet_ds = _echo(imagenet_ds, echo_factor, echo_buffer or
+                            echo_factor * batch_size)
+    imagenet_ds = imagenet_ds.batch(batch_size, drop_remainder=drop_remainder)
+    if image_size is not None and not device_augment:
+        imagenet_ds = imagenet_ds.map(
+            partial(_augment_batch, is_training=is_training),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    if echo_factor > 1 and echo_level == 'batch':
+        imagenet_ds = _echo(imagenet_ds, echo_factor, echo_buffer or
+                            2 * echo_factor)
+    return imagenet_ds.prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
+
+
+def _with_options(imagenet_ds, num_workers, deterministic):
+    # Set up extra threadpool resources
+    options = tf.data.Options()
+    threading = getattr(options, 'threading', None)
+    if threading is None:
+        threading = options.experimental_threading
+    threading.private_threadpool_size = num_workers
+    _set_deterministic(options, deterministic)
+    return imagenet_ds.with_options(options)
 
 
 def imagerecord_dataset(root,
                         batch_size,
                         is_training=True,
                         preprocess=None,
-                        num_workers=4):
+                        num_workers=4,
+                        drop_remainder=False,
+                        num_shards=1,
+                        shard_index=0,
+                        image_size=None,
+                        deterministic=None,
+                        dct_scaling=False,
+                        decode_size=None,
+                        device_augment=False,
+                        echo_factor=1,
+                        echo_level='example',
+                        echo_buffer=None):
+    """Reads ImageNet TFRecords written by `tf_record_writer.py`.
+
+    With `image_size`, images are decoded directly into their random
+    training crop or central evaluation crop and resized. Color distortion,
+    flips and normalization are applied per batch by `augment_batch`. This
+    matches `preprocess_image` with fast_mode while never decoding the
+    discarded pixels. Otherwise whole images are decoded and passed to
+    `preprocess`.
+
+    With `dct_scaling`, libjpeg decodes every image or crop at the largest
+    of 1/2, 1/4 or 1/8 scale that still keeps `decode_size` pixels on its
+    shorter side, which is much cheaper than decoding at full resolution
+    when the result is resized down anyway.
+
+    With `echo_factor`, every example or batch is reused that many times
+    before it is dropped, data echoing as in Choi et al., "Faster Neural
+    Network Training with Data Echoing". When decoding can not keep up
+    with the accelerator, steps then need 1 / `echo_factor` of the input
+    work. Echoing at the 'example' level repeats decoded crops before
+    batching, so every copy is flipped and color distorted anew and lands
+    in a different batch. The 'batch' level repeats finished batches and
+    saves augmentation too.
+
+    Parameters
+    ----------
+    root : str
+        Directory containing train* and val* record files.
+    batch_size : int
+        Number of examples per batch.
+    is_training : bool
+        Read and shuffle the training split, the validation split otherwise.
+    preprocess : callable
+        Applied to every decoded image, can not be combined with
+        `image_size`.
+    num_workers : int
+        Files read in parallel and size of the private threadpool.
+    drop_remainder : bool
+        Drop the last partial batch, keeping the batch dimension static.
+    num_shards : int
+        Number of input pipelines of a distributed job, for example the
+        `num_input_pipelines` of a `tf.distribute.InputContext`. Record
+        files are split between them.
+    shard_index : int
+        Index of this input pipeline.
+    image_size : int
+        Height and width of fused decoded and cropped images.
+    deterministic : bool
+        Whether elements keep their order, trading throughput for
+        reproducibility. Defaults to False for training and True otherwise.
+    dct_scaling : bool
+        Decode JPEGs at a reduced scale, see above.
+    decode_size : int
+        Smallest side of decoded images or crops with `dct_scaling`,
+        defaults to `image_size`. Must be set when using `preprocess`, to
+        the size it resizes to.
+    device_augment : bool
+        Return uint8 batches of crops and leave `augment_batch` to the
+        training step, for example through the `preprocess_fn` of
+        `riptide.utils.training.Trainer`. Requires `image_size`.
+    echo_factor : int
+        Number of times every example or batch is used, see above. Only
+        applies to training.
+    echo_level : str
+        'example' or 'batch', what is echoed.
+    echo_buffer : int
+        Size of the shuffle buffer spreading echoed copies, in elements of
+        `echo_level`. Defaults to `echo_factor * batch_size` examples or
+        `2 * echo_factor` batches.
+    """
+    decode_size = _check_decode_args(preprocess, image_size, dct_scaling,
+                                     decode_size, device_augment)
+    if echo_level not in ('example', 'batch'):
+        raise ValueError(
+            "echo_level must be 'example' or 'batch', got %s." % echo_level)
+    if echo_factor < 1:
+        raise ValueError('echo_factor must be at least 1, got %s.' %
+                         echo_factor)
+    if deterministic is None:
+        deterministic = not is_training
     if is_training:
         split = 'train'
     else:
         split = 'val'
-    shard_ds = _get_shard_dataset(root, split=split)
-    imagenet_ds = shard_ds.apply(
-        tf.data.experimental.parallel_interleave(
-            tf.data.TFRecordDataset, cycle_length=num_workers, sloppy=True))
-    # Prefetch a batch at a time to smooth time taken to load for shuffling and preprocessing.
-    imagenet_ds = imagenet_ds.prefetch(buffer_size=batch_size)
+    shard_ds = _get_shard_dataset(
+        root,
+        split=split,
+        num_shards=num_shards,
+        shard_index=shard_index,
+        shuffle=is_training)
+    imagenet_ds = shard_ds.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=num_workers,
+        num_parallel_calls=tf.data.experimental.AUTOTUNE)
     if is_training:
         imagenet_ds = imagenet_ds.shuffle(buffer_size=10000)
-    decode_fn = partial(_decode_imagenet, preprocess=preprocess)
-    imagenet_ds = imagenet_ds.apply(
-        tf.data.experimental.map_and_batch(
-            map_func=decode_fn, batch_size=batch_size, num_parallel_batches=4))
-    imagenet_ds = imagenet_ds.prefetch(
-        buffer_size=tf.data.experimental.AUTOTUNE)
-    # Set up extra threadpool resources
-    options = tf.data.Options()
-    options.experimental_threading.private_threadpool_size = num_workers
-    imagenet_ds = imagenet_ds.with_options(options)
-    return imagenet_ds
+    imagenet_ds = _decode_batches(
+        imagenet_ds,
+        batch_size,
+        is_training,
+        preprocess,
+        image_size,
+        decode_size,
+        drop_remainder,
+        device_augment,
+        echo_factor=echo_factor if is_training else 1,
+        echo_level=echo_level,
+        echo_buffer=echo_buffer)
+    return _with_options(imagenet_ds, num_workers, deterministic)
+
+
+def indexed_record_dataset(root,
+                           batch_size,
+                           is_training=True,
+                           preprocess=None,
+                           num_workers=4,
+                           drop_remainder=False,
+                           num_shards=1,
+                           shard_index=0,
+                           image_size=None,
+                           dct_scaling=False,
+                           decode_size=None,
+                           seed=0,
+                           start_example=0,
+                           epochs=None,
+                           device_augment=False):
+    """Reads ImageNet TFRecords in a global random order using their index.
+
+    Unlike `imagerecord_dataset`, which shuffles a buffer of streamed
+    records, every training epoch visits all examples of all shards in a
+    fresh permutation. Examples are read individually at the offsets stored
+    by `riptide.utils.record_index`, so memory grows with the index, about
+    20 bytes per example, rather than with a buffer of images.
+
+    The order only depends on `seed`, which makes it possible to resume
+    exactly where a previous run stopped by skipping the examples it
+    consumed with `start_example`.
+
+    Parameters
+    ----------
+    root : str
+        Directory containing train* and val* record files.
+    batch_size : int
+        Number of examples per batch.
+    is_training : bool
+        Read the training split in a random order, the validation split in
+        record order otherwise.
+    num_shards : int
+        Number of input pipelines of a distributed job. Each pipeline reads
+        every `num_shards`-th example of the global order.
+    shard_index : int
+        Index of this input pipeline.
+    seed : int
+        Seed of the permutations, epoch e uses the permutation of
+        (seed, e).
+    start_example : int
+        Position in the global order to start at, counted over all input
+        pipelines and epochs. To resume training pass the number of
+        examples consumed so far, global step times the global batch size.
+    epochs : int
+        Number of epochs to read, counted from the one containing
+        `start_example`. Training repeats indefinitely and evaluation
+        reads once if None.
+
+    The other parameters are as in `imagerecord_dataset`. Elements keep
+    their order so a resumed run reads the same batches.
+    """
+    decode_size = _check_decode_args(preprocess, image_size, dct_scaling,
+                                     decode_size, device_augment)
+    split = 'train' if is_training else 'val'
+    files = record_files(os.path.join(root, split + '*'))
+    if not files:
+        raise ValueError('No %s records in %s.' % (split, root))
+    indices = [load_index(f) for f in files]
+    num_examples = sum(len(index) for index in indices)
+    file_ids = tf.constant(
+        np.concatenate([
+            np.full([len(index)], i, np.int32)
+            for i, index in enumerate(indices)
+        ]))
+    offsets = tf.constant(np.concatenate([index[:, 0] for index in indices]))
+    lengths = tf.constant(np.concatenate([index[:, 1] for index in indices]))
+    reader = RecordReader(files)
+
+    start_epoch, start_offset = divmod(start_example, num_examples)
+    if epochs is None:
+        epochs = np.iinfo(np.int64).max - start_epoch if is_training else 1
+
+    def epoch_order(epoch):
+        if is_training:
+            keys = tf.random.stateless_uniform(
+                [num_examples], seed=tf.stack([tf.constant(seed, tf.int64),
+                                               epoch]))
+            order = tf.argsort(keys)
+        else:
+            order = tf.range(num_examples)
+        begin = tf.where(epoch == start_epoch, start_offset, 0)
+        return tf.data.Dataset.from_tensor_slices(order[begin:])
 
+    def read(position):
+        serialized = tf.numpy_function(
+            reader.read, [
+                tf.gather(file_ids, position),
+                tf.gather(offsets, position),
+                tf.gather(lengths, position)
+            ], tf.string)
+        serialized.set_shape([])
+        return serialized
 
-def _parse_imagefolder_samples(filename, label, preprocess=None):
+    positions = tf.data.Dataset.range(start_epoch, start_epoch + epochs)
+    positions = positions.flat_map(epoch_order)
+    if num_shards > 1:
+        positions = positions.shard(num_shards, shard_index)
+    imagenet_ds = positions.map(read, num_parallel_calls=num_workers)
+    imagenet_ds = _decode_batches(imagenet_ds, batch_size, is_training,
+                                  preprocess, image_size, decode_size,
+                                  drop_remainder, device_augment)
+    return _with_options(imagenet_ds, num_workers, True)
+
+
+def _parse_imagefolder_samples(filename,
+                               label,
+                               preprocess=None,
+                               decode_size=None):
     image_string = tf.io.read_file(filename)
-    image_decoded = tf.image.decode_jpeg(image_string, channels=3)
+    if decode_size:
+        image_decoded = decode_jpeg_at_scale(image_string, decode_size)
+    else:
+        image_decoded = tf.image.decode_jpeg(image_string, channels=3)
     if preprocess is not None:
         image_decoded = preprocess(image_decoded)
     return image_decoded, label
@@ -79,26 +417,45 @@ def imagefolder_dataset(root,
                         batch_size,
                         is_training=True,
                         preprocess=None,
-                        num_workers=4):
-    valid_extensions = ('.png', '.jpg', '.jpeg')
+                        num_workers=4,
+                        dct_scaling=False,
+                        decode_size=None,
+                        manifest_cache_path=None):
+    """Reads images stored as root/{train,val}/<label>/<image>.jpg.
+
+    Files are listed through a cached `riptide.utils.manifest`.
+
+    Parameters
+    ----------
+    dct_scaling : bool
+        Decode JPEGs at the largest DCT downscale of 1/2, 1/4 or 1/8 that
+        keeps `decode_size` pixels on their shorter side.
+    decode_size : int
+        Smallest side of decoded images with `dct_scaling`, usually the
+        size `preprocess` resizes to.
+    manifest_cache_path : str
+        Where to cache the file listing, see
+        `riptide.utils.manifest.load_manifest`.
+
+    The other parameters are as in `imagerecord_dataset`.
+    """
+    decode_size = _check_decode_args(preprocess, None, dct_scaling,
+                                     decode_size)
     if is_training:
         split = 'train'
     else:
         split = 'val'
-    split_dir = os.path.join(root, split)
-    labels_list = os.listdir(split_dir)
-    # Iterate through folders and compose list of files and their label.
-    samples = []
-    for i, label in enumerate(labels_list):
-        files = os.listdir(os.path.join(split_dir, label))
-        for f in files:
-            # Make sure found files are valid images.
-            if f.lower().endswith(valid_extensions):
-                samples.append((os.path.join(split_dir, label, f), i))
+    # Labels follow the sorted class directory names.
+    manifest = load_manifest(
+        os.path.join(root, split), cache_path=manifest_cache_path)
+    samples = list(zip(manifest.full_paths(), manifest.labels.tolist()))
     # Perform an initial shuffling of the dataset.
     shuffle(samples)
     # Now that dataset is populated, parse it into proper tf dataset.
-    decode_fn = partial(_parse_imagefolder_samples, preprocess=preprocess)
+    decode_fn = partial(
+        _parse_imagefolder_samples,
+        preprocess=preprocess,
+        decode_size=decode_size)
     files, labels = zip(*samples)
     imagenet_ds = tf.data.Dataset.from_tensor_slices((list(files),
                                                       list(labels)))
@@ -112,3 +469,86 @@ def imagefolder_dataset(root,
             batch_size=batch_size,
             num_parallel_batches=num_workers))
     return imagenet_ds
+
+
+def cifar_dataset(batch_size,
+                  is_training=True,
+                  data=None,
+                  num_classes=10,
+                  image_size=32,
+                  num_workers=4,
+                  drop_remainder=False,
+                  num_shards=1,
+                  shard_index=0,
+                  seed=None):
+    """Batches of CIFAR held in memory as uint8, augmented per batch.
+
+    The whole split is a single uint8 tensor on the host, about 150MB for
+    the training set. Batches are gathered from it by shuffled indices and
+    preprocessed by `cifarnet_preprocessing.preprocess_batch`, so nothing
+    is decoded and no op runs per image.
+
+    Parameters
+    ----------
+    batch_size : int
+        Number of examples per batch.
+    is_training : bool
+        Read the training split with random augmentation, otherwise the
+        test split.
+    data : tuple of numpy.ndarray
+        uint8 images [N, 32, 32, 3] and integer labels [N] or [N, 1] to use
+        instead of loading the split with `tf.keras.datasets`.
+    num_classes : int
+        10 or 100, which CIFAR dataset to load.
+    image_size : int
+        Height and width of preprocessed images.
+    num_workers : int
+        Batches preprocessed in parallel.
+    drop_remainder : bool
+        Drop the last batch if it is smaller than `batch_size`.
+    num_shards : int
+        Number of input pipelines, see `imagerecord_dataset`.
+    shard_index : int
+        Index of this input pipeline, which reads every `num_shards`-th
+        example.
+    seed : int
+        Seed of the shuffle order of training examples.
+
+    Returns
+    -------
+    tf.data.Dataset
+        Batches of float32 images and int32 labels [batch_size, 1].
+    """
+    if data is None:
+        if num_classes == 10:
+            splits = tf.keras.datasets.cifar10.load_data()
+        elif num_classes == 100:
+            splits = tf.keras.datasets.cifar100.load_data()
+        else:
+            raise ValueError('CIFAR has 10 or 100 classes, not %d.' %
+                             num_classes)
+        data = splits[0] if is_training else splits[1]
+    images, labels = data
+    if images.dtype != np.uint8:
+        raise ValueError('CIFAR images must be uint8, got %s.' % images.dtype)
+    with tf.device('/cpu:0'):
+        images = tf.constant(images)
+        labels = tf.constant(np.reshape(labels, [-1, 1]).astype(np.int32))
+
+    def gather(indices):
+        batch = preprocess_batch(
+            tf.gather(images, indices),
+            image_size,
+            image_size,
+            is_training=is_training)
+        return batch, tf.gather(labels, indices)
+
+    indices = tf.data.Dataset.range(len(data[0])).shard(
+        num_shards, shard_index)
+    if is_training:
+        indices = indices.shuffle(
+            len(data[0]), seed=seed, reshuffle_each_iteration=True)
+    cifar_ds = indices.batch(batch_size, drop_remainder=drop_remainder)
+    cifar_ds = cifar_ds.map(gather, num_parallel_calls=num_workers)
+    cifar_ds = cifar_ds.prefetch(tf.data.experimental.AUTOTUNE)
+    return _with_options(cifar_ds, num_workers, not is_training)
@@ -1,7 +1,10 @@
+import os
+import collections
 import tensorflow as tf
 import numpy as np
 from functools import partial
-from datasets import imagerecord_dataset, imagefolder_dataset
+from riptide.utils.datasets import (_echo, imagerecord_dataset,
+                                    imagefolder_dataset)
 from riptide.utils.preprocessing.inception_preprocessing import preprocess_image
 
 
@@ -20,11 +23,122 @@ class DatasetTest(tf.test.TestCase):
         preprocess = partial(
             preprocess_image, height=224, width=224, is_training=True)
         ds = imagefolder_dataset(
-            root='/data/imagenet', batch_size=2, preprocess=preprocess)
+            root='/data/imagenet',
+            batch_size=2,
+            preprocess=preprocess,
+            manifest_cache_path=os.path.join(self.get_temp_dir(),
+                                             'manifest.json.gz'))
         image, label = next(iter(ds))
         self.assertEqual((2, 224, 224, 3), image.shape)
         self.assertTrue((np.abs(image) <= 1.0).all())
 
 
+def _example(value):
+    image = tf.io.encode_jpeg(np.full([8, 8, 3], value, np.uint8)).numpy()
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                'image':
+                tf.train.Feature(bytes_list=tf.train.BytesList(value=[image])),
+                'label':
+                tf.train.Feature(int64_list=tf.train.Int64List(value=[value])),
+            })).SerializeToString()
+
+
+class ImageFolderTest(tf.test.TestCase):
+    def setUp(self):
+        self.root = os.path.join(self.get_temp_dir(), 'folder')
+        for label in ('cat', 'dog'):
+            os.makedirs(os.path.join(self.root, 'train', label), exist_ok=True)
+            tf.io.write_file(
+                os.path.join(self.root, 'train', label, '0.jpg'),
+                tf.io.encode_jpeg(np.zeros([96, 128, 3], np.uint8)))
+
+    def _shapes(self, **kwargs):
+        ds = imagefolder_dataset(
+            self.root,
+            1,
+            manifest_cache_path=os.path.join(self.get_temp_dir(),
+                                             'manifest.json.gz'),
+            **kwargs)
+        return [tuple(image.shape[1:]) for image, _ in ds]
+
+    def test_dct_scaling(self):
+        self.assertEqual(self._shapes(), [(96, 128, 3)] * 2)
+        # Only scaled when asked to, as in imagerecord_dataset.
+        self.assertEqual(self._shapes(decode_size=40), [(96, 128, 3)] * 2)
+        self.assertEqual(
+            self._shapes(dct_scaling=True, decode_size=40),
+            [(48, 64, 3)] * 2)
+        with self.assertRaises(ValueError):
+            self._shapes(dct_scaling=True)
+
+
+class EchoTest(tf.test.TestCase):
+    def setUp(self):
+        tf.random.set_seed(0)
+        self.root = os.path.join(self.get_temp_dir(), 'records')
+        os.makedirs(self.root, exist_ok=True)
+        label = 0
+        for split, shards in [('train', 2), ('val', 1)]:
+            for shard in range(shards):
+                filename = os.path.join(self.root, '%s-%d' % (split, shard))
+                with tf.io.TFRecordWriter(filename) as writer:
+                    for _ in range(12):
+                        writer.write(_example(label))
+                        label += 1
+
+    def _batches(self, **kwargs):
+        ds = imagerecord_dataset(
+            self.root,
+            4,
+            preprocess=lambda image: tf.cast(image[0, 0, 0], tf.int64),
+            **kwargs)
+        return [tuple(labels.numpy().ravel()) for _, labels in ds]
+
+    def _assert_spread(self, elements, echo_factor):
+        # Each element is repeated exactly echo_factor times and the copies
+        # of at least some elements are not next to each other.
+        counts = collections.Counter(elements)
+        self.assertEqual(set(counts.values()), {echo_factor})
+        adjacent = [
+            elements[i:i + echo_factor] == (element, ) * echo_factor
+            for i, element in enumerate(elements)
+            if elements.index(element) == i
+        ]
+        self.assertFalse(all(adjacent))
+
+    def test_echo(self):
+        elements = [
+            int(x) for x in _echo(tf.data.Dataset.range(20), 3, 12)
+        ]
+        self.assertEqual(len(elements), 60)
+        self._assert_spread(tuple(elements), 3)
+
+    def test_echo_examples(self):
+        batches = self._batches(echo_factor=3)
+        labels = sum(batches, ())
+        self.assertCountEqual(set(labels), range(24))
+        self._assert_spread(labels, 3)
+
+    def test_echo_batches(self):
+        batches = self._batches(echo_factor=2, echo_level='batch')
+        self.assertEqual(len(batches), 12)
+        self.assertCountEqual(set(sum(batches, ())), range(24))
+        self._assert_spread(tuple(batches), 2)
+
+    def test_eval_is_not_echoed(self):
+        for echo_level in ['example', 'batch']:
+            batches = self._batches(
+                is_training=False, echo_factor=3, echo_level=echo_level)
+            self.assertEqual(list(sum(batches, ())), list(range(24, 36)))
+
+    def test_invalid_echo(self):
+        with self.assertRaises(ValueError):
+            self._batches(echo_factor=0)
+        with self.assertRaises(ValueError):
+            self._batches(echo_factor=2, echo_level='epoch')
+
+
 if __name__ == '__main__':
     tf.test.main()
@@ -0,0 +1,145 @@
+"""Multi-worker training support.
+
+Workers of a cluster find each other through the `TF_CONFIG` environment
+variable, for example
+
+    {"cluster": {"worker": ["host1:2222", "host2:2222"]},
+     "task": {"type": "worker", "index": 0}}
+
+Every worker runs the same training script. The chief, an explicit 'chief'
+task or worker 0 otherwise, owns checkpoints and summaries.
+"""
+import os
+import json
+import socket
+import subprocess
+import tensorflow as tf
+
+
+def tf_config():
+    """Returns the parsed `TF_CONFIG` environment variable."""
+    return json.loads(os.environ.get('TF_CONFIG') or '{}')
+
+
+def num_workers(config=None):
+    """Returns the number of training tasks in the cluster."""
+    config = tf_config() if config is None else config
+    cluster = config.get('cluster', {})
+    return len(cluster.get('chief', [])) + len(cluster.get('worker', []))
+
+
+def task(config=None):
+    """Returns the (type, index) of this task, (None, 0) without a cluster."""
+    config = tf_config() if config is None else config
+    task = config.get('task', {})
+    return task.get('type'), int(task.get('index', 0))
+
+
+def is_chief(config=None):
+    config = tf_config() if config is None else config
+    task_type, task_id = task(config)
+    if task_type is None or task_type == 'chief':
+        return True
+    return (task_type == 'worker' and task_id == 0 and
+            'chief' not in config.get('cluster', {}))
+
+
+def get_strategy(num_gpus=1):
+    """Picks a distribution strategy for this process.
+
+    Returns `MultiWorkerMirroredStrategy` when `TF_CONFIG` describes more
+    than one worker, `MirroredStrategy` for several local GPUs and the
+    default strategy otherwise. Must be called before any other TensorFlow
+    op runs.
+    """
+    if num_workers() > 1:
+        if hasattr(tf.distribute, 'MultiWorkerMirroredStrategy'):
+            return tf.distribute.MultiWorkerMirroredStrategy()
+        return tf.distribute.experimental.MultiWorkerMirroredStrategy()
+    if num_gpus > 1:
+        return tf.distribute.MirroredStrategy()
+    return tf.distribute.get_strategy()
+
+
+def write_dir(model_dir, config=None):
+    """Directory this task writes checkpoints to.
+
+    Saving is a collective operation so every worker has to save, workers
+    other than the chief write to a temporary directory that is removed
+    afterwards.
+    """
+    if is_chief(config):
+        return model_dir
+    _, task_id = task(config)
+    return os.path.join(model_dir, 'workertemp_%d' % task_id)
+
+
+def distribute_dataset(strategy, dataset):
+    """Distributes a dataset or a function of an `InputContext`.
+
+    Functions are called once per worker with the context of its input
+    pipeline and must return a dataset batched per replica, sharded with
+    `num_input_pipelines` and `input_pipeline_id`. Datasets are batched
+    globally and sharded automatically.
+    """
+    if not callable(dataset):
+        return strategy.experimental_distribute_dataset(dataset)
+    if hasattr(strategy, 'distribute_datasets_from_function'):
+        return strategy.distribute_datasets_from_function(dataset)
+    return strategy.experimental_distribute_datasets_from_function(dataset)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def local_cluster(num_workers):
+    """Returns a `TF_CONFIG` for each of `num_workers` local workers."""
+    workers = ['localhost:%d' % _free_port() for _ in range(num_workers)]
+    return [{
+        'cluster': {
+            'worker': workers
+        },
+        'task': {
+            'type': 'worker',
+            'index': i
+        }
+    } for i in range(num_workers)]
+
+
+def launch_local_workers(command, num_workers, cpu_only=True, env=None):
+    """Runs a command once per worker of a local cluster.
+
+    Parameters
+    ----------
+    command : list of str
+        Command line of every worker, for example a training script and
+        its flags.
+    num_workers : int
+        Number of worker processes.
+    cpu_only : bool
+        Hide GPUs from the workers so they can share one CPU machine.
+    env : dict
+        Extra environment variables.
+
+    Returns
+    -------
+    list of int
+        Exit code of every worker.
+    """
+    processes = []
+    for config in local_cluster(num_workers):
+        worker_env = dict(os.environ)
+        worker_env.update(env or {})
+        worker_env['TF_CONFIG'] = json.dumps(config)
+        if cpu_only:
+            worker_env['CUDA_VISIBLE_DEVICES'] = ''
+        processes.append(subprocess.Popen(command, env=worker_env))
+    try:
+        return [p.wait() for p in processes]
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                p.kill()
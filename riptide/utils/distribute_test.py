@@ -0,0 +1,84 @@
+import os
+import sys
+import tensorflow as tf
+from riptide.utils import distribute
+
+WORKER = """
+import sys
+import tensorflow as tf
+from riptide.utils.distribute import get_strategy
+from riptide.utils.training import Trainer
+
+strategy = get_strategy()
+
+
+def model_fn():
+    return tf.keras.Sequential([
+        tf.keras.Input((8, 8, 3)),
+        tf.keras.layers.Conv2D(4, 3),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(10, activation='softmax'),
+    ])
+
+
+def dataset_fn(input_context):
+    images = tf.zeros([64, 8, 8, 3])
+    labels = tf.zeros([64], tf.int32)
+    ds = tf.data.Dataset.from_tensor_slices((images, labels))
+    ds = ds.shard(input_context.num_input_pipelines,
+                  input_context.input_pipeline_id)
+    batch_size = input_context.get_per_replica_batch_size(16)
+    return ds.batch(batch_size, drop_remainder=True).repeat()
+
+
+trainer = Trainer(
+    model_fn,
+    lambda global_step: (tf.keras.optimizers.SGD(0.1), 0.1),
+    sys.argv[1],
+    16,
+    strategy=strategy,
+    steps_per_execution=2)
+trainer.train(dataset_fn, 4)
+assert strategy.num_replicas_in_sync == 2
+"""
+
+
+class DistributeTest(tf.test.TestCase):
+    def test_chief(self):
+        cluster = {'worker': ['a:1', 'b:1']}
+        worker = {'cluster': cluster, 'task': {'type': 'worker', 'index': 1}}
+        self.assertEqual(distribute.num_workers(worker), 2)
+        self.assertFalse(distribute.is_chief(worker))
+        self.assertEqual(
+            distribute.write_dir('model', worker),
+            os.path.join('model', 'workertemp_1'))
+        worker['task']['index'] = 0
+        self.assertTrue(distribute.is_chief(worker))
+        # An explicit chief task takes precedence over worker 0.
+        cluster['chief'] = ['c:1']
+        self.assertFalse(distribute.is_chief(worker))
+        self.assertEqual(distribute.num_workers(worker), 3)
+        self.assertTrue(distribute.is_chief({}))
+
+    def test_local_workers(self):
+        script = os.path.join(self.get_temp_dir(), 'worker.py')
+        with open(script, 'w') as f:
+            f.write(WORKER)
+        model_dir = os.path.join(self.get_temp_dir(), 'model')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env = {
+            'PYTHONPATH':
+            os.pathsep.join([root, os.environ.get('PYTHONPATH', '')])
+        }
+        codes = distribute.launch_local_workers(
+            [sys.executable, script, model_dir], 2, env=env)
+        self.assertEqual(codes, [0, 0])
+        # Only the chief keeps checkpoints.
+        self.assertIsNotNone(tf.train.latest_checkpoint(model_dir))
+        self.assertFalse(
+            tf.io.gfile.exists(os.path.join(model_dir, 'workertemp_1')))
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,217 @@
+"""Pre-decoded evaluation images stored in a single memory-mapped file.
+
+Evaluation preprocessing is deterministic, so the central crops of the
+validation set can be decoded and resized once and then read back on every
+evaluation without touching a JPEG. The file holds a small JSON header
+followed by all images as uint8 [N, size, size, 3] and their int32 labels
+as [N, 1]:
+
+    | magic | header length | JSON header | padding | images | labels |
+
+Storing uint8 rounds the resized pixels, a difference of at most 1/255
+before normalization.
+"""
+import os
+import json
+import struct
+import numpy as np
+import tensorflow as tf
+from riptide.utils.datasets import _get_shard_dataset, _parse_imagenet
+from riptide.utils.preprocessing.inception_preprocessing import (
+    augment_batch, decode_and_crop_for_eval)
+
+_MAGIC = b'RTEVAL01'
+# Images start at this offset so their rows are page aligned.
+_DATA_OFFSET = 4096
+
+
+def _write_header(f, header):
+    text = json.dumps(header).encode()
+    if len(_MAGIC) + 4 + len(text) > _DATA_OFFSET:
+        raise ValueError('Eval cache header too large.')
+    f.seek(0)
+    f.write(_MAGIC + struct.pack('<I', len(text)) + text)
+
+
+def read_header(path):
+    """Returns the metadata of an eval cache file."""
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('%s is not an eval cache.' % path)
+        length, = struct.unpack('<I', f.read(4))
+        return json.loads(f.read(length).decode())
+
+
+def build_eval_cache(record_path,
+                     cache_path,
+                     image_size,
+                     central_fraction=0.875,
+                     num_workers=4):
+    """Decodes the validation records once into an eval cache.
+
+    Images are center cropped and resized exactly as `imagerecord_dataset`
+    does for evaluation, in record order.
+
+    Parameters
+    ----------
+    record_path : str
+        Directory containing val* record files.
+    cache_path : str
+        File to write, replaced atomically when complete.
+    image_size : int
+        Height and width of cached images.
+    central_fraction : float
+        Fraction of each image kept by the central crop.
+    num_workers : int
+        Images decoded in parallel.
+
+    Returns
+    -------
+    int
+        Number of cached images.
+    """
+
+    def decode(proto):
+        image_buffer, label = _parse_imagenet(proto)
+        image = decode_and_crop_for_eval(image_buffer, central_fraction)
+        image = tf.image.resize(image, [image_size, image_size])
+        image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+        return image, label
+
+    files = _get_shard_dataset(record_path, split='val', shuffle=False)
+    ds = files.flat_map(tf.data.TFRecordDataset)
+    ds = ds.map(decode, num_parallel_calls=num_workers).batch(256)
+    ds = ds.prefetch(2)
+
+    # Labels are small and written after the images, once their number is
+    # known.
+    labels = []
+    partial_path = cache_path + '.partial'
+    with open(partial_path, 'wb') as f:
+        f.seek(_DATA_OFFSET)
+        for images, batch_labels in ds:
+            f.write(images.numpy().tobytes())
+            labels.append(batch_labels.numpy().astype(np.int32))
+        labels = np.concatenate(labels) if labels else np.zeros(
+            [0, 1], np.int32)
+        labels_offset = f.tell()
+        f.write(labels.tobytes())
+        _write_header(
+            f, {
+                'count': len(labels),
+                'image_size': image_size,
+                'central_fraction': central_fraction,
+                'labels_offset': labels_offset,
+            })
+    os.replace(partial_path, cache_path)
+    return len(labels)
+
+
+class EvalCache(object):
+    """Read only view of an eval cache file.
+
+    `images` and `labels` are numpy memmaps, slicing them is free and pages
+    are read from disk, or the page cache, on first access. If `image_size`
+    is given it must be the size the cache was built at.
+    """
+
+    def __init__(self, path, image_size=None):
+        self.path = path
+        self.header = read_header(path)
+        count = self.header['count']
+        size = self.header['image_size']
+        if image_size is not None and image_size != size:
+            raise ValueError(
+                '%s holds %dx%d images but %dx%d images were requested, '
+                'rebuild it with scripts/build_eval_cache.py.' %
+                (path, size, size, image_size, image_size))
+        self.images = np.memmap(
+            path,
+            dtype=np.uint8,
+            mode='r',
+            offset=_DATA_OFFSET,
+            shape=(count, size, size, 3))
+        self.labels = np.memmap(
+            path,
+            dtype=np.int32,
+            mode='r',
+            offset=self.header['labels_offset'],
+            shape=(count, 1))
+
+    def __len__(self):
+        return self.header['count']
+
+    @property
+    def image_size(self):
+        return self.header['image_size']
+
+
+def _normalize(images, labels):
+    # Same scaling to [-1, 1] as the evaluation path of imagerecord_dataset.
+    return augment_batch(images, False), labels
+
+
+def eval_cache_dataset(path,
+                       batch_size,
+                       num_shards=1,
+                       shard_index=0,
+                       normalize=True,
+                       image_size=None):
+    """Reads batches of an eval cache written by `build_eval_cache`.
+
+    Batches are contiguous slices of the memory map, converted to float in
+    [-1, 1] by TensorFlow rather than numpy unless `normalize` is False.
+
+    Parameters
+    ----------
+    path : str
+        Eval cache file.
+    batch_size : int
+        Number of examples per batch, the last batch may be smaller.
+    num_shards : int
+        Number of input pipelines reading the cache, see
+        `imagerecord_dataset`.
+    shard_index : int
+        Index of this input pipeline, which reads every `num_shards`-th
+        batch.
+    normalize : bool
+        Convert to float. Otherwise uint8 batches are returned, to be
+        normalized on the accelerator by `augment_batch`.
+    image_size : int
+        Expected height and width of the cached images, a ValueError is
+        raised if the cache was built at another size.
+
+    Returns
+    -------
+    tf.data.Dataset
+        Batches of float32 or uint8 images and int32 labels.
+    """
+    cache = EvalCache(path, image_size)
+    size = cache.image_size
+    num_batches = (len(cache) + batch_size - 1) // batch_size
+
+    def generator():
+        for b in range(shard_index, num_batches, num_shards):
+            start = b * batch_size
+            end = start + batch_size
+            yield cache.images[start:end], cache.labels[start:end]
+
+    types = (tf.uint8, tf.int32)
+    shapes = (tf.TensorShape([None, size, size, 3]), tf.TensorShape([None, 1]))
+    try:
+        ds = tf.data.Dataset.from_generator(
+            generator,
+            output_signature=tuple(
+                tf.TensorSpec(s, t) for s, t in zip(shapes, types)))
+    except TypeError:
+        # Before output_signature was added.
+        ds = tf.data.Dataset.from_generator(generator, types, shapes)
+    if normalize:
+        ds = ds.map(
+            _normalize, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+    ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+    # Batches are already split between input pipelines.
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = (
+        tf.data.experimental.AutoShardPolicy.OFF)
+    return ds.with_options(options)
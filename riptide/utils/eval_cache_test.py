@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import tensorflow as tf
+from riptide.utils.datasets import imagerecord_dataset
+from riptide.utils.eval_cache import build_eval_cache, eval_cache_dataset
+
+
+class EvalCacheTest(tf.test.TestCase):
+    def setUp(self):
+        self.record_path = os.path.join(self.get_temp_dir(), 'records')
+        os.makedirs(self.record_path, exist_ok=True)
+        rng = np.random.RandomState(0)
+        with tf.io.TFRecordWriter(
+                os.path.join(self.record_path, 'val-00000')) as writer:
+            for label in range(10):
+                image = rng.randint(0, 255, [40 + label, 50, 3])
+                image = tf.io.encode_jpeg(image.astype(np.uint8)).numpy()
+                example = tf.train.Example(
+                    features=tf.train.Features(
+                        feature={
+                            'image':
+                            tf.train.Feature(
+                                bytes_list=tf.train.BytesList(value=[image])),
+                            'label':
+                            tf.train.Feature(
+                                int64_list=tf.train.Int64List(value=[label])),
+                        }))
+                writer.write(example.SerializeToString())
+
+    def test_matches_imagerecord_dataset(self):
+        cache_path = os.path.join(self.get_temp_dir(), 'val.cache')
+        self.assertEqual(build_eval_cache(self.record_path, cache_path, 16),
+                         10)
+        expected = imagerecord_dataset(
+            self.record_path, 4, is_training=False, image_size=16)
+        cached = eval_cache_dataset(cache_path, 4)
+        for (images, labels), (cached_images, cached_labels) in zip(
+                expected, cached):
+            self.assertAllEqual(labels, cached_labels)
+            # Pixels were rounded to uint8.
+            self.assertAllClose(images, cached_images, atol=1.01 / 255)
+        shards = [
+            len(list(eval_cache_dataset(cache_path, 4, 2, i)))
+            for i in range(2)
+        ]
+        self.assertEqual(shards, [2, 1])
+
+    def test_device_augment_batches(self):
+        cache_path = os.path.join(self.get_temp_dir(), 'val.cache')
+        build_eval_cache(self.record_path, cache_path, 16)
+        expected = imagerecord_dataset(
+            self.record_path,
+            4,
+            is_training=False,
+            image_size=16,
+            device_augment=True)
+        cached = eval_cache_dataset(cache_path, 4, normalize=False)
+        for (images, _), (cached_images, _) in zip(expected, cached):
+            self.assertEqual(images.dtype, tf.uint8)
+            self.assertAllEqual(images, cached_images)
+
+    def test_image_size_mismatch(self):
+        cache_path = os.path.join(self.get_temp_dir(), 'val.cache')
+        build_eval_cache(self.record_path, cache_path, 16)
+        self.assertEqual(
+            len(list(eval_cache_dataset(cache_path, 4, image_size=16))), 3)
+        with self.assertRaisesRegex(ValueError, '16x16'):
+            eval_cache_dataset(cache_path, 4, image_size=24)
+
+
+if __name__ == '__main__':
+    tf.test.main()
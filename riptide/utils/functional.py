@@ -0,0 +1,51 @@
+"""Conversion of subclassed riptide models to the Keras functional API."""
+import tensorflow as tf
+from riptide.utils.sequential import inline_nested_models
+
+
+def _is_layer_attribute(value):
+    if isinstance(value, tf.keras.layers.Layer):
+        return True
+    if isinstance(value, (list, tuple)) and value:
+        return all(
+            isinstance(v, (str, tf.keras.layers.Layer)) or
+            _is_layer_attribute(v) for v in value)
+    return False
+
+
+def build_functional(net, input_shape):
+    """Traces the `call` of a subclassed model into a functional model.
+
+    The functional model reuses the layer objects of `net`, so both share
+    the same variables. Nested models such as residual blocks are inlined
+    so every leaf layer becomes a node of the graph. Layer attributes of
+    `net` are mirrored onto the functional model which keeps object based
+    checkpoint keys identical, a checkpoint of either model loads into the
+    other.
+
+    Parameters
+    ----------
+    net : tf.keras.Model
+        Subclassed model, for example from `get_model`. It is called once
+        on zeros to create its variables.
+    input_shape : tuple
+        Shape of a single example, without the batch dimension.
+
+    Returns
+    -------
+    tf.keras.Model
+        Functional model with the same name and outputs as `net`.
+    """
+    # Variables are created by one call of the subclassed model, so their
+    # names match it exactly. Tracing then reuses the built layers.
+    net(tf.zeros([1] + list(input_shape)))
+    inputs = tf.keras.Input(shape=input_shape)
+    with inline_nested_models():
+        outputs = net.call(inputs)
+    model = tf.keras.Model(inputs=inputs, outputs=outputs, name=net.name)
+    for name, value in vars(net).items():
+        if name.startswith('_'):
+            continue
+        if _is_layer_attribute(value):
+            setattr(model, name, value)
+    return model
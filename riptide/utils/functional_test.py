@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import tensorflow as tf
+from absl.testing import parameterized
+from riptide.get_models import get_model
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_funcs import DQuantize, XQuantize
+
+
+def _build(name, input_shape, functional):
+    tf.keras.backend.clear_session()
+    with nn.Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=2.0,
+            use_act=False,
+            use_bn=False,
+            bipolar=True):
+        model = get_model(
+            name, functional=functional, input_shape=input_shape)
+    if not functional:
+        model(tf.zeros([1] + list(input_shape)))
+    return model
+
+
+class FunctionalTest(tf.test.TestCase, parameterized.TestCase):
+    @parameterized.parameters(
+        ('vggnet', (64, 64, 3)),
+        ('alexnet', (224, 224, 3)),
+        ('squeezenet', (64, 64, 3)),
+        ('resnet18', (64, 64, 3)),
+        ('q_resnet34', (64, 64, 3)),
+        ('q_cifarnet20', (32, 32, 3)),
+    )
+    def test_checkpoint_round_trip(self, name, input_shape):
+        images = np.random.uniform(size=[2] + list(input_shape))
+        images = images.astype(np.float32)
+        subclassed = _build(name, input_shape, functional=False)
+        names = sorted(w.name for w in subclassed.weights)
+        expected = subclassed(images, training=False)
+        path = tf.train.Checkpoint(model=subclassed).save(
+            os.path.join(self.get_temp_dir(), name, 'ckpt'))
+
+        # Freshly initialized, so outputs only match if every weight is
+        # restored.
+        functional = _build(name, input_shape, functional=True)
+        self.assertGreater(len(functional.layers), 3)
+        self.assertEqual(names, sorted(w.name for w in functional.weights))
+        tf.train.Checkpoint(model=functional).restore(
+            path).assert_existing_objects_matched()
+        self.assertAllClose(expected, functional(images, training=False))
+
+        # And back into the subclassed model.
+        path = tf.train.Checkpoint(model=functional).save(
+            os.path.join(self.get_temp_dir(), name + '_functional', 'ckpt'))
+        subclassed = _build(name, input_shape, functional=False)
+        tf.train.Checkpoint(model=subclassed).restore(
+            path).assert_existing_objects_matched()
+        self.assertAllClose(expected, subclassed(images, training=False))
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -9,7 +9,8 @@ def learning_rate_with_smooth_decay(batch_size,
                                     warmup=False,
                                     staircase=False,
                                     warmup_epochs=5,
-                                    num_images=1281167):
+                                    num_images=1281167,
+                                    accum_steps=1):
     """ Get a learning rate the smoothly decays as training progresses.
 
     Args:
@@ -22,7 +23,10 @@ def learning_rate_with_smooth_decay(batch_size,
         staircase: If True, learning decay is not smooth.
         warmup_epochs: Number of epochs to increase the lr to the base_lr.
         num_images: Number of images in the dataset.
+        accum_steps: Number of batches whose gradients are accumulated into a
+            single step, the effective batch size is batch_size * accum_steps.
     """
+    batch_size = batch_size * accum_steps
     initial_learning_rate = base_lr * batch_size / batch_denom
     steps_per_epoch = num_images / batch_size
 
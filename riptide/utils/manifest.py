@@ -0,0 +1,172 @@
+"""Cached listings of image folders.
+
+Listing ImageNet takes a directory read and a stat for each of 1.28M files,
+which is slow on network filesystems when done serially on every start.
+`load_manifest` scans class directories in parallel with `os.scandir` and
+saves the result with the modification time of every directory. Later runs
+only rescan class directories whose modification time changed, which
+happens when files are added, removed or renamed.
+
+Labels are the positions of class directory names in sorted order, so they
+are the same on every host and every run.
+"""
+import os
+import gzip
+import json
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from absl import logging
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+_VERSION = 1
+
+
+def default_cache_path(split_dir):
+    """Manifests of datasets are cached per user, the data may be read only."""
+    key = hashlib.sha1(os.path.abspath(split_dir).encode()).hexdigest()
+    cache_dir = os.environ.get('RIPTIDE_CACHE_DIR', os.path.join(
+        os.path.expanduser('~'), '.cache', 'riptide'))
+    return os.path.join(cache_dir, 'manifests', key + '.json.gz')
+
+
+class Manifest(object):
+    """Image files of a folder with one subdirectory per class.
+
+    Attributes
+    ----------
+    root : str
+        Directory holding the class directories.
+    classes : list of str
+        Sorted class directory names, label i is classes[i].
+    paths : list of str
+        Paths of images relative to `root`.
+    labels : numpy.ndarray
+        int32 label of every image.
+    sizes : numpy.ndarray
+        int64 size in bytes of every image.
+    """
+
+    def __init__(self, root, classes, files, sizes):
+        self.root = root
+        self.classes = classes
+        self.paths = [
+            os.path.join(c, f) for c, names in zip(classes, files)
+            for f in names
+        ]
+        self.labels = np.concatenate(
+            [np.zeros([0], np.int32)] +
+            [np.full([len(names)], i, np.int32)
+             for i, names in enumerate(files)])
+        self.sizes = np.concatenate(
+            [np.zeros([0], np.int64)] +
+            [np.array(s, np.int64) for s in sizes])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def full_paths(self):
+        return [os.path.join(self.root, p) for p in self.paths]
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns
+
+
+def _scan_class(class_dir, extensions):
+    # Returns sorted image names and sizes of one class directory.
+    entries = []
+    with os.scandir(class_dir) as it:
+        for entry in it:
+            if (entry.name.lower().endswith(extensions) and
+                    entry.is_file()):
+                entries.append((entry.name, entry.stat().st_size))
+    entries.sort()
+    return [e[0] for e in entries], [e[1] for e in entries]
+
+
+def _read_cache(cache_path):
+    try:
+        with gzip.open(cache_path, 'rt') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cache if cache.get('version') == _VERSION else None
+
+
+def _write_cache(cache_path, cache):
+    partial = '%s.%d.partial' % (cache_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with gzip.open(partial, 'wt') as f:
+            json.dump(cache, f)
+        os.replace(partial, cache_path)
+    except OSError as e:
+        # Listing still works, it is just not reused next time.
+        logging.warning('Could not save manifest %s: %s' % (cache_path, e))
+
+
+def load_manifest(split_dir,
+                  cache_path=None,
+                  num_threads=32,
+                  extensions=VALID_EXTENSIONS):
+    """Lists the images of a folder, reusing a cached manifest if current.
+
+    Parameters
+    ----------
+    split_dir : str
+        Directory with one subdirectory of images per class.
+    cache_path : str
+        Where to keep the manifest, see `default_cache_path`. Pass '' to
+        always scan without caching.
+    num_threads : int
+        Directories scanned in parallel.
+    extensions : tuple of str
+        Lowercase file name suffixes of images.
+
+    Returns
+    -------
+    Manifest
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(split_dir)
+    with os.scandir(split_dir) as it:
+        classes = sorted(e.name for e in it if e.is_dir())
+    cache = _read_cache(cache_path) if cache_path else None
+    # A cache written for another directory or other extensions is rebuilt.
+    if cache is not None and (cache['root'] != os.path.abspath(split_dir) or
+                              cache['extensions'] != list(extensions)):
+        cache = None
+    cached = cache['classes'] if cache is not None else {}
+    class_dirs = [os.path.join(split_dir, c) for c in classes]
+
+    with ThreadPoolExecutor(num_threads) as pool:
+        mtimes = list(pool.map(_mtime, class_dirs))
+        stale = [
+            i for i, c in enumerate(classes)
+            if c not in cached or cached[c]['mtime'] != mtimes[i]
+        ]
+        scans = pool.map(lambda i: _scan_class(class_dirs[i], extensions),
+                         stale)
+        for i, (names, sizes) in zip(stale, scans):
+            cached[classes[i]] = {
+                'mtime': mtimes[i],
+                'files': names,
+                'sizes': sizes,
+            }
+    logging.info('Scanned %d of %d class directories of %s.' %
+                 (len(stale), len(classes), split_dir))
+
+    removed = set(cached) - set(classes)
+    if cache_path and (stale or removed or cache is None):
+        _write_cache(
+            cache_path, {
+                'version': _VERSION,
+                'root': os.path.abspath(split_dir),
+                'extensions': list(extensions),
+                'classes': {c: cached[c] for c in classes},
+            })
+    return Manifest(split_dir, classes, [cached[c]['files'] for c in classes],
+                    [cached[c]['sizes'] for c in classes])
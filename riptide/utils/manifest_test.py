@@ -0,0 +1,76 @@
+import os
+from unittest import mock
+import tensorflow as tf
+from riptide.utils import manifest
+from riptide.utils.datasets import imagefolder_dataset
+
+
+class ManifestTest(tf.test.TestCase):
+    def setUp(self):
+        # Nothing may be cached outside of the test directory.
+        self.cache_dir = os.path.join(self.get_temp_dir(), 'cache')
+        environ = mock.patch.dict(os.environ,
+                                  {'RIPTIDE_CACHE_DIR': self.cache_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.root = os.path.join(self.get_temp_dir(), 'train')
+        self.cache_path = os.path.join(self.get_temp_dir(), 'manifest.json.gz')
+        for label in ('zebra', 'ant', 'cat'):
+            os.makedirs(os.path.join(self.root, label), exist_ok=True)
+            for i in range(3):
+                self._write(label, '%d.jpg' % i, b'x' * (i + 1))
+        self._write('cat', 'notes.txt', b'')
+
+    def _write(self, label, name, data):
+        with open(os.path.join(self.root, label, name), 'wb') as f:
+            f.write(data)
+
+    def test_sorted_labels_and_cache(self):
+        scanned = manifest.load_manifest(self.root, self.cache_path)
+        self.assertEqual(scanned.classes, ['ant', 'cat', 'zebra'])
+        self.assertEqual(scanned.paths[:3],
+                         [os.path.join('ant', '%d.jpg' % i) for i in range(3)])
+        self.assertAllEqual(scanned.labels, [0] * 3 + [1] * 3 + [2] * 3)
+        self.assertAllEqual(scanned.sizes, [1, 2, 3] * 3)
+        # Rewriting a file leaves the directory and its listing unchanged.
+        self._write('ant', '0.jpg', b'xxxxx')
+        cached = manifest.load_manifest(self.root, self.cache_path)
+        self.assertAllEqual(cached.sizes, scanned.sizes)
+        # Adding a file changes the modification time of its directory.
+        stat = os.stat(os.path.join(self.root, 'ant'))
+        self._write('ant', '3.jpg', b'')
+        os.utime(
+            os.path.join(self.root, 'ant'),
+            ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        updated = manifest.load_manifest(self.root, self.cache_path)
+        self.assertEqual(len(updated), 10)
+        self.assertEqual(updated.sizes[0], 5)
+        self.assertAllEqual(updated.labels, [0] * 4 + [1] * 3 + [2] * 3)
+
+    def test_cache_of_other_root(self):
+        manifest.load_manifest(self.root, self.cache_path)
+        # Same class names and modification times, different files.
+        other = os.path.join(self.get_temp_dir(), 'val')
+        for label in ('zebra', 'ant', 'cat'):
+            os.makedirs(os.path.join(other, label), exist_ok=True)
+            os.utime(
+                os.path.join(other, label),
+                ns=(0, os.stat(os.path.join(self.root, label)).st_mtime_ns))
+        listed = manifest.load_manifest(other, self.cache_path)
+        self.assertEqual(listed.root, other)
+        self.assertEqual(len(listed), 0)
+
+    def test_default_cache_path(self):
+        path = manifest.default_cache_path(self.root)
+        self.assertStartsWith(path, os.path.join(self.cache_dir, 'manifests'))
+        manifest.load_manifest(self.root)
+        self.assertTrue(os.path.exists(path))
+
+    def test_imagefolder_dataset_cache_path(self):
+        imagefolder_dataset(
+            self.get_temp_dir(), 2, manifest_cache_path=self.cache_path)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -83,6 +83,93 @@ def preprocess_for_eval(image, output_height, output_width):
     return tf.image.per_image_standardization(resized_image)
 
 
+def _random_per_example(images, minval, maxval):
+    # One value per image of a batch, broadcastable against it.
+    return tf.random.uniform([tf.shape(images)[0], 1, 1, 1], minval, maxval)
+
+
+def _random_crop_indices(batch_size, size, output_size, flip=None):
+    """Random window positions along one axis of a padded batch.
+
+  Returns:
+    A [batch_size, output_size] int32 `Tensor` of indices into an axis of
+    length `size`, reversed for images where `flip` is True.
+  """
+    offsets = tf.random.uniform([batch_size, 1],
+                                maxval=size - output_size + 1,
+                                dtype=tf.int32)
+    positions = tf.range(output_size)
+    if flip is not None:
+        positions = tf.where(flip[:, tf.newaxis],
+                             output_size - 1 - positions, positions)
+    return offsets + positions
+
+
+def preprocess_batch_for_train(images,
+                               output_height,
+                               output_width,
+                               padding=_PADDING):
+    """Preprocesses a batch of images for training.
+
+  Equivalent to `preprocess_for_train` applied to every image, with crops,
+  flips, brightness and contrast drawn per image, but as a few batched ops.
+  Crops and flips are a single gather of rows and one of columns.
+
+  Args:
+    images: A [batch, height, width, 3] `Tensor`, for example uint8.
+    output_height: The height of the images after preprocessing.
+    output_width: The width of the images after preprocessing.
+    padding: The amound of padding before and after each dimension of the
+      images.
+
+  Returns:
+    A batch of preprocessed images.
+  """
+    images = tf.cast(images, tf.float32)
+    if padding > 0:
+        images = tf.pad(images,
+                        [[0, 0], [padding, padding], [padding, padding], [0, 0]])
+    shape = tf.shape(images)
+    batch_size = shape[0]
+    flip = tf.random.uniform([batch_size]) < 0.5
+    rows = _random_crop_indices(batch_size, shape[1], output_height)
+    cols = _random_crop_indices(batch_size, shape[2], output_width, flip)
+    images = tf.gather(images, rows, axis=1, batch_dims=1)
+    images = tf.gather(images, cols, axis=2, batch_dims=1)
+
+    images += _random_per_example(images, -63.0, 63.0)
+    mean = tf.reduce_mean(images, axis=[1, 2], keepdims=True)
+    images = (images - mean) * _random_per_example(images, 0.2, 1.8) + mean
+    # Subtract off the mean and divide by the variance of each image.
+    return tf.image.per_image_standardization(images)
+
+
+def preprocess_batch_for_eval(images, output_height, output_width):
+    """Preprocesses a batch of images for evaluation.
+
+  Args:
+    images: A [batch, height, width, 3] `Tensor`.
+    output_height: The height of the images after preprocessing.
+    output_width: The width of the images after preprocessing.
+
+  Returns:
+    A batch of preprocessed images.
+  """
+    images = tf.cast(images, tf.float32)
+    if images.shape[1:3] != (output_height, output_width):
+        images = tf.image.resize_with_crop_or_pad(images, output_height,
+                                                  output_width)
+    return tf.image.per_image_standardization(images)
+
+
+def preprocess_batch(images, output_height, output_width, is_training=False):
+    """Preprocesses a batch of images, see `preprocess_image`."""
+    if is_training:
+        return preprocess_batch_for_train(images, output_height, output_width)
+    else:
+        return preprocess_batch_for_eval(images, output_height, output_width)
+
+
 def preprocess_image(image, output_height, output_width, is_training=False):
     """Preprocesses the given image.
 
@@ -0,0 +1,41 @@
+import numpy as np
+import tensorflow as tf
+from riptide.utils.preprocessing.cifarnet_preprocessing import (
+    preprocess_batch_for_train, preprocess_batch_for_eval)
+
+
+class CifarnetPreprocessingTest(tf.test.TestCase):
+    def test_batch_crops_are_windows_of_padded_images(self):
+        # Gray images, so per channel contrast is the same affine map on
+        # every pixel and undone by standardization, as is brightness.
+        images = np.random.RandomState(0).randint(0, 255, [16, 32, 32, 1])
+        images = np.tile(images, [1, 1, 1, 3]).astype(np.uint8)
+        padded = np.pad(images, [[0, 0], [4, 4], [4, 4], [0, 0]])
+        crops = preprocess_batch_for_train(images, 32, 32).numpy()
+        self.assertEqual(crops.shape, (16, 32, 32, 3))
+        for image, crop in zip(padded, crops):
+            # The crop matches exactly one window, possibly flipped.
+            matches = [
+                np.allclose(crop, window, atol=1e-3)
+                for y in range(9) for x in range(9)
+                for window in self._standardized_windows(image, y, x)
+            ]
+            self.assertEqual(sum(matches), 1)
+
+    def _standardized_windows(self, image, y, x):
+        window = image[y:y + 32, x:x + 32].astype(np.float32)
+        for w in (window, window[:, ::-1]):
+            yield tf.image.per_image_standardization(w).numpy()
+
+    def test_batch_eval_matches_per_image(self):
+        images = np.random.RandomState(0).randint(
+            0, 255, [4, 32, 32, 3]).astype(np.uint8)
+        batch = preprocess_batch_for_eval(images, 32, 32)
+        for image, expected in zip(images, batch):
+            self.assertAllClose(
+                tf.image.per_image_standardization(
+                    tf.cast(image, tf.float32)), expected)
+
+
+if __name__ == '__main__':
+    tf.test.main()
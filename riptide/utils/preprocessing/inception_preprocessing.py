@@ -96,6 +96,154 @@ def distort_color(image, color_ordering=0, fast_mode=True):
         return tf.clip_by_value(image, 0.0, 1.0)
 
 
+def _random_per_example(images, minval, maxval):
+    # One value per example, broadcasting over height, width and channels.
+    return tf.random.uniform([tf.shape(images)[0], 1, 1, 1],
+                             minval,
+                             maxval,
+                             dtype=images.dtype)
+
+
+def _adjust_hsv_batch(images, hue_delta=None, saturation_factor=None):
+    hue, saturation, value = tf.unstack(
+        tf.image.rgb_to_hsv(tf.clip_by_value(images, 0.0, 1.0)), axis=-1)
+    if hue_delta is not None:
+        hue = tf.math.floormod(hue + hue_delta[..., 0], 1.0)
+    if saturation_factor is not None:
+        saturation = tf.clip_by_value(
+            saturation * saturation_factor[..., 0], 0.0, 1.0)
+    return tf.image.hsv_to_rgb(tf.stack([hue, saturation, value], axis=-1))
+
+
+def distort_color_batch(images, fast_mode=True):
+    """Distorts the color of a batch of images with vectorized ops.
+
+  Applies the distortions of `distort_color` with independent random
+  parameters for every example, but as a few ops over the whole batch
+  instead of a graph per example. Without fast_mode one of the four
+  orderings of `distort_color` is sampled per batch rather than per example,
+  which avoids computing every ordering.
+
+  Args:
+    images: 4-D float Tensor of images in [0, 1].
+    fast_mode: Only distort brightness and saturation, in ordering 0.
+  Returns:
+    4-D Tensor of color-distorted images in [0, 1].
+  """
+    with tf.name_scope('distort_color_batch'):
+        brightness = _random_per_example(images, -32. / 255., 32. / 255.)
+        saturation = _random_per_example(images, 0.5, 1.5)
+        hue = _random_per_example(images, -0.2, 0.2)
+        contrast = _random_per_example(images, 0.5, 1.5)
+
+        def adjust_brightness(x):
+            return x + brightness
+
+        def adjust_saturation(x):
+            return _adjust_hsv_batch(x, saturation_factor=saturation)
+
+        def adjust_hue(x):
+            return _adjust_hsv_batch(x, hue_delta=hue)
+
+        def adjust_contrast(x):
+            mean = tf.reduce_mean(x, axis=[1, 2], keepdims=True)
+            return (x - mean) * contrast + mean
+
+        orderings = [
+            [adjust_brightness, adjust_saturation, adjust_hue,
+             adjust_contrast],
+            [adjust_saturation, adjust_brightness, adjust_contrast,
+             adjust_hue],
+            [adjust_contrast, adjust_hue, adjust_brightness,
+             adjust_saturation],
+            [adjust_hue, adjust_saturation, adjust_contrast,
+             adjust_brightness],
+        ]
+
+        def distort(ordering):
+            def distort_fn():
+                x = images
+                for adjust in ordering:
+                    x = adjust(x)
+                return x
+
+            return distort_fn
+
+        if fast_mode:
+            images = distort([adjust_brightness, adjust_saturation])()
+        else:
+            selector = tf.random.uniform([], maxval=4, dtype=tf.int32)
+            images = tf.switch_case(selector,
+                                    [distort(o) for o in orderings])
+        return tf.clip_by_value(images, 0.0, 1.0)
+
+
+def augment_batch(images, is_training, fast_mode=True):
+    """Random color distortion and flips of a batch, scaled to [-1, 1].
+
+  The last step of `preprocess_image` for batches of crops that were
+  already resized, for example the uint8 batches of `imagerecord_dataset`
+  with `device_augment`. It only uses batch ops, so it can run on the
+  accelerator as part of the training step.
+
+  Args:
+    images: 4-D uint8 Tensor, or float Tensor in [0, 1].
+    is_training: Boolean, distort and flip only when training.
+    fast_mode: See `distort_color_batch`.
+  Returns:
+    4-D float32 Tensor in [-1, 1].
+  """
+    with tf.name_scope('augment_batch'):
+        images = tf.image.convert_image_dtype(images, tf.float32)
+        if is_training:
+            images = distort_color_batch(images, fast_mode)
+            flip = _random_per_example(images, 0.0, 1.0) < 0.5
+            images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+        return (images - 0.5) * 2.0
+
+
+def sample_distorted_crop_window(image_shape,
+                                 bbox,
+                                 min_object_covered=0.1,
+                                 aspect_ratio_range=(0.75, 1.33),
+                                 area_range=(0.05, 1.0),
+                                 max_attempts=100):
+    """Samples the crop window used by `distorted_bounding_box_crop`.
+
+  Only the shape of the image is needed, which lets the crop be fused into
+  JPEG decoding with `tf.image.decode_and_crop_jpeg`.
+
+  Args:
+    image_shape: 1-D int32 Tensor [height, width, channels].
+    bbox: See `distorted_bounding_box_crop`.
+    min_object_covered: See `distorted_bounding_box_crop`.
+    aspect_ratio_range: See `distorted_bounding_box_crop`.
+    area_range: See `distorted_bounding_box_crop`.
+    max_attempts: See `distorted_bounding_box_crop`.
+  Returns:
+    A tuple of the crop begin and size, as for `tf.slice`, and the distorted
+    bbox.
+  """
+    # Each bounding box has shape [1, num_boxes, box coords] and
+    # the coordinates are ordered [ymin, xmin, ymax, xmax].
+
+    # A large fraction of image datasets contain a human-annotated bounding
+    # box delineating the region of the image containing the object of interest.
+    # We choose to create a new bounding box for the object which is a randomly
+    # distorted version of the human-annotated bounding box that obeys an
+    # allowed range of aspect ratios, sizes and overlap with the human-annotated
+    # bounding box. If no box is supplied, then we assume the bounding box is
+    # the entire image.
+    return tf.image.sample_distorted_bounding_box(
+        image_shape,
+        bounding_boxes=bbox,
+        min_object_covered=min_object_covered,
+        aspect_ratio_range=aspect_ratio_range,
+        area_range=area_range,
+        max_attempts=max_attempts,
+        use_image_if_no_bounding_boxes=True)
+
+
 def distorted_bounding_box_crop(image,
                                 bbox,
                                 min_object_covered=0.1,
@@ -126,31 +274,146 @@ def distorted_bounding_box_crop(image,
     A tuple, a 3-D Tensor cropped_image and the distorted bbox
   """
     with tf.name_scope('distorted_bounding_box_crop'):
-        # Each bounding box has shape [1, num_boxes, box coords] and
-        # the coordinates are ordered [ymin, xmin, ymax, xmax].
-
-        # A large fraction of image datasets contain a human-annotated bounding
-        # box delineating the region of the image containing the object of interest.
-        # We choose to create a new bounding box for the object which is a randomly
-        # distorted version of the human-annotated bounding box that obeys an
-        # allowed range of aspect ratios, sizes and overlap with the human-annotated
-        # bounding box. If no box is supplied, then we assume the bounding box is
-        # the entire image.
-        sample_distorted_bounding_box = tf.image.sample_distorted_bounding_box(
-            tf.shape(image),
-            bounding_boxes=bbox,
-            min_object_covered=min_object_covered,
-            aspect_ratio_range=aspect_ratio_range,
-            area_range=area_range,
-            max_attempts=max_attempts,
-            use_image_if_no_bounding_boxes=True)
-        bbox_begin, bbox_size, distort_bbox = sample_distorted_bounding_box
+        bbox_begin, bbox_size, distort_bbox = sample_distorted_crop_window(
+            tf.shape(image), bbox, min_object_covered, aspect_ratio_range,
+            area_range, max_attempts)
 
         # Crop the image to the specified bounding box.
         cropped_image = tf.slice(image, bbox_begin, bbox_size)
         return cropped_image, distort_bbox
 
 
+# Downscaling factors libjpeg can apply while decoding, by skipping high
+# frequency DCT coefficients.
+DCT_RATIOS = (1, 2, 4, 8)
+
+# Pixels decoded around a crop window. libjpeg upsamples subsampled chroma
+# as if the image ended at the window, which changes its border pixels.
+CROP_MARGIN = 2
+
+
+def decode_and_crop_jpeg(image_buffer, crop_window, ratio=1):
+    """Decodes a window of a JPEG exactly as cropping the full decode would.
+
+  Args:
+    image_buffer: scalar string Tensor holding an encoded JPEG.
+    crop_window: 1-D int32 Tensor [y, x, height, width] in pixels of the
+      image downscaled by `ratio`.
+    ratio: int, DCT downscaling factor, see `tf.io.decode_jpeg`.
+  Returns:
+    3-D uint8 Tensor of the window.
+  """
+    shape = tf.image.extract_jpeg_shape(image_buffer)[:2]
+    shape = (shape + ratio - 1) // ratio
+    begin, size = crop_window[:2], crop_window[2:]
+    padded_begin = tf.maximum(begin - CROP_MARGIN, 0)
+    padded_end = tf.minimum(begin + size + CROP_MARGIN, shape)
+    image = tf.image.decode_and_crop_jpeg(
+        image_buffer,
+        tf.concat([padded_begin, padded_end - padded_begin], axis=0),
+        channels=3,
+        ratio=ratio)
+    image = tf.slice(image, tf.concat([begin - padded_begin, [0]], axis=0),
+                     tf.concat([size, [-1]], axis=0))
+    image.set_shape([None, None, 3])
+    return image
+
+
+def decode_jpeg_at_scale(image_buffer, min_size, crop_window=None):
+    """Decodes a JPEG at the largest DCT downscale that keeps `min_size`.
+
+  The ratio is picked per image from its header so that both sides of the
+  decoded image, or of the crop, are still at least `min_size` pixels.
+  Images that are already too small are decoded at full resolution.
+
+  Args:
+    image_buffer: scalar string Tensor holding an encoded JPEG.
+    min_size: int, smallest acceptable side of the result.
+    crop_window: optional 1-D int32 Tensor [y, x, height, width] in full
+      resolution pixels, only this region is decoded.
+  Returns:
+    3-D uint8 Tensor, downscaled by 1, 2, 4 or 8.
+  """
+    with tf.name_scope('decode_jpeg_at_scale'):
+        if crop_window is None:
+            size = tf.image.extract_jpeg_shape(image_buffer)[:2]
+        else:
+            size = crop_window[2:]
+        ratios = tf.constant(DCT_RATIOS, dtype=tf.int32)
+        fits = tf.reduce_min(size) // ratios >= min_size
+        index = tf.maximum(tf.reduce_sum(tf.cast(fits, tf.int32)) - 1, 0)
+
+        def decode(ratio):
+            def decode_fn():
+                if crop_window is None:
+                    return tf.io.decode_jpeg(
+                        image_buffer, channels=3, ratio=ratio)
+                # Crop windows address the downscaled image.
+                return decode_and_crop_jpeg(image_buffer,
+                                            crop_window // ratio, ratio)
+
+            return decode_fn
+
+        image = tf.switch_case(index, [decode(r) for r in DCT_RATIOS])
+        image.set_shape([None, None, 3])
+        return image
+
+
+def decode_and_crop_for_train(image_buffer, bbox=None, min_size=None):
+    """Decodes only the randomly distorted crop of a JPEG for training.
+
+  The crop window is sampled as in `distorted_bounding_box_crop` from the
+  shape in the JPEG header, so pixels outside of it are never decoded.
+
+  Args:
+    image_buffer: scalar string Tensor holding an encoded JPEG.
+    bbox: See `preprocess_for_train`, the whole image if None.
+    min_size: optional int, decode at a reduced scale as long as the crop
+      keeps this many pixels per side, see `decode_jpeg_at_scale`.
+  Returns:
+    3-D uint8 Tensor of the cropped image.
+  """
+    with tf.name_scope('decode_and_crop_for_train'):
+        if bbox is None:
+            bbox = tf.constant(
+                [0.0, 0.0, 1.0, 1.0], dtype=tf.float32, shape=[1, 1, 4])
+        shape = tf.image.extract_jpeg_shape(image_buffer)
+        bbox_begin, bbox_size, _ = sample_distorted_crop_window(shape, bbox)
+        offset_y, offset_x, _ = tf.unstack(bbox_begin)
+        target_height, target_width, _ = tf.unstack(bbox_size)
+        crop_window = tf.stack(
+            [offset_y, offset_x, target_height, target_width])
+        if min_size:
+            return decode_jpeg_at_scale(image_buffer, min_size, crop_window)
+        return decode_and_crop_jpeg(image_buffer, crop_window)
+
+
+def decode_and_crop_for_eval(image_buffer, central_fraction=0.875,
+                             min_size=None):
+    """Decodes only the central crop of a JPEG for evaluation.
+
+  The window matches `tf.image.central_crop` as used by
+  `preprocess_for_eval`.
+
+  Args:
+    image_buffer: scalar string Tensor holding an encoded JPEG.
+    central_fraction: Float, fraction of the image to keep.
+    min_size: optional int, see `decode_and_crop_for_train`.
+  Returns:
+    3-D uint8 Tensor of the cropped image.
+  """
+    with tf.name_scope('decode_and_crop_for_eval'):
+        shape = tf.image.extract_jpeg_shape(image_buffer)
+        fraction_offset = int(1 / ((1 - central_fraction) / 2.0))
+        start = tf.cast(
+            tf.cast(shape[:2], tf.float64) / fraction_offset, tf.int32)
+        crop_size = shape[:2] - 2 * start
+        crop_window = tf.concat([start, crop_size], axis=0)
+        if min_size:
+            return decode_jpeg_at_scale(image_buffer, min_size, crop_window)
+        return decode_and_crop_jpeg(image_buffer, crop_window)
+
+
 def preprocess_for_train(image, height, width, bbox, fast_mode=True):
     """Distort one image for training a network.
 
@@ -0,0 +1,129 @@
+import numpy as np
+import tensorflow as tf
+from riptide.utils.preprocessing.inception_preprocessing import (
+    augment_batch, distort_color_batch, decode_and_crop_for_eval, decode_and_crop_for_train, decode_jpeg_at_scale,
+    preprocess_for_eval)
+
+
+def _encode(height, width, seed=0):
+    image = np.random.RandomState(seed).randint(0, 256, [height, width, 3])
+    return tf.io.encode_jpeg(image.astype(np.uint8))
+
+
+def _find_window(image, window):
+    height, width = window.shape[:2]
+    for y in range(image.shape[0] - height + 1):
+        for x in range(image.shape[1] - width + 1):
+            if np.array_equal(image[y:y + height, x:x + width], window):
+                return y, x
+    return None
+
+
+class DecodeAndCropTest(tf.test.TestCase):
+    def test_eval_crop_matches_preprocess_for_eval(self):
+        # Odd sizes and windows not aligned to JPEG blocks or chroma samples.
+        for height, width in [(97, 131), (333, 500), (480, 640)]:
+            image_buffer = _encode(height, width)
+            image = tf.io.decode_jpeg(image_buffer, channels=3)
+            crop = decode_and_crop_for_eval(image_buffer)
+            for size in [None, 224]:
+                expected = preprocess_for_eval(image, size, size)
+                actual = preprocess_for_eval(
+                    crop, size, size, central_fraction=None)
+                self.assertAllClose(expected, actual, rtol=0, atol=4e-7)
+
+    def test_train_crop_is_window_of_image(self):
+        image_buffer = _encode(61, 83)
+        image = tf.io.decode_jpeg(image_buffer, channels=3).numpy()
+        for _ in range(10):
+            crop = decode_and_crop_for_train(image_buffer).numpy()
+            height, width, channels = crop.shape
+            self.assertEqual(channels, 3)
+            self.assertBetween(height, 1, 61)
+            self.assertBetween(width, 1, 83)
+            # At least the smallest area of the sampled window, up to
+            # rounding of its sides.
+            self.assertGreaterEqual((height + 1) * (width + 1),
+                                    0.05 * 61 * 83)
+            self.assertIsNotNone(_find_window(image, crop))
+
+
+class DecodeJpegAtScaleTest(tf.test.TestCase):
+    def setUp(self):
+        self.image_buffer = _encode(400, 300)
+
+    def test_ratio_choice(self):
+        # The short side of 300 allows ratios 1, 2, 4 and 8 down to sizes of
+        # 300, 150, 75 and 37.
+        for min_size, ratio in [(30, 8), (37, 8), (38, 4), (75, 4), (76, 2),
+                                (150, 2), (151, 1), (300, 1)]:
+            image = decode_jpeg_at_scale(self.image_buffer, min_size)
+            expected = tf.io.decode_jpeg(
+                self.image_buffer, channels=3, ratio=ratio)
+            self.assertAllEqual(expected, image)
+            self.assertGreaterEqual(min(image.shape[:2]), min_size)
+
+    def test_small_image_is_decoded_fully(self):
+        image = decode_jpeg_at_scale(self.image_buffer, 500)
+        self.assertAllEqual(
+            tf.io.decode_jpeg(self.image_buffer, channels=3), image)
+
+    def test_crop_window(self):
+        # A 203x163 window at (41, 82) is 50x40 pixels at (10, 20) once
+        # downscaled by 4.
+        crop_window = tf.constant([41, 82, 203, 163])
+        full = tf.io.decode_jpeg(self.image_buffer, channels=3, ratio=4)
+        image = decode_jpeg_at_scale(self.image_buffer, 40, crop_window)
+        self.assertAllEqual(full[10:60, 20:60], image)
+
+        # Too small a window for any downscale.
+        image = decode_jpeg_at_scale(self.image_buffer, 200, crop_window)
+        full = tf.io.decode_jpeg(self.image_buffer, channels=3)
+        self.assertAllEqual(full[41:244, 82:245], image)
+
+
+class AugmentBatchTest(tf.test.TestCase):
+    def setUp(self):
+        tf.random.set_seed(0)
+        # Gray images are left alone by hue and saturation, and a ramp
+        # from left to right shows whether an image was flipped.
+        ramp = np.linspace(0.3, 0.7, 16, dtype=np.float32)
+        self.ramps = np.tile(ramp[None, None, :, None], [64, 8, 1, 3])
+
+    def test_range(self):
+        images = np.random.RandomState(0).randint(0, 256, [32, 16, 16, 3])
+        images = images.astype(np.uint8)
+        for fast_mode in [True, False]:
+            distorted = distort_color_batch(
+                tf.image.convert_image_dtype(images, tf.float32), fast_mode)
+            self.assertAllInRange(distorted, 0.0, 1.0)
+            augmented = augment_batch(images, True, fast_mode)
+            self.assertEqual(augmented.dtype, tf.float32)
+            self.assertAllInRange(augmented, -1.0, 1.0)
+
+    def test_parameters_per_example(self):
+        distorted = distort_color_batch(self.ramps).numpy()
+        # Only the brightness changes gray images, by one offset per image.
+        offsets = distorted - self.ramps
+        self.assertAllClose(offsets, np.broadcast_to(
+            offsets[:, :1, :1, :1], offsets.shape), atol=1e-5)
+        offsets = offsets[:, 0, 0, 0]
+        self.assertAllInRange(offsets, -32. / 255. - 1e-5, 32. / 255. + 1e-5)
+        self.assertEqual(len(np.unique(np.round(offsets, 5))), 64)
+
+    def test_flip(self):
+        augmented = augment_batch(self.ramps, True).numpy()
+        steps = np.diff(augmented[:, 0, :, 0], axis=1)
+        increasing = np.all(steps > 0, axis=1)
+        decreasing = np.all(steps < 0, axis=1)
+        # Every image is either kept or mirrored, each independently.
+        self.assertTrue(np.all(increasing != decreasing))
+        self.assertBetween(int(np.sum(decreasing)), 16, 48)
+
+    def test_eval_is_not_augmented(self):
+        augmented = augment_batch(self.ramps, False)
+        self.assertAllClose((self.ramps - 0.5) * 2.0, augmented)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,174 @@
+"""Per layer latency and memory profiling of riptide models."""
+import json
+import time
+import numpy as np
+import tensorflow as tf
+from riptide.utils.cost_model import layer_cost
+from riptide.utils.recording import record_layers
+
+
+def _shape(structure):
+    shapes = [
+        t.shape.as_list() for t in tf.nest.flatten(structure)
+        if isinstance(t, (tf.Tensor, tf.Variable))
+    ]
+    return shapes[0] if len(shapes) == 1 else shapes
+
+
+def _nbytes(structure):
+    return sum(
+        t.shape.num_elements() * t.dtype.size
+        for t in tf.nest.flatten(structure)
+        if isinstance(t, (tf.Tensor, tf.Variable)))
+
+
+def _block(structure):
+    # Reading back one element waits for the whole tensor to be computed,
+    # which makes timings of asynchronous devices accurate.
+    for t in tf.nest.flatten(structure):
+        if isinstance(t, tf.Tensor) and t.shape.num_elements():
+            tf.reshape(t, [-1])[0].numpy()
+
+
+def _time(fn, args, kwargs, warmup, repeats):
+    for _ in range(warmup):
+        _block(fn(*args, **kwargs))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _block(fn(*args, **kwargs))
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+class ProfileResult(object):
+    """Per layer measurements of a model.
+
+    Parameters
+    ----------
+    layers : list of dict
+        One entry per executed leaf layer in execution order with keys
+        name, type, input_shape, output_shape, time_ms, flops, bitops,
+        activation_bytes and weight_bytes.
+    total_ms : float
+        Latency of the whole model.
+    mode : str
+        'eager' or 'graph'.
+    """
+
+    def __init__(self, layers, total_ms, mode):
+        self.layers = layers
+        self.total_ms = total_ms
+        self.mode = mode
+
+    def to_dict(self):
+        return {
+            'mode': self.mode,
+            'total_ms': self.total_ms,
+            'layers': self.layers,
+        }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def table(self):
+        header = '%-32s %-26s %-20s %10s %6s %12s %12s %10s %10s' % (
+            'layer', 'type', 'output', 'time(ms)', '%', 'MFLOPs',
+            'Mbitops', 'act(KB)', 'wgt(KB)')
+        lines = [header, '-' * len(header)]
+        layer_total = sum(l['time_ms'] for l in self.layers) or 1.0
+        for l in self.layers:
+            lines.append(
+                '%-32s %-26s %-20s %10.3f %6.1f %12.2f %12.2f %10.1f %10.1f' %
+                (l['name'][-32:], l['type'][:26], str(l['output_shape'])[:20],
+                 l['time_ms'], 100.0 * l['time_ms'] / layer_total,
+                 l['flops'] / 1e6, l['bitops'] / 1e6,
+                 l['activation_bytes'] / 1024.0,
+                 l['weight_bytes'] / 1024.0))
+        lines.append('-' * len(header))
+        lines.append('%-32s %-26s %-20s %10.3f' % ('sum of layers', '', '',
+                                                   layer_total))
+        lines.append('%-32s %-26s %-20s %10.3f' % ('whole model (%s)' %
+                                                   self.mode, '', '',
+                                                   self.total_ms))
+        return '\n'.join(lines)
+
+
+def profile_model(model,
+                  inputs,
+                  mode='eager',
+                  warmup=2,
+                  repeats=10,
+                  training=False):
+    """Measures latency, operations and memory of every layer of a model.
+
+    The model is first run once eagerly to record the inputs of every leaf
+    layer. Each layer is then timed on its recorded inputs, in 'eager' mode
+    op by op and in 'graph' mode compiled into its own `tf.function`.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Model to profile, for example from `get_model`.
+    inputs : array or Tensor
+        Input batch, synthetic or real.
+    mode : str
+        'eager' or 'graph'.
+    warmup : int
+        Untimed runs before measuring.
+    repeats : int
+        Timed runs, the median is reported.
+    training : bool
+        Training argument passed to the model.
+
+    Returns
+    -------
+    ProfileResult
+
+    Example
+    -------
+    with Config(actQ=DQuantize, weightQ=XQuantize, bits=2.0):
+        model = get_model('vggnet')
+    result = profile_model(model, np.zeros([1, 224, 224, 3], np.float32))
+    print(result.table())
+    """
+    if mode not in ('eager', 'graph'):
+        raise ValueError('mode must be eager or graph, got %s.' % mode)
+    inputs = tf.convert_to_tensor(inputs)
+
+    def compile_fn(fn):
+        return tf.function(fn) if mode == 'graph' else fn
+
+    claimed = set()
+    results = []
+    for name, layer, recorder in record_layers(model, inputs, training):
+        weight_bytes = 0
+        for weight in layer.weights:
+            if id(weight) not in claimed:
+                claimed.add(id(weight))
+                weight_bytes += _nbytes(weight)
+        input_shape = _shape(recorder.args[0])
+        output_shape = _shape(recorder.outputs)
+        cost = layer_cost(layer, recorder.args[0], recorder.outputs)
+        elapsed = _time(
+            compile_fn(recorder.original_call), recorder.args,
+            recorder.kwargs, warmup, repeats)
+        results.append({
+            'name': name,
+            'type': type(layer).__name__,
+            'input_shape': input_shape,
+            'output_shape': output_shape,
+            'time_ms': 1000.0 * elapsed,
+            'flops': 2 * cost.macs + cost.elementwise_ops,
+            'bitops': cost.bitops,
+            'activation_bytes': _nbytes(recorder.outputs),
+            'weight_bytes': weight_bytes,
+        })
+
+    model_fn = compile_fn(lambda x: model(x, training=training))
+    total = _time(model_fn, (inputs, ), {}, warmup, repeats)
+    return ProfileResult(results, 1000.0 * total, mode)
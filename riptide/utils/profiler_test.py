@@ -0,0 +1,81 @@
+import numpy as np
+import tensorflow as tf
+from riptide.utils.profiler import profile_model
+
+
+def _model():
+    inputs = tf.keras.Input([8, 8, 3])
+    x = tf.keras.layers.Conv2D(4, 3, padding='same', name='conv')(inputs)
+    x = tf.keras.layers.BatchNormalization(name='bn')(x)
+    x = tf.keras.layers.GlobalAveragePooling2D(name='pool')(x)
+    x = tf.keras.layers.Dense(5, name='dense')(x)
+    return tf.keras.Model(inputs, x)
+
+
+class SubclassedModel(tf.keras.Model):
+    def __init__(self):
+        super(SubclassedModel, self).__init__()
+        self.conv = tf.keras.layers.Conv2D(4, 3, padding='same')
+        self.pool = tf.keras.layers.GlobalAveragePooling2D()
+        self.dense = tf.keras.layers.Dense(5)
+
+    def call(self, x, training=None):
+        return self.dense(self.pool(self.conv(x)))
+
+
+class ProfilerTest(tf.test.TestCase):
+    def setUp(self):
+        self.images = np.random.uniform(size=[2, 8, 8, 3]).astype(np.float32)
+
+    def test_layer_timings(self):
+        model = SubclassedModel()
+        expected = model(self.images)
+        for mode in ['eager', 'graph']:
+            result = profile_model(
+                model, self.images, mode=mode, warmup=1, repeats=2)
+            self.assertEqual(result.mode, mode)
+            self.assertEqual([l['name'] for l in result.layers],
+                             ['conv', 'pool', 'dense'])
+            for layer in result.layers:
+                self.assertGreater(layer['time_ms'], 0)
+            self.assertEqual(result.layers[0]['output_shape'], [2, 8, 8, 4])
+            self.assertEqual(result.layers[2]['output_shape'], [2, 5])
+            self.assertEqual(result.layers[2]['weight_bytes'], (4 * 5 + 5) * 4)
+            self.assertGreater(result.total_ms, 0)
+            self.assertIn('whole model (%s)' % mode, result.table())
+        self.assertAllClose(expected, model(self.images))
+
+    def test_call_is_restored(self):
+        model = SubclassedModel()
+        layers = [model.conv, model.pool, model.dense]
+        profile_model(model, self.images, warmup=0, repeats=1)
+        for layer in layers:
+            self.assertNotIn('call', vars(layer))
+            self.assertEqual(layer.call.__func__, type(layer).call)
+
+    def test_functional_model(self):
+        model = _model()
+        profile_model(model, self.images, warmup=0, repeats=1)
+        for layer in model.layers:
+            self.assertNotIn('call', vars(layer))
+
+    def test_call_is_restored_on_error(self):
+        model = SubclassedModel()
+        model(self.images)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('boom')
+
+        model.pool.call = fail
+        with self.assertRaises(RuntimeError):
+            profile_model(model, self.images, warmup=0, repeats=1)
+        self.assertIs(model.pool.call, fail)
+        self.assertNotIn('call', vars(model.conv))
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            profile_model(_model(), self.images, mode='lazy')
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,159 @@
+"""Index files locating every example of a TFRecord shard.
+
+The index of a shard is a [num_records, 2] int64 numpy array holding the
+byte offset and length of each serialized example, skipping the length and
+checksum framing of the TFRecord format. It is stored next to the records
+as index/<shard>.npy so it does not match the <split>* pattern of readers.
+
+Indices are written by `tf_record_writer`, records written by other tools
+can be indexed with
+
+    python -m riptide.utils.record_index /data/imagenet/tfrecords
+"""
+import os
+import struct
+import threading
+import numpy as np
+import tensorflow as tf
+
+from absl import app
+from absl import logging
+
+# Every record is framed by a uint64 length and its uint32 checksum before
+# the data and a uint32 checksum of the data after it.
+_HEADER_BYTES = 12
+_FOOTER_BYTES = 4
+
+
+def record_files(pattern):
+    """Sorted record files matching a glob pattern.
+
+    Directories, such as the index directory, and the metadata and unfinished
+    `.partial` files written next to the records are skipped.
+    """
+    return sorted(
+        f for f in tf.io.gfile.glob(pattern)
+        if not tf.io.gfile.isdir(f) and not f.endswith(
+            ('.json', '.jsonl', '.partial')))
+
+
+def index_path(record_file):
+    directory, name = os.path.split(record_file)
+    return os.path.join(directory, 'index', name + '.npy')
+
+
+def save_index(path, index):
+    tf.io.gfile.makedirs(os.path.dirname(path))
+    partial = path + '.partial'
+    with tf.io.gfile.GFile(partial, 'wb') as f:
+        np.save(f, index)
+    tf.io.gfile.rename(partial, path, overwrite=True)
+
+
+class IndexBuilder(object):
+    """Tracks record positions while a shard is written.
+
+    Example
+    -------
+    builder = IndexBuilder()
+    with tf.io.TFRecordWriter(filename) as writer:
+        for example in examples:
+            data = example.SerializeToString()
+            writer.write(data)
+            builder.add(len(data))
+    save_index(index_path(filename), builder.to_array())
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.position = 0
+
+    def add(self, length):
+        self.entries.append((self.position + _HEADER_BYTES, length))
+        self.position += _HEADER_BYTES + length + _FOOTER_BYTES
+
+    def to_array(self):
+        return np.array(self.entries, dtype=np.int64).reshape([-1, 2])
+
+
+def build_index(record_file):
+    """Indexes an existing shard by reading only the framing of records."""
+    builder = IndexBuilder()
+    size = tf.io.gfile.stat(record_file).length
+    with tf.io.gfile.GFile(record_file, 'rb') as f:
+        while builder.position < size:
+            f.seek(builder.position)
+            length, = struct.unpack('<Q', f.read(8))
+            builder.add(length)
+    if builder.position != size:
+        raise ValueError('%s ends in a truncated record.' % record_file)
+    return builder.to_array()
+
+
+def load_index(record_file):
+    """Loads the index of a shard, building it if it was never written."""
+    path = index_path(record_file)
+    if tf.io.gfile.exists(path):
+        with tf.io.gfile.GFile(path, 'rb') as f:
+            return np.load(f)
+    logging.warning('No index for %s, scanning it.' % record_file)
+    return build_index(record_file)
+
+
+class RecordReader(object):
+    """Reads serialized examples at indexed positions of record files.
+
+    Local files stay open and are read with `os.pread`, which does not move
+    a shared file position and releases the GIL, so one reader can serve
+    many tf.data threads. Other filesystems are read through `tf.io.gfile`.
+
+    Parameters
+    ----------
+    files : list of str
+        Record files, addressed by their position in this list.
+    """
+
+    def __init__(self, files):
+        self.files = list(files)
+        self._fds = {}
+        self._lock = threading.Lock()
+
+    def _fd(self, file_id):
+        fd = self._fds.get(file_id)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(file_id)
+                if fd is None:
+                    fd = os.open(self.files[file_id], os.O_RDONLY)
+                    self._fds[file_id] = fd
+        return fd
+
+    def read(self, file_id, offset, length):
+        path = self.files[file_id]
+        if '://' in path:
+            with tf.io.gfile.GFile(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        return os.pread(self._fd(int(file_id)), int(length), int(offset))
+
+    def close(self):
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds = {}
+
+    def __del__(self):
+        self.close()
+
+
+def main(argv):
+    if len(argv) != 2:
+        raise app.UsageError('Usage: record_index.py <record_path>')
+    for record_file in record_files(os.path.join(argv[1], '*')):
+        index = build_index(record_file)
+        save_index(index_path(record_file), index)
+        logging.info('Indexed %d records of %s.' % (len(index), record_file))
+
+
+if __name__ == '__main__':
+    app.run(main)
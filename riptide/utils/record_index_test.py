@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import tensorflow as tf
+from riptide.utils.datasets import indexed_record_dataset
+from riptide.utils.record_index import (IndexBuilder, RecordReader,
+                                        build_index, index_path,
+                                        record_files, save_index)
+
+
+def _example(value):
+    image = tf.io.encode_jpeg(np.full([8, 8, 3], value, np.uint8)).numpy()
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                'image':
+                tf.train.Feature(bytes_list=tf.train.BytesList(value=[image])),
+                'label':
+                tf.train.Feature(int64_list=tf.train.Int64List(value=[value])),
+            })).SerializeToString()
+
+
+class RecordIndexTest(tf.test.TestCase):
+    def setUp(self):
+        self.root = os.path.join(self.get_temp_dir(), 'records')
+        os.makedirs(self.root, exist_ok=True)
+        self.records = []
+        for shard in range(3):
+            filename = os.path.join(self.root, 'train-%d' % shard)
+            builder = IndexBuilder()
+            with tf.io.TFRecordWriter(filename) as writer:
+                for i in range(7 + shard):
+                    data = _example(len(self.records))
+                    writer.write(data)
+                    builder.add(len(data))
+                    self.records.append(data)
+            # The last shard is left for the reader to scan.
+            if shard < 2:
+                save_index(index_path(filename), builder.to_array())
+
+    def test_index_reads_records(self):
+        filename = os.path.join(self.root, 'train-0')
+        index = build_index(filename)
+        self.assertEqual(len(index), 7)
+        reader = RecordReader([filename])
+        self.assertEqual([reader.read(0, o, l) for o, l in index],
+                         self.records[:7])
+
+    def _labels(self, **kwargs):
+        ds = indexed_record_dataset(
+            self.root,
+            1,
+            preprocess=lambda image: image[0, 0, 0],
+            seed=1,
+            **kwargs)
+        return [int(label) for _, label in ds]
+
+    def test_global_shuffle_and_resume(self):
+        labels = self._labels(epochs=2)
+        total = len(self.records)
+        self.assertCountEqual(labels[:total], range(total))
+        self.assertCountEqual(labels[total:], range(total))
+        self.assertNotEqual(labels[:total], list(range(total)))
+        self.assertNotEqual(labels[:total], labels[total:])
+        resumed = self._labels(epochs=1, start_example=total + 5)
+        self.assertEqual(resumed, labels[total + 5:])
+        shards = [
+            self._labels(epochs=2, num_shards=2, shard_index=i)
+            for i in range(2)
+        ]
+        self.assertEqual(shards[0], labels[0::2])
+        self.assertEqual(shards[1], labels[1::2])
+
+    def test_skips_partial_shards(self):
+        # A conversion still writing its next shard.
+        with open(os.path.join(self.root, 'train-3.partial'), 'wb') as f:
+            f.write(b'unfinished')
+        with open(os.path.join(self.root, 'train.json'), 'w') as f:
+            f.write('{}')
+        self.assertEqual(
+            record_files(os.path.join(self.root, 'train*')),
+            [os.path.join(self.root, 'train-%d' % i) for i in range(3)])
+        labels = self._labels(epochs=1)
+        self.assertCountEqual(labels, range(len(self.records)))
+
+
+if __name__ == '__main__':
+    tf.test.main()
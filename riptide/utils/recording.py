@@ -0,0 +1,124 @@
+"""Recording of the leaf layer calls of riptide models."""
+import contextlib
+import itertools
+import tensorflow as tf
+
+
+def leaf_layers(model):
+    """Finds the innermost layers of a model and their attribute paths.
+
+    Nested `tf.keras.Model` blocks and layer lists, as used with
+    `riptide.utils.sequential.forward`, are walked recursively. Every other
+    layer is a leaf, including layers that own sublayers such as the
+    activation of a binary convolution.
+
+    Returns
+    -------
+    list of (str, Layer)
+        Attribute path and layer, each layer appears once.
+    """
+    leaves = []
+    seen = set()
+
+    def visit(path, value):
+        if isinstance(value, tf.keras.layers.Layer):
+            if id(value) in seen:
+                return
+            seen.add(id(value))
+            if isinstance(value, tf.keras.Model):
+                for name, child in vars(value).items():
+                    if not name.startswith('_'):
+                        visit(path + [name], child)
+            else:
+                leaves.append(('/'.join(path), value))
+        elif isinstance(value, (list, tuple)):
+            for i, child in enumerate(value):
+                visit(path + [str(i)], child)
+
+    seen.add(id(model))
+    for name, child in vars(model).items():
+        if not name.startswith('_'):
+            visit([name], child)
+    return leaves
+
+
+class _Recorder(object):
+    """Wraps the call of a layer to record its first call."""
+
+    def __init__(self, layer, counter):
+        self.layer = layer
+        self.original_call = layer.call
+        self.shadowed = 'call' in vars(layer)
+        self.counter = counter
+        self.args = None
+        self.kwargs = None
+        self.outputs = None
+        self.error = None
+        self.order = None
+
+    def __call__(self, *args, **kwargs):
+        # Keras may trace the call of an unbuilt model more than once, only
+        # the first call is kept.
+        if self.args is not None:
+            return self.original_call(*args, **kwargs)
+        self.args = args
+        self.kwargs = kwargs
+        self.order = next(self.counter)
+        try:
+            self.outputs = self.original_call(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+            raise
+        return self.outputs
+
+    def restore(self):
+        # Drop the instance attribute so the class method is found again,
+        # unless the layer had its own call to begin with.
+        if self.shadowed:
+            self.layer.call = self.original_call
+        else:
+            del self.layer.call
+
+
+@contextlib.contextmanager
+def record_calls(model):
+    """Records the first call of every leaf layer while the context is open.
+
+    Yields
+    ------
+    list of (str, Layer, _Recorder)
+        Attribute path, layer and recorder of every leaf layer. Recorders
+        hold the args, kwargs, outputs or error and the execution order of
+        the call, args is None for layers that were not called.
+    """
+    counter = itertools.count()
+    recorded = [(name, layer, _Recorder(layer, counter))
+                for name, layer in leaf_layers(model)]
+    for _, layer, recorder in recorded:
+        layer.call = recorder
+    try:
+        yield recorded
+    finally:
+        for _, _, recorder in recorded:
+            recorder.restore()
+
+
+def called_layers(recorded):
+    """The layers of `record_calls` that were called, in execution order."""
+    return sorted((r for r in recorded if r[2].args is not None),
+                  key=lambda r: r[2].order)
+
+
+def record_layers(model, inputs, training=False):
+    """Runs a model once and records the call of every leaf layer.
+
+    Returns
+    -------
+    list of (str, Layer, _Recorder)
+        Attribute path, layer and its recorded args, kwargs and outputs for
+        every leaf layer that was called, in execution order.
+    """
+    model(inputs, training=training)
+    with record_calls(model) as recorded:
+        model(inputs, training=training)
+    return called_layers(recorded)
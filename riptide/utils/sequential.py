@@ -1,20 +1,47 @@
+import threading
+import contextlib
 import tensorflow as tf
 
+_inline_state = threading.local()
+
+
+@contextlib.contextmanager
+def inline_nested_models():
+    """Calls nested models through their `call` instead of `__call__`.
+
+    When building a functional graph this records the layers inside of
+    blocks such as residual units as individual nodes rather than wrapping
+    each block in a single opaque node.
+    """
+    previous = getattr(_inline_state, 'enabled', False)
+    _inline_state.enabled = True
+    try:
+        yield
+    finally:
+        _inline_state.enabled = previous
+
+
+def _call_layer(l, x):
+    if getattr(_inline_state, 'enabled', False) and isinstance(
+            l, tf.keras.Model):
+        return l.call(x)
+    return l(x)
+
 
 def _forward_core(x, layers):
     for l in layers:
         if isinstance(l, list):
             x = forward_layer_list(x, l)
         else:
-            x = l(x)
+            x = _call_layer(l, x)
     return x
 
 
 def forward_layer_list(x, layers):
     if isinstance(layers[0], str):
-        name = layers.pop(0)
-        with tf.name_scope(name):
-            return _forward_core(x, layers)
+        # Slice rather than pop the name so the tracked list is unmodified.
+        with tf.name_scope(layers[0]):
+            return _forward_core(x, layers[1:])
     else:
         return _forward_core(x, layers)
 
@@ -23,7 +50,7 @@ def forward(x, layer):
     if isinstance(layer, list):
         return forward_layer_list(x, layer)
     else:
-        return layer(x)
+        return _call_layer(layer, x)
 
 
 class Sequential(tf.keras.Model):
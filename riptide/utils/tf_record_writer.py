@@ -1,28 +1,62 @@
+"""Converts an image folder into sharded TFRecords.
+
+Images are read from root/<split>/<label>/<image> and written as examples
+with an encoded JPEG 'image' and an int64 'label', the format read by
+`riptide.utils.datasets.imagerecord_dataset`.
+
+Files are assigned to shards so every shard holds about the same number of
+bytes, which keeps the interleaved readers of a training job evenly busy.
+The assignment is saved to plan-<split>.json on the first run and finished
+shards are appended to progress-<split>.jsonl, rerunning the same command
+after a crash only writes the missing shards. Both are named so they do not
+match the <split>* pattern readers glob for. Every shard also gets a
+`riptide.utils.record_index` sidecar for random access reads.
+
+    python -m riptide.utils.tf_record_writer --root /data/imagenet \
+        --record_path /data/imagenet/tfrecords --split train \
+        --num_shards 1024 --image_size 320
+"""
 import os
+import json
+import time
+import heapq
 import random
-import numpy as np
+import multiprocessing
 import tensorflow as tf
-from multiprocessing import Pool
+from riptide.utils.manifest import load_manifest
+from riptide.utils.record_index import IndexBuilder, index_path, save_index
+
+from absl import app
+from absl import flags
+from absl import logging
 
-FLAGS = tf.flags.FLAGS
+FLAGS = flags.FLAGS
 
-tf.flags.DEFINE_string('root', '/data3/imagenet/',
-                       'Path to dataset to convert to tfrecords.')
-tf.flags.DEFINE_string('record_path', '/data3/imagenet/tfrecords',
-                       'Output path of new tfrecords.')
-tf.flags.DEFINE_string(
+flags.DEFINE_string('root', '/data3/imagenet/',
+                    'Path to dataset to convert to tfrecords.')
+flags.DEFINE_string('record_path', '/data3/imagenet/tfrecords',
+                    'Output path of new tfrecords.')
+flags.DEFINE_string(
     'split', 'train',
-    'Which split to load. This affects both the output record names'
+    'Which split to load. This affects both the output record names '
     'and which images are loaded from root.')
+flags.DEFINE_integer(
+    'image_size', None,
+    'Resize images so their shorter side is at most this many pixels, '
+    'keeping the aspect ratio. Images are copied unchanged if not set.')
+flags.DEFINE_integer('quality', 90,
+                     'JPEG quality of resized or re-encoded images.')
+flags.DEFINE_integer('num_shards', 8, 'Number of record shards to create.')
+flags.DEFINE_integer('num_workers', 8,
+                     'Number of processes writing shards in parallel.')
+flags.DEFINE_integer('seed', 0,
+                     'Seed of the example order within training shards.')
+flags.DEFINE_string(
+    'manifest_cache_path', None,
+    'Where to cache the file listing of the split. Defaults to a file '
+    'under $RIPTIDE_CACHE_DIR or ~/.cache/riptide.')
 
-tf.flags.DEFINE_integer('image_size', None,
-                        'Height and width to resize record examples to.')
-
-tf.flags.DEFINE_integer('num_shards', 8, 'Number of record shards to create.')
-
-tf.flags.DEFINE_integer(
-    'num_workers', 8,
-    'Number of threads to work on creating the record dataset.')
+_JPEG_MAGIC = b'\xff\xd8'
 
 
 def _int64_feature(value):
@@ -33,74 +67,244 @@ def _bytes_feature(value):
     return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
 
 
-# Might be useful for applying some preprocessing on the images.
-# Currently unused.
-def load_image(sess, path, image_size):
-    image_string = tf.read_file(tf.convert_to_tensor(path))
-    image_decoded = tf.image.decode_jpeg(image_string, channels=3)
-    if image_size is not None:
-        image_decoded = tf.image.resize_images(image_decoded,
-                                               [image_size, image_size])
-    image_encoded = tf.image.encode_jpeg(image_decoded)
-    image_np = sess.run(image_encoded)
-    return image_np
-
-
-def load_dataset(root, shuffle):
-    valid_extensions = ('.png', '.jpg', '.jpeg')
-    labels_list = os.listdir(root)
-    labels_list.sort()
-    # Iterate through folders and compose list of files and label
-    samples = []
-    for i, label in enumerate(labels_list):
-        files = os.listdir(os.path.join(root, label))
-        for f in files:
-            # Confirm found files are valid images.
-            if f.lower().endswith(valid_extensions):
-                samples.append((os.path.join(root, label, f), i, label))
-    # Shuffle if specified.
-    if shuffle:
-        random.shuffle(samples)
-    return samples
-
-
-def create_example(sess, sample):
-    filename, label, label_name = sample
-    # Directly read encoded jpeg bytes.
-    image_raw = open(filename, 'rb').read()
-    #image_raw = load_image(sess, filename, FLAGS.image_size)
-    #image_raw = image.tostring()
-    #label_name_raw = label_name.tostring()
-    example = tf.train.Example(
+def plan_shards(samples, sizes, num_shards):
+    """Splits samples into shards of about equal total size.
+
+    Largest files are placed first, each into the currently smallest shard,
+    so shards differ by at most the size of the largest file.
+
+    Returns
+    -------
+    list of list
+        Samples of every shard, in their original relative order.
+    """
+    heap = [(0, shard) for shard in range(num_shards)]
+    assignment = [[] for _ in range(num_shards)]
+    order = sorted(range(len(samples)), key=lambda i: -sizes[i])
+    for i in order:
+        total, shard = heapq.heappop(heap)
+        assignment[shard].append(i)
+        heapq.heappush(heap, (total + sizes[i], shard))
+    return [[samples[i] for i in sorted(indices)] for indices in assignment]
+
+
+def encode_image(image_raw, image_size=None, quality=90):
+    """Returns JPEG bytes of an image, resized to `image_size` if larger.
+
+    JPEGs that need no resizing are returned unchanged, other formats are
+    re-encoded so they can be read with `tf.io.decode_jpeg`.
+    """
+    is_jpeg = image_raw[:2] == _JPEG_MAGIC
+    if is_jpeg and image_size is None:
+        return image_raw
+    if is_jpeg:
+        shape = tf.image.extract_jpeg_shape(image_raw).numpy()
+        if min(shape[:2]) <= image_size:
+            return image_raw
+        image = tf.io.decode_jpeg(image_raw, channels=3)
+    else:
+        image = tf.io.decode_image(
+            image_raw, channels=3, expand_animations=False)
+    shape = image.shape
+    if image_size is not None and min(shape[:2]) > image_size:
+        scale = float(image_size) / min(shape[:2])
+        size = [
+            max(1, int(round(shape[0] * scale))),
+            max(1, int(round(shape[1] * scale)))
+        ]
+        image = tf.image.resize(image, size, antialias=True)
+        image = tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    return tf.io.encode_jpeg(image, quality=quality).numpy()
+
+
+def create_example(image_raw, label):
+    return tf.train.Example(
         features=tf.train.Features(
             feature={
                 'image': _bytes_feature(image_raw),
                 'label': _int64_feature(int(label))
-                #'label_name': _bytes_feature(label_name_raw)
             }))
-    return example
 
 
-def worker_fn(shard, samples):
-    # Create writer for this worker.
-    sess = tf.Session()
-    filename = os.path.join(FLAGS.record_path, "%s_%d.tfrecord" % (FLAGS.split,
-                                                                   shard))
-    with tf.python_io.TFRecordWriter(filename) as writer:
-        for i, s in enumerate(samples):
-            example = create_example(sess, s)
-            writer.write(example.SerializeToString())
-            if i % 500 == 0:
-                print("Shard %d: Finished sample %d." % (shard, i))
+def _init_worker():
+    # Workers share the host, one thread each avoids oversubscribing it.
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
 
 
-if __name__ == '__main__':
+def write_shard(task):
+    """Writes one shard, returning its index, example count and bytes.
+
+    Images are read and encoded one at a time so memory stays bounded by a
+    single image. The shard is renamed into place once complete, after its
+    `record_index` sidecar.
+    """
+    shard, filename, samples, root, image_size, quality = task
+    partial = filename + '.partial'
+    index = IndexBuilder()
+    with tf.io.TFRecordWriter(partial) as writer:
+        for path, label in samples:
+            with open(os.path.join(root, path), 'rb') as f:
+                image_raw = encode_image(f.read(), image_size, quality)
+            data = create_example(image_raw, label).SerializeToString()
+            writer.write(data)
+            index.add(len(data))
+    # The index is complete before the shard it describes appears.
+    save_index(index_path(filename), index.to_array())
+    os.replace(partial, filename)
+    return shard, len(samples), os.path.getsize(filename)
+
+
+def _write_json(path, value):
+    partial = path + '.partial'
+    with open(partial, 'w') as f:
+        json.dump(value, f)
+    os.replace(partial, path)
+
+
+def load_plan(root,
+              record_path,
+              split,
+              num_shards,
+              image_size,
+              quality,
+              seed,
+              manifest_cache_path=None):
+    """Returns the saved shard plan of a conversion or creates it.
+
+    `manifest_cache_path` is passed to `load_manifest` as its `cache_path`.
+    """
+    plan_path = os.path.join(record_path, 'plan-%s.json' % split)
+    settings = {
+        'root': os.path.abspath(root),
+        'split': split,
+        'num_shards': num_shards,
+        'image_size': image_size,
+        'quality': quality,
+        'seed': seed,
+    }
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            plan = json.load(f)
+        if plan['settings'] != settings:
+            raise ValueError(
+                '%s was written with %s, remove it to start over with %s.' %
+                (plan_path, plan['settings'], settings))
+        return plan
+    manifest = load_manifest(
+        os.path.join(root, split), cache_path=manifest_cache_path)
+    samples = list(zip(manifest.paths, manifest.labels.tolist()))
+    shards = plan_shards(samples, manifest.sizes.tolist(), num_shards)
+    if split == 'train':
+        rng = random.Random(seed)
+        for shard in shards:
+            rng.shuffle(shard)
+    plan = {
+        'settings': settings,
+        'shards': [{
+            'filename': '%s-%05d-of-%05d' % (split, i, num_shards),
+            'samples': shard
+        } for i, shard in enumerate(shards)],
+    }
+    _write_json(plan_path, plan)
+    return plan
+
+
+def finished_shards(record_path, split):
+    """Shards recorded as complete whose file still exists."""
+    progress_path = os.path.join(record_path, 'progress-%s.jsonl' % split)
+    finished = {}
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                # A line cut short by a crash is ignored.
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if os.path.exists(
+                        os.path.join(record_path, entry['filename'])):
+                    finished[entry['shard']] = entry
+    return finished
+
+
+def convert(root,
+            record_path,
+            split,
+            num_shards,
+            image_size=None,
+            quality=90,
+            num_workers=8,
+            seed=0,
+            manifest_cache_path=None):
+    """Writes or resumes writing the records of a split.
+
+    `manifest_cache_path` is where the file listing of the split is cached,
+    see `riptide.utils.manifest.load_manifest`.
+
+    Returns
+    -------
+    int
+        Total number of examples in the split.
+    """
+    os.makedirs(record_path, exist_ok=True)
+    plan = load_plan(root, record_path, split, num_shards, image_size,
+                     quality, seed, manifest_cache_path)
+    finished = finished_shards(record_path, split)
+    split_root = os.path.join(root, split)
+    tasks = [(i, os.path.join(record_path, s['filename']), s['samples'],
+              split_root, image_size, quality)
+             for i, s in enumerate(plan['shards']) if i not in finished]
+    logging.info('%d of %d shards already written, writing %d.' %
+                 (len(finished), num_shards, len(tasks)))
+    progress_path = os.path.join(record_path, 'progress-%s.jsonl' % split)
+    start = time.time()
+    if num_workers > 1:
+        # Spawned workers do not inherit TensorFlow state of this process.
+        pool = multiprocessing.get_context('spawn').Pool(
+            num_workers, initializer=_init_worker)
+        results = pool.imap_unordered(write_shard, tasks)
+    else:
+        pool = None
+        results = map(write_shard, tasks)
+    try:
+        with open(progress_path, 'a') as progress:
+            for done, (shard, count, size) in enumerate(results, 1):
+                entry = {
+                    'shard': shard,
+                    'filename': plan['shards'][shard]['filename'],
+                    'count': count,
+                    'bytes': size,
+                }
+                progress.write(json.dumps(entry) + '\n')
+                progress.flush()
+                os.fsync(progress.fileno())
+                finished[shard] = entry
+                elapsed = time.time() - start
+                logging.info('Wrote shard %d, %d of %d done, %.0f s left.' %
+                             (shard, done, len(tasks),
+                              elapsed / done * (len(tasks) - done)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return sum(e['count'] for e in finished.values())
+
+
+def main(argv):
     # Turn off GPUS
     os.environ['CUDA_VISIBLE_DEVICES'] = ''
-    shuffle = (FLAGS.split == 'train')
-    dataset = load_dataset(os.path.join(FLAGS.root, FLAGS.split), shuffle)
-    dataset_chunks = np.array_split(dataset, FLAGS.num_shards)
-    worker_args = zip(range(FLAGS.num_shards), dataset_chunks)
-    # Start up a thread pool and launch worker jobs.
-    p = Pool(FLAGS.num_workers)
-    p.starmap(worker_fn, worker_args)
+    count = convert(
+        FLAGS.root,
+        FLAGS.record_path,
+        FLAGS.split,
+        FLAGS.num_shards,
+        image_size=FLAGS.image_size,
+        quality=FLAGS.quality,
+        num_workers=FLAGS.num_workers,
+        seed=FLAGS.seed,
+        manifest_cache_path=FLAGS.manifest_cache_path)
+    logging.info('%s has %d examples.' % (FLAGS.split, count))
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,71 @@
+import os
+from unittest import mock
+import numpy as np
+import tensorflow as tf
+from riptide.utils import tf_record_writer
+
+
+class TFRecordWriterTest(tf.test.TestCase):
+    def setUp(self):
+        # Nothing may be cached outside of the test directory.
+        environ = mock.patch.dict(
+            os.environ, {'RIPTIDE_CACHE_DIR': self.get_temp_dir()})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def test_plan_shards_balances_bytes(self):
+        rng = np.random.RandomState(0)
+        sizes = list(rng.randint(50000, 200000, 1000))
+        shards = tf_record_writer.plan_shards(list(range(1000)), sizes, 7)
+        totals = [sum(sizes[i] for i in shard) for shard in shards]
+        self.assertLessEqual(max(totals) - min(totals), max(sizes))
+        self.assertCountEqual(sum(shards, []), range(1000))
+
+    def test_encode_image(self):
+        image = np.random.RandomState(0).randint(0, 255, [60, 90, 3])
+        jpeg = tf.io.encode_jpeg(image.astype(np.uint8)).numpy()
+        png = tf.io.encode_png(image.astype(np.uint8)).numpy()
+        self.assertEqual(tf_record_writer.encode_image(jpeg), jpeg)
+        self.assertEqual(tf_record_writer.encode_image(jpeg, 100), jpeg)
+        resized = tf_record_writer.encode_image(jpeg, 30)
+        self.assertAllEqual(tf.image.extract_jpeg_shape(resized), [30, 45, 3])
+        reencoded = tf_record_writer.encode_image(png)
+        self.assertAllEqual(
+            tf.image.extract_jpeg_shape(reencoded), [60, 90, 3])
+
+    def test_convert_resumes(self):
+        root = os.path.join(self.get_temp_dir(), 'images')
+        record_path = os.path.join(self.get_temp_dir(), 'records')
+        for label in ('cat', 'dog'):
+            os.makedirs(os.path.join(root, 'train', label))
+            for i in range(5):
+                image = np.full([20 + i, 30, 3], i * 40, np.uint8)
+                tf.io.write_file(
+                    os.path.join(root, 'train', label, '%d.jpg' % i),
+                    tf.io.encode_jpeg(image))
+        manifest_path = os.path.join(self.get_temp_dir(), 'manifest.json.gz')
+        kwargs = {
+            'image_size': 16,
+            'num_workers': 1,
+            'manifest_cache_path': manifest_path
+        }
+        self.assertEqual(
+            tf_record_writer.convert(root, record_path, 'train', 3, **kwargs),
+            10)
+        self.assertTrue(os.path.exists(manifest_path))
+        os.remove(os.path.join(record_path, 'train-00001-of-00003'))
+        self.assertEqual(
+            tf_record_writer.convert(root, record_path, 'train', 3, **kwargs),
+            10)
+        labels = []
+        for proto in tf.data.TFRecordDataset(
+                tf.io.gfile.glob(os.path.join(record_path, 'train*'))):
+            example = tf.train.Example.FromString(proto.numpy())
+            labels.extend(example.features.feature['label'].int64_list.value)
+        self.assertCountEqual(labels, [0] * 5 + [1] * 5)
+        with self.assertRaises(ValueError):
+            tf_record_writer.convert(root, record_path, 'train', 4, **kwargs)
+
+
+if __name__ == '__main__':
+    tf.test.main()
@@ -0,0 +1,177 @@
+"""Shape polymorphic tracing of riptide models."""
+import tensorflow as tf
+from absl import logging
+from riptide.utils.recording import called_layers, record_calls
+
+
+class LayerShapeReport(object):
+    """Static shapes a layer saw while traced with unknown dimensions.
+
+    Attributes
+    ----------
+    name : str
+        Attribute path of the layer.
+    kind : str
+        Layer class name.
+    input_shape : list
+        Static shape of the first input, None for unknown dimensions.
+    output_shape : list
+        Static shape of the first output.
+    error : str
+        Message if the layer could not be traced with these dimensions.
+    """
+
+    def __init__(self, name, kind, input_shape, output_shape=None,
+                 error=None):
+        self.name = name
+        self.kind = kind
+        self.input_shape = input_shape
+        self.output_shape = output_shape
+        self.error = error
+
+    @property
+    def static_batch(self):
+        """Batch size the layer pins an unknown batch dimension to."""
+        if self.output_shape is None or self.input_shape is None:
+            return None
+        if self.input_shape[0] is None:
+            return self.output_shape[0]
+        return None
+
+    @property
+    def forces_static(self):
+        """Whether the layer fails on, or pins, an unknown dimension."""
+        if self.error is not None:
+            return True
+        if self.output_shape is None or self.input_shape is None:
+            return False
+        # The batch dimension must stay unknown through every layer.
+        if self.static_batch is not None:
+            return True
+        # Folding unknown dimensions into the features, as a Flatten does,
+        # leaves following layers with weights of a fixed input size.
+        return self.input_shape[-1] is not None and \
+            self.output_shape[-1] is None
+
+    def __repr__(self):
+        status = 'error: %s' % self.error if self.error else (
+            'static' if self.forces_static else 'ok')
+        return '%s (%s) %s -> %s %s' % (self.name, self.kind,
+                                        self.input_shape, self.output_shape,
+                                        status)
+
+
+def _static_shape(structure):
+    tensors = [t for t in tf.nest.flatten(structure) if isinstance(t, tf.Tensor)]
+    return tensors[0].shape.as_list() if tensors else None
+
+
+def _message(error):
+    return str(error).strip().split('\n')[0]
+
+
+def check_shapes(model, input_shape, dtype=tf.float32):
+    """Traces a model with unknown dimensions and reports every layer.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Model to check, it is built if needed.
+    input_shape : tuple
+        Shape of a single example, None for dimensions that should be
+        polymorphic. The batch dimension is always unknown.
+
+    Returns
+    -------
+    list of LayerShapeReport
+        One report per leaf layer reached during tracing in execution order.
+        Tracing stops at the first layer that raises.
+    """
+    spec = tf.TensorSpec([None] + list(input_shape), dtype)
+    reports = []
+    error = None
+    with record_calls(model) as recorded:
+
+        def trace(inputs):
+            try:
+                return model(inputs, training=False)
+            finally:
+                # Symbolic shapes are only readable while the graph traces,
+                # which happens twice when it creates the model variables.
+                for name, layer, recorder in called_layers(recorded)[
+                        len(reports):]:
+                    reports.append(
+                        LayerShapeReport(name, type(layer).__name__,
+                                         _static_shape(recorder.args[0]),
+                                         _static_shape(recorder.outputs),
+                                         recorder.error and
+                                         _message(recorder.error)))
+
+        try:
+            tf.function(trace).get_concrete_function(spec)
+        except Exception as e:
+            error = e
+    if error is not None and not any(r.error for r in reports):
+        reports.append(
+            LayerShapeReport(model.name, type(model).__name__, None,
+                             error=_message(error)))
+    return reports
+
+
+def trace_model(model, input_shape, dtype=tf.float32, training=False):
+    """Traces a model once with the most relaxed signature it supports.
+
+    Spatial dimensions are first left unknown. If any layer requires them,
+    for example a `Flatten` feeding a dense layer, only the batch dimension
+    is left unknown. The returned function then serves every batch size, and
+    every resolution when the architecture allows it, without retracing.
+    If a layer pins the batch size, the signature keeps that batch size
+    instead and a warning names the layer.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        Model to trace.
+    input_shape : tuple
+        Shape of a single example, used for the dimensions that can not be
+        relaxed.
+    dtype : tf.DType
+        Type of the inputs.
+    training : bool
+        Training argument passed to the model.
+
+    Returns
+    -------
+    function : tf.function
+        Function of a single input batch with a fixed `input_signature`.
+    reports : list of LayerShapeReport
+        Per layer shapes of the relaxed trace, layers with `forces_static`
+        set are the ones preventing polymorphism.
+
+    Example
+    -------
+    fn, reports = trace_model(model, (224, 224, 3))
+    for report in reports:
+        if report.forces_static:
+            print(report)
+    outputs = fn(images)
+    """
+    input_shape = list(input_shape)
+    relaxed = [None] * (len(input_shape) - 1) + input_shape[-1:]
+    reports = check_shapes(model, relaxed, dtype)
+    if any(r.forces_static for r in reports):
+        signature_shape = [None] + input_shape
+    else:
+        signature_shape = [None] + relaxed
+    pinned = [r for r in reports if r.static_batch is not None]
+    if pinned:
+        signature_shape[0] = pinned[0].static_batch
+        logging.warning('%s pins the batch size to %d, tracing with it.',
+                        pinned[0].name, signature_shape[0])
+
+    @tf.function(input_signature=[tf.TensorSpec(signature_shape, dtype)])
+    def function(inputs):
+        return model(inputs, training=training)
+
+    function.get_concrete_function()
+    return function, reports
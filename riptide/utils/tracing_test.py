@@ -0,0 +1,80 @@
+import numpy as np
+import tensorflow as tf
+from riptide.utils.tracing import check_shapes, trace_model
+
+
+class FixedBatch(tf.keras.layers.Layer):
+    """Pins the batch dimension, as layers reshaping to static sizes do."""
+
+    def call(self, x):
+        return tf.reshape(x, [2, -1])
+
+
+class ConvNet(tf.keras.Model):
+    def __init__(self, head):
+        super(ConvNet, self).__init__()
+        self.conv = tf.keras.layers.Conv2D(4, 3, padding='same')
+        self.head = head
+        self.dense = tf.keras.layers.Dense(3)
+
+    def call(self, x, training=None):
+        x = self.conv(x)
+        for layer in self.head:
+            x = layer(x)
+        return self.dense(x)
+
+
+class TracingTest(tf.test.TestCase):
+    def test_polymorphic_model(self):
+        model = ConvNet([tf.keras.layers.GlobalAveragePooling2D()])
+        reports = check_shapes(model, [None, None, 3])
+        self.assertEqual([r.name for r in reports],
+                         ['conv', 'head/0', 'dense'])
+        self.assertFalse(any(r.forces_static for r in reports))
+        self.assertEqual(reports[0].output_shape, [None, None, None, 4])
+        self.assertNotIn('call', vars(model.conv))
+
+        function, _ = trace_model(model, (8, 8, 3))
+        for batch_size, size in [(1, 8), (3, 8), (5, 16)]:
+            images = np.ones([batch_size, size, size, 3], np.float32)
+            self.assertAllClose(model(images), function(images))
+
+    def test_flatten_forces_static(self):
+        model = ConvNet([tf.keras.layers.Flatten()])
+        model(tf.zeros([1, 8, 8, 3]))
+        reports = check_shapes(model, [None, None, 3])
+        static = [r.name for r in reports if r.forces_static]
+        self.assertEqual(static[0], 'head/0')
+
+        # Falls back to a fixed resolution, batches stay polymorphic.
+        function, reports = trace_model(model, (8, 8, 3))
+        self.assertTrue(any(r.forces_static for r in reports))
+        for batch_size in [1, 2, 7]:
+            images = np.ones([batch_size, 8, 8, 3], np.float32)
+            self.assertAllClose(model(images), function(images))
+        with self.assertRaises((ValueError, TypeError)):
+            function(np.ones([1, 16, 16, 3], np.float32))
+
+    def test_static_batch_layer(self):
+        model = ConvNet([FixedBatch()])
+        model(tf.zeros([2, 8, 8, 3]))
+        reports = check_shapes(model, [8, 8, 3])
+        report = [r for r in reports if r.name == 'head/0'][0]
+        self.assertEqual(report.kind, 'FixedBatch')
+        self.assertIsNone(report.input_shape[0])
+        self.assertEqual(report.output_shape[0], 2)
+        self.assertTrue(report.forces_static)
+        self.assertIn('static', repr(report))
+        self.assertEqual(report.static_batch, 2)
+
+        # Keeps the pinned batch size instead of an unknown one.
+        function, reports = trace_model(model, (8, 8, 3))
+        self.assertEqual(function.input_signature[0].shape.as_list(),
+                         [2, 8, 8, 3])
+        images = np.ones([2, 8, 8, 3], np.float32)
+        self.assertAllClose(model(images), function(images))
+        self.assertNotIn('call', vars(model.head[0]))
+
+
+if __name__ == '__main__':
+    tf.test.main()
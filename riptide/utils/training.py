@@ -0,0 +1,516 @@
+"""Custom training loop for riptide models.
+
+`Trainer` replaces the `tf.estimator` based drivers. The forward and
+backward pass of every step is compiled with XLA, several steps run per
+`tf.function` call to amortize dispatch overhead, and checkpoints are
+written in the background while training continues.
+"""
+import time
+import contextlib
+import tensorflow as tf
+from riptide.utils import distribute
+
+from absl import logging
+
+
+def compile_function(fn, jit_compile=True):
+    """Wraps `fn` in a `tf.function`, compiled with XLA if requested."""
+    if not jit_compile:
+        return tf.function(fn)
+    try:
+        return tf.function(fn, jit_compile=True)
+    except TypeError:
+        # Older TensorFlow releases name the argument experimental_compile.
+        return tf.function(fn, experimental_compile=True)
+
+
+def _checkpoint_options():
+    # Async checkpointing copies variables to the host and writes them on a
+    # background thread. Releases without it fall back to blocking saves.
+    for name in ('enable_async', 'experimental_enable_async_checkpoint'):
+        try:
+            return tf.train.CheckpointOptions(**{name: True})
+        except (TypeError, AttributeError):
+            continue
+    return None
+
+
+@contextlib.contextmanager
+def use_quantized_kernels(layers, kernels):
+    """Makes quantized layers use precomputed kernels instead of quantizing
+    their latent kernels on every call."""
+    for layer, kernel in zip(layers, kernels):
+        layer.quantized_kernel = kernel
+    try:
+        yield
+    finally:
+        for layer in layers:
+            layer.quantized_kernel = None
+
+
+def _is_keras_optimizer(optimizer):
+    return isinstance(optimizer, tf.keras.optimizers.Optimizer) or hasattr(
+        optimizer, 'get_scaled_loss')
+
+
+class Trainer(object):
+    """Trains a classifier with a `tf.distribute` strategy.
+
+    Parameters
+    ----------
+    model_fn : callable
+        Returns the model to train. It is called inside the strategy scope,
+        so quantized models should be constructed under their binary or
+        anneal `Config` inside this function.
+    optimizer_fn : callable
+        Takes the global step variable and returns an `(optimizer,
+        learning_rate)` pair. Both Keras optimizers and `tf.compat.v1`
+        optimizers such as those from `riptide.anneal.models.get_optimizer`
+        are supported. The learning rate may be a float, a callable or a
+        Keras learning rate schedule and is only used for logging.
+    model_dir : str
+        Directory for checkpoints and summaries. Training resumes from the
+        latest checkpoint found there. In a multi-worker cluster only the
+        chief writes to it.
+    global_batch_size : int
+        Number of examples per micro-batch summed over all replicas.
+    strategy : tf.distribute.Strategy
+        Defaults to the current strategy, a single device without one. See
+        `riptide.utils.distribute.get_strategy` for multi-worker training.
+    jit_compile : bool
+        Compile the forward and backward pass with XLA.
+    steps_per_execution : int
+        Number of steps run per call of the training function. Metrics,
+        summaries and checkpoints are handled between executions.
+    checkpoint_steps : int
+        Save a checkpoint at the first execution boundary after this many
+        steps.
+    max_checkpoints : int
+        Number of checkpoints kept in `model_dir`.
+    loss_scale : bool
+        Apply dynamic loss scaling, needed for float16 training. Requires a
+        Keras optimizer.
+    loss_fn : callable
+        Maps labels and predictions to per example losses, defaults to
+        sparse categorical crossentropy.
+    accum_steps : int
+        Number of micro-batches whose gradients are accumulated into one
+        optimizer step, the effective batch size is `global_batch_size *
+        accum_steps`. Layers with a `quantize_kernel` method quantize their
+        kernels once per step rather than once per micro-batch.
+    preprocess_fn : callable
+        Applied as `preprocess_fn(images, training)` to every micro-batch on
+        its replica before the model, inside the compiled step. For example
+        `augment_batch` with the uint8 batches of `imagerecord_dataset`
+        with `device_augment`.
+    echo_factor : int
+        Number of times the input pipeline reuses every example, see
+        `imagerecord_dataset`. Throughput is also reported in unique
+        images per second, the rate at which new data is consumed.
+
+    Example
+    -------
+    def model_fn():
+        with Config(actQ=DQuantize, weightQ=XQuantize, bits=2.0):
+            return get_model('vggnet')
+
+    def optimizer_fn(global_step):
+        lr = tf.keras.optimizers.schedules.CosineDecayRestarts(0.0128, 1000)
+        return tf.keras.optimizers.SGD(lr, momentum=0.9), lr
+
+    trainer = Trainer(model_fn, optimizer_fn, '/tmp/vggnet', 64)
+    trainer.train(train_ds, total_steps=100000, eval_dataset=eval_ds)
+    """
+
+    def __init__(self,
+                 model_fn,
+                 optimizer_fn,
+                 model_dir,
+                 global_batch_size,
+                 strategy=None,
+                 jit_compile=True,
+                 steps_per_execution=100,
+                 checkpoint_steps=5000,
+                 max_checkpoints=5,
+                 loss_scale=False,
+                 loss_fn=None,
+                 accum_steps=1,
+                 preprocess_fn=None,
+                 echo_factor=1):
+        self.strategy = strategy or tf.distribute.get_strategy()
+        self.model_dir = model_dir
+        self.global_batch_size = global_batch_size
+        self.steps_per_execution = steps_per_execution
+        self.checkpoint_steps = checkpoint_steps
+        self.accum_steps = accum_steps
+        self.preprocess_fn = preprocess_fn
+        self.echo_factor = echo_factor
+        self._quantized_layers = []
+        self.loss_fn = loss_fn or tf.keras.losses.SparseCategoricalCrossentropy(
+            reduction=tf.keras.losses.Reduction.NONE)
+
+        with self.strategy.scope():
+            self.model = model_fn()
+            self.global_step = tf.Variable(
+                0,
+                dtype=tf.int64,
+                trainable=False,
+                name='global_step',
+                aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+            self.optimizer, self.learning_rate = optimizer_fn(self.global_step)
+            self._keras_optimizer = _is_keras_optimizer(self.optimizer)
+            self.loss_scale = loss_scale
+            if loss_scale:
+                if not self._keras_optimizer:
+                    raise ValueError(
+                        'Loss scaling requires a Keras optimizer, got %s.' %
+                        type(self.optimizer).__name__)
+                if hasattr(tf.keras.mixed_precision, 'LossScaleOptimizer'):
+                    self.optimizer = tf.keras.mixed_precision.LossScaleOptimizer(
+                        self.optimizer)
+                else:
+                    self.optimizer = tf.keras.mixed_precision.experimental.LossScaleOptimizer(
+                        self.optimizer, 'dynamic')
+            self.metrics = {
+                'loss': tf.keras.metrics.Mean('loss'),
+                'accuracy': tf.keras.metrics.SparseCategoricalAccuracy(
+                    'accuracy'),
+                'accuracy_top_5': tf.keras.metrics.SparseTopKCategoricalAccuracy(
+                    k=5, name='accuracy_top_5'),
+            }
+
+        self.checkpoint = tf.train.Checkpoint(
+            model=self.model,
+            optimizer=self.optimizer,
+            global_step=self.global_step)
+        self.is_chief = distribute.is_chief()
+        self.manager = tf.train.CheckpointManager(
+            self.checkpoint,
+            distribute.write_dir(model_dir),
+            max_to_keep=max_checkpoints if self.is_chief else 1)
+        if self.is_chief:
+            self._options = _checkpoint_options()
+            self.writer = tf.summary.create_file_writer(model_dir)
+        else:
+            # Temporary checkpoints of other workers are removed right
+            # after saving, so they are written synchronously.
+            self._options = None
+            self.writer = tf.summary.create_noop_writer()
+
+        self._compute = compile_function(self._compute_gradients, jit_compile)
+        self._train_steps = tf.function(self._train_steps_fn)
+        self._eval_step = tf.function(self._eval_step_fn)
+        self._executions = []
+
+    def restore(self):
+        """Restores the latest checkpoint in `model_dir`, if any."""
+        path = tf.train.latest_checkpoint(self.model_dir)
+        if path:
+            self.checkpoint.restore(path)
+            logging.info('Restored %s at step %d.' %
+                         (path, int(self.global_step.numpy())))
+        return path
+
+    def _loss(self, labels, predictions, accum_steps=1):
+        # Every micro-batch contributes its share of the mean over the
+        # effective batch, so accumulated gradients match a single large
+        # batch.
+        loss = tf.nn.compute_average_loss(
+            self.loss_fn(labels, predictions),
+            global_batch_size=self.global_batch_size * accum_steps)
+        if self.model.losses:
+            loss += tf.nn.scale_regularization_loss(
+                tf.math.add_n(self.model.losses)) / accum_steps
+        return loss
+
+    def _preprocess(self, images, training):
+        if self.preprocess_fn is None:
+            return images
+        return self.preprocess_fn(images, training)
+
+    def _compute_gradients(self, images, labels, quantized):
+        images = self._preprocess(images, True)
+        with tf.GradientTape() as tape:
+            tape.watch(quantized)
+            with use_quantized_kernels(self._quantized_layers, quantized):
+                # Losses and metrics are computed in float32.
+                predictions = tf.cast(
+                    self.model(images, training=True), tf.float32)
+            loss = self._loss(labels, predictions, self.accum_steps)
+            if self.loss_scale:
+                scaled_loss = self.optimizer.get_scaled_loss(loss)
+            else:
+                scaled_loss = loss
+        grads, kernel_grads = tape.gradient(
+            scaled_loss, (self.model.trainable_variables, list(quantized)))
+        if self.loss_scale:
+            grads = self.optimizer.get_unscaled_gradients(grads)
+            kernel_grads = self.optimizer.get_unscaled_gradients(kernel_grads)
+        return loss, predictions, grads, kernel_grads
+
+    def _apply_gradients(self, grads):
+        grads_and_vars = list(zip(grads, self.model.trainable_variables))
+        # Gradient all-reduce and the variable update stay outside of XLA.
+        self.optimizer.apply_gradients(grads_and_vars)
+        self.global_step.assign_add(1)
+
+    def _update_metrics(self, loss, labels, predictions, accum_steps=1):
+        # Replica losses are averaged over the global effective batch.
+        self.metrics['loss'].update_state(
+            loss * self.strategy.num_replicas_in_sync * accum_steps)
+        self.metrics['accuracy'].update_state(labels, predictions)
+        self.metrics['accuracy_top_5'].update_state(labels, predictions)
+
+    def _replica_step(self, images, labels):
+        loss, predictions, grads, _ = self._compute(images, labels, [])
+        self._apply_gradients(grads)
+        self._update_metrics(loss, labels, predictions)
+
+    def _replica_accumulate(self, images, labels):
+        # Images and labels are lists of the micro-batches of one step.
+        images = tf.stack(images)
+        labels = tf.stack(labels)
+        variables = self.model.trainable_variables
+        kernels = [layer.kernel for layer in self._quantized_layers]
+        with tf.GradientTape() as tape:
+            quantized = [
+                layer.quantize_kernel() for layer in self._quantized_layers
+            ]
+        grads = [tf.zeros(v.shape, v.dtype) for v in variables]
+        # Accumulate in float32, micro-batch gradients of a mixed precision
+        # model are in its compute dtype.
+        kernel_grads = [tf.zeros(q.shape, tf.float32) for q in quantized]
+        for i in tf.range(self.accum_steps):
+            loss, predictions, step_grads, step_kernel_grads = self._compute(
+                images[i], labels[i], quantized)
+            grads = [
+                g if s is None else g + tf.cast(s, g.dtype)
+                for g, s in zip(grads, step_grads)
+            ]
+            kernel_grads = [
+                g if s is None else g + tf.cast(s, tf.float32)
+                for g, s in zip(kernel_grads, step_kernel_grads)
+            ]
+            self._update_metrics(loss, labels[i], predictions,
+                                 self.accum_steps)
+        # Backpropagate the accumulated gradients through the quantizers
+        # once for the whole step.
+        latent_grads = tape.gradient(
+            quantized,
+            kernels,
+            output_gradients=[
+                tf.cast(g, q.dtype) for g, q in zip(kernel_grads, quantized)
+            ])
+        latent_grads = {
+            id(k): g
+            for k, g in zip(kernels, latent_grads) if g is not None
+        }
+        grads = [
+            g + tf.cast(latent_grads[id(v)], g.dtype)
+            if id(v) in latent_grads else g for g, v in zip(grads, variables)
+        ]
+        self._apply_gradients(grads)
+
+    def _train_steps_fn(self, iterator, steps):
+        for _ in tf.range(steps):
+            if self.accum_steps > 1:
+                batches = [next(iterator) for _ in range(self.accum_steps)]
+                self.strategy.run(
+                    self._replica_accumulate,
+                    args=([b[0] for b in batches], [b[1] for b in batches]))
+            else:
+                images, labels = next(iterator)
+                self.strategy.run(self._replica_step, args=(images, labels))
+
+    def _find_quantized_layers(self, dataset):
+        # Kernels only exist once the model is built, the build call runs in
+        # inference mode so no moving statistics are updated.
+        if not self.model.built:
+            if callable(dataset):
+                dataset = dataset(tf.distribute.InputContext())
+            spec = tf.nest.flatten(dataset.element_spec)[0]
+            images = tf.zeros([1] + spec.shape.as_list()[1:], spec.dtype)
+            with self.strategy.scope():
+                self.model(self._preprocess(images, False), training=False)
+        return [
+            layer for layer in self.model.submodules
+            if hasattr(layer, 'quantize_kernel')
+        ]
+
+    def _eval_step_fn(self, images, labels):
+        def step(images, labels):
+            predictions = tf.cast(
+                self.model(self._preprocess(images, False), training=False),
+                tf.float32)
+            self._update_metrics(self._loss(labels, predictions), labels,
+                                 predictions)
+
+        self.strategy.run(step, args=(images, labels))
+
+    def _reset_metrics(self):
+        for metric in self.metrics.values():
+            if hasattr(metric, 'reset_state'):
+                metric.reset_state()
+            else:
+                metric.reset_states()
+
+    def _results(self):
+        return {
+            name: float(metric.result().numpy())
+            for name, metric in self.metrics.items()
+        }
+
+    def current_learning_rate(self):
+        lr = self.learning_rate
+        if isinstance(lr, tf.keras.optimizers.schedules.LearningRateSchedule):
+            lr = lr(self.global_step)
+        elif callable(lr):
+            lr = lr()
+        return float(lr)
+
+    def save(self):
+        if self._options is not None:
+            return self.manager.save(
+                checkpoint_number=self.global_step, options=self._options)
+        path = self.manager.save(checkpoint_number=self.global_step)
+        if not self.is_chief:
+            tf.io.gfile.rmtree(self.manager.directory)
+        return path
+
+    def _write_summaries(self, prefix, results):
+        with self.writer.as_default():
+            for name, value in results.items():
+                tf.summary.scalar(prefix + name, value, step=self.global_step)
+
+    def evaluate(self, dataset, steps=None):
+        """Computes loss and accuracy over a dataset.
+
+        Returns
+        -------
+        dict
+            Mean loss, accuracy and top 5 accuracy.
+        """
+        self._reset_metrics()
+        dataset = distribute.distribute_dataset(self.strategy, dataset)
+        for i, (images, labels) in enumerate(dataset):
+            if steps is not None and i >= steps:
+                break
+            self._eval_step(images, labels)
+        results = self._results()
+        self._write_summaries('eval_', results)
+        logging.info('Evaluation at step %d: %s' %
+                     (int(self.global_step.numpy()), results))
+        self._reset_metrics()
+        return results
+
+    def train(self, dataset, total_steps, eval_dataset=None,
+              eval_every=None):
+        """Trains until the global step reaches `total_steps`.
+
+        Parameters
+        ----------
+        dataset : tf.data.Dataset or callable
+            Repeating dataset of (images, labels) micro-batches of
+            `global_batch_size` examples, or a function that takes a
+            `tf.distribute.InputContext` and returns the sharded per replica
+            dataset of a worker.
+        total_steps : int
+            Global step to stop at, counted across restarts.
+        eval_dataset : tf.data.Dataset or callable
+            Evaluated every `eval_every` steps and at the end of training,
+            a dataset or function of an `InputContext` as `dataset`.
+        eval_every : int
+            Steps between evaluations, only at execution boundaries.
+
+        Returns
+        -------
+        dict
+            Final evaluation results if `eval_dataset` is given, otherwise
+            the training metrics of the last execution.
+        """
+        self.restore()
+        if self.accum_steps > 1:
+            self._quantized_layers = self._find_quantized_layers(dataset)
+        iterator = iter(distribute.distribute_dataset(self.strategy, dataset))
+        step = int(self.global_step.numpy())
+        last_checkpoint = step
+        last_eval = step
+        results = {}
+        while step < total_steps:
+            steps = min(self.steps_per_execution, total_steps - step)
+            start = time.perf_counter()
+            self._train_steps(iterator, tf.constant(steps))
+            # Reading the metrics waits for the execution to finish.
+            results = self._results()
+            elapsed = time.perf_counter() - start
+            step = int(self.global_step.numpy())
+            images_per_sec = (
+                steps * self.global_batch_size * self.accum_steps / elapsed)
+            self._executions.append((step, steps, elapsed))
+            results['learning_rate'] = self.current_learning_rate()
+            results['images_per_sec'] = images_per_sec
+            if self.echo_factor > 1:
+                results['unique_images_per_sec'] = (
+                    images_per_sec / self.echo_factor)
+            self._write_summaries('train_', results)
+            logging.info('Step %d: %s' % (step, ', '.join(
+                '%s %.4g' % kv for kv in sorted(results.items()))))
+            self._reset_metrics()
+            if step - last_checkpoint >= self.checkpoint_steps:
+                self.save()
+                last_checkpoint = step
+            if (eval_dataset is not None and eval_every and
+                    step - last_eval >= eval_every and step < total_steps):
+                self.evaluate(eval_dataset)
+                last_eval = step
+        if step != last_checkpoint:
+            self.save()
+        if hasattr(self.checkpoint, 'sync'):
+            # Wait for background checkpoint writes before returning.
+            self.checkpoint.sync()
+        logging.info(self.throughput_report())
+        if eval_dataset is not None:
+            results = self.evaluate(eval_dataset)
+        return results
+
+    def throughput_summary(self):
+        """Summarizes the training speed of the last `train` call.
+
+        The first execution includes tracing and XLA compilation and is
+        reported separately from the steady state.
+        """
+        if not self._executions:
+            return {}
+        batch_size = self.global_batch_size * self.accum_steps
+        steps = sum(s for _, s, _ in self._executions)
+        elapsed = sum(t for _, _, t in self._executions)
+        summary = {
+            'steps': steps,
+            'seconds': elapsed,
+            'images_per_sec': steps * batch_size / elapsed,
+            'first_execution_seconds': self._executions[0][2],
+        }
+        steady = self._executions[1:]
+        if steady:
+            steady_steps = sum(s for _, s, _ in steady)
+            steady_elapsed = sum(t for _, _, t in steady)
+            summary['steady_images_per_sec'] = (
+                steady_steps * batch_size / steady_elapsed)
+            summary['steady_ms_per_step'] = (
+                1000.0 * steady_elapsed / steady_steps)
+        if self.echo_factor > 1:
+            for name in ('images_per_sec', 'steady_images_per_sec'):
+                if name in summary:
+                    summary[name.replace('images', 'unique_images')] = (
+                        summary[name] / self.echo_factor)
+        return summary
+
+    def throughput_report(self):
+        summary = self.throughput_summary()
+        lines = ['Throughput over %d steps:' % summary.get('steps', 0)]
+        for name in ('seconds', 'first_execution_seconds', 'images_per_sec',
+                     'unique_images_per_sec', 'steady_images_per_sec',
+                     'steady_unique_images_per_sec', 'steady_ms_per_step'):
+            if name in summary:
+                lines.append('  %-26s %.2f' % (name, summary[name]))
+        return '\n'.join(lines)
@@ -0,0 +1,51 @@
+import tensorflow as tf
+from riptide.binary import binary_layers as nn
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.utils.training import Trainer
+
+
+def build_model():
+    with Config(actQ=DQuantize, weightQ=XQuantize, bits=2.0, use_act=False):
+        return tf.keras.Sequential([
+            tf.keras.Input(shape=(8, 8, 3)),
+            tf.keras.layers.Conv2D(8, 3),
+            nn.BinaryConv2D(16, 3),
+            tf.keras.layers.GlobalAveragePooling2D(),
+            tf.keras.layers.Dense(10, activation='softmax'),
+        ])
+
+
+def optimizer_fn(global_step):
+    return tf.keras.optimizers.SGD(0.1), 0.1
+
+
+class TrainerTest(tf.test.TestCase):
+    def test_accumulation_matches_large_batch(self):
+        images = tf.random.normal([32, 8, 8, 3])
+        labels = tf.random.uniform([32], maxval=10, dtype=tf.int32)
+        data = tf.data.Dataset.from_tensor_slices((images, labels))
+        initial_weights = build_model().get_weights()
+
+        def model_fn():
+            model = build_model()
+            model.set_weights(initial_weights)
+            return model
+
+        weights = []
+        for batch_size, accum_steps in [(32, 1), (8, 4)]:
+            trainer = Trainer(
+                model_fn,
+                optimizer_fn,
+                self.get_temp_dir() + '/%d' % accum_steps,
+                batch_size,
+                steps_per_execution=1,
+                accum_steps=accum_steps)
+            trainer.train(data.batch(batch_size).repeat(), 1)
+            weights.append(trainer.model.get_weights())
+
+        for large, accumulated in zip(*weights):
+            self.assertAllClose(large, accumulated, atol=1e-5)
+
+
+if __name__ == '__main__':
+    tf.test.main()
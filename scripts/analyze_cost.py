@@ -0,0 +1,60 @@
+import json
+from riptide.get_models import get_model
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.utils.cost_model import Throughput, analyze_model
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'vggnet', 'Name of model to analyze.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_bool('bipolar', False, 'Whether activations are bipolar.')
+flags.DEFINE_bool('use_bn', False,
+                  'Use batch normalization instead of shift normalization.')
+flags.DEFINE_bool('use_maxpool', True, 'Whether to use max pooling.')
+flags.DEFINE_integer('image_size', 224, 'Height and Width of input images.')
+flags.DEFINE_integer('batch_size', 1, 'Batch size to count operations for.')
+flags.DEFINE_bool('calibrate', False,
+                  'Measure throughput constants on this host first.')
+flags.DEFINE_string(
+    'throughput', '', 'Optional JSON file of throughput constants, as '
+    'written by --calibrate with --output.')
+flags.DEFINE_integer('top', 0, 'Only list the most costly layers if set.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def main(argv):
+    with Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=FLAGS.bits,
+            bipolar=FLAGS.bipolar,
+            use_act=False,
+            use_bn=FLAGS.use_bn,
+            use_maxpool=FLAGS.use_maxpool):
+        model = get_model(FLAGS.model)
+
+    if FLAGS.calibrate:
+        throughput = Throughput.calibrate()
+    elif FLAGS.throughput:
+        with open(FLAGS.throughput) as f:
+            throughput = Throughput(**json.load(f)['throughput'])
+    else:
+        throughput = Throughput()
+
+    report = analyze_model(
+        model, (FLAGS.image_size, FLAGS.image_size, 3),
+        batch_size=FLAGS.batch_size,
+        throughput=throughput)
+    logging.info('\n' + report.table(top=FLAGS.top or None))
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -1,19 +1,21 @@
 import os
-import multiprocessing
 import tensorflow as tf
-from functools import partial
-from riptide.utils.datasets import imagerecord_dataset
+from riptide.utils.datasets import imagerecord_dataset, indexed_record_dataset
+from riptide.utils.eval_cache import eval_cache_dataset
+from riptide.utils.preprocessing.inception_preprocessing import augment_batch
 from riptide.utils.thread_helper import setup_gpu_threadpool
+from riptide.utils.training import Trainer
+from riptide.utils.distribute import get_strategy
 from riptide.anneal.anneal_config import Config
 from riptide.anneal.models import get_model, get_optimizer
-from riptide.utils.preprocessing.inception_preprocessing import preprocess_image
 
 from absl import app
 from absl import flags
-from absl import logging
 
 FLAGS = flags.FLAGS
 
+_NUM_IMAGES = 1281167
+
 flags.DEFINE_string('model_dir', '/data/jwfromm/anneal_models',
                     'Directory to save models in.')
 flags.DEFINE_string('model', '', 'Name of model to train, must be set.')
@@ -34,49 +36,119 @@ flags.DEFINE_float('a_bits', 2.0,
                    'Number of activation bits to use for binary model.')
 flags.DEFINE_float('w_bits', 2.0,
                    'Number of activation bits to use for binary model.')
+flags.DEFINE_integer(
+    'accum_steps', 1,
+    'Accumulate gradients of this many batches per optimizer step, the '
+    'effective batch size is batch_size * num_gpus * accum_steps.')
+flags.DEFINE_bool('jit_compile', True,
+                  'Compile the forward and backward pass with XLA.')
+flags.DEFINE_integer('steps_per_execution', 100,
+                     'Training steps run per call of the step function.')
+flags.DEFINE_integer('checkpoint_steps', 5000,
+                     'Steps between asynchronous checkpoints.')
+flags.DEFINE_integer('eval_steps', 50000,
+                     'Steps between evaluations of the validation set.')
+flags.DEFINE_string(
+    'eval_cache', '',
+    'Eval cache written by scripts/build_eval_cache.py at image_size, read '
+    'instead of decoding the validation set for every evaluation.')
+flags.DEFINE_bool(
+    'device_augment', False,
+    'Ship uint8 crops from the input pipeline and run color distortion, '
+    'flips and normalization on the accelerator as part of the step.')
+flags.DEFINE_integer(
+    'echo_factor', 1,
+    'Reuse every training example or batch this many times, for input '
+    'bound jobs. Not supported with --global_shuffle.')
+flags.DEFINE_enum('echo_level', 'example', ['example', 'batch'],
+                  'Echo decoded examples or finished batches.')
+flags.DEFINE_bool(
+    'global_shuffle', False,
+    'Read training examples in a global random order per epoch through the '
+    'record index files, resuming at the exact example after a restart.')
+flags.DEFINE_bool(
+    'dct_scaling', False,
+    'Decode JPEGs at 1/2, 1/4 or 1/8 scale when the crop stays larger than '
+    'image_size, cheaper for small image sizes.')
 
 
 def main(argv):
+    if FLAGS.global_shuffle and FLAGS.echo_factor > 1:
+        raise app.UsageError('--echo_factor requires streamed records, not '
+                             '--global_shuffle.')
     # Set visible GPUS appropriately.
     os.environ['CUDA_VISIBLE_DEVICES'] = FLAGS.gpus
     # Get thread confirguration.
     op_threads, num_workers = setup_gpu_threadpool(len(FLAGS.gpus.split(',')))
     num_gpus = len(FLAGS.gpus.split(','))
-    # Set up the data input functions.
-    train_preprocess = partial(
-        preprocess_image,
-        height=FLAGS.image_size,
-        width=FLAGS.image_size,
-        is_training=True)
-    eval_preprocess = partial(
-        preprocess_image,
-        height=FLAGS.image_size,
-        width=FLAGS.image_size,
-        is_training=False)
-
-    def train_input_fn():
+    tf.config.threading.set_inter_op_parallelism_threads(op_threads)
+    for gpu in tf.config.experimental.list_physical_devices('GPU'):
+        tf.config.experimental.set_memory_growth(gpu, True)
+    # Uses all workers listed in TF_CONFIG, or the local GPUs without it.
+    strategy = get_strategy(num_gpus)
+    # The batch size flag is per device, as it was with the Estimator.
+    global_batch_size = FLAGS.batch_size * strategy.num_replicas_in_sync
+    # Set up the data input functions, images are decoded directly into
+    # their crops.
+    def train_input_fn(input_context):
+        # Every worker reads its own share of the record files. Batches must
+        # be complete for the compiled step to keep static shapes.
+        if FLAGS.global_shuffle:
+            # The trainer has restored its step when the dataset is built.
+            ds = indexed_record_dataset(
+                FLAGS.data_path,
+                input_context.get_per_replica_batch_size(global_batch_size),
+                is_training=True,
+                image_size=FLAGS.image_size,
+                dct_scaling=FLAGS.dct_scaling,
+                device_augment=FLAGS.device_augment,
+                num_workers=num_workers,
+                drop_remainder=True,
+                num_shards=input_context.num_input_pipelines,
+                shard_index=input_context.input_pipeline_id,
+                start_example=int(trainer.global_step.numpy()) *
+                global_batch_size * FLAGS.accum_steps)
+            return ds
         ds = imagerecord_dataset(
             FLAGS.data_path,
-            FLAGS.batch_size,
+            input_context.get_per_replica_batch_size(global_batch_size),
             is_training=True,
-            preprocess=train_preprocess,
-            num_workers=num_workers)
-        return ds.repeat(FLAGS.epochs)
-
-    def eval_input_fn():
+            image_size=FLAGS.image_size,
+            dct_scaling=FLAGS.dct_scaling,
+            device_augment=FLAGS.device_augment,
+            num_workers=num_workers,
+            drop_remainder=True,
+            num_shards=input_context.num_input_pipelines,
+            shard_index=input_context.input_pipeline_id,
+            echo_factor=FLAGS.echo_factor,
+            echo_level=FLAGS.echo_level)
+        return ds.repeat()
+
+    def eval_input_fn(input_context):
+        # Every worker evaluates its own share of the validation set.
+        batch_size = input_context.get_per_replica_batch_size(
+            global_batch_size)
+        if FLAGS.eval_cache:
+            return eval_cache_dataset(
+                FLAGS.eval_cache,
+                batch_size,
+                num_shards=input_context.num_input_pipelines,
+                shard_index=input_context.input_pipeline_id,
+                normalize=not FLAGS.device_augment,
+                image_size=FLAGS.image_size)
         ds = imagerecord_dataset(
             FLAGS.data_path,
-            FLAGS.batch_size,
+            batch_size,
             is_training=False,
-            preprocess=eval_preprocess,
-            num_workers=num_workers)
+            image_size=FLAGS.image_size,
+            dct_scaling=FLAGS.dct_scaling,
+            device_augment=FLAGS.device_augment,
+            num_workers=num_workers,
+            num_shards=input_context.num_input_pipelines,
+            shard_index=input_context.input_pipeline_id)
         return ds.repeat(1)
 
-    # Set up estimaor model function.
-    def model_fn(features, labels, mode):
-        # Generate summary for input images.
-        tf.compat.v1.summary.image('images', features, max_outputs=4)
-
+    def model_fn():
         if FLAGS.quantize:
             a_bits = FLAGS.a_bits
             w_bits = FLAGS.w_bits
@@ -91,88 +163,35 @@ def main(argv):
         config = Config(quantize=quantize, a_bits=a_bits, w_bits=w_bits, fixed=fixed)
 
         with config:
-            model = get_model(FLAGS.model)
-
-        global_step = tf.compat.v1.train.get_or_create_global_step()
-        optimizer, learning_rate = get_optimizer(FLAGS.model, global_step,
-                                                 FLAGS.batch_size, num_gpus)
-
-        loss_object = tf.keras.losses.SparseCategoricalCrossentropy(reduction=tf.keras.losses.Reduction.NONE)
-        def loss_fn(labels, predictions):
-            per_example_loss = loss_object(labels, predictions)
-            return tf.nn.compute_average_loss(per_example_loss, global_batch_size=FLAGS.batch_size)
-
-        # Track learning rate.
-        tf.compat.v1.summary.scalar('learning_rate', learning_rate)
-
-        # Get proper mode for batchnorm and dropout, must be python bool.
-        training = (mode == tf.estimator.ModeKeys.TRAIN)
-
-        predictions = model(features, training=training)
-
-        total_loss = loss_fn(labels, predictions)
-        reg_losses = model.get_losses_for(None) + model.get_losses_for(features)
-        if reg_losses:
-            total_loss += tf.math.add_n(reg_losses)
-
-        # Compute training metrics.
-        accuracy = tf.compat.v1.metrics.accuracy(
-            labels=labels,
-            predictions=tf.math.argmax(predictions, axis=-1),
-            name='acc_op')
-        accuracy_top_5 = tf.compat.v1.metrics.mean(
-            tf.math.in_top_k(
-                predictions=predictions,
-                targets=tf.reshape(labels, [-1]),
-                k=5,
-                name='top_5_op'))
-        metrics = {'accuracy': accuracy, 'accuracy_top_5': accuracy_top_5}
-
-        update_ops = model.get_updates_for(features) + model.get_updates_for(
-            None)
-        with tf.control_dependencies(update_ops):
-            train_op = optimizer.minimize(
-                total_loss,
-                var_list=model.trainable_variables,
-                global_step=global_step)
-        # Keep track of training accuracy.
-        if mode == tf.estimator.ModeKeys.TRAIN:
-            tf.compat.v1.summary.scalar('train_accuracy', accuracy[1])
-            tf.compat.v1.summary.scalar('train_accuracy_top_5',
-                                        accuracy_top_5[1])
+            return get_model(FLAGS.model)
 
-        return tf.estimator.EstimatorSpec(
-            mode=mode,
-            loss=total_loss,
-            train_op=train_op,
-            eval_metric_ops=metrics)
+    def optimizer_fn(global_step):
+        # Learning rates are scaled to the global batch of all replicas.
+        return get_optimizer(FLAGS.model, global_step, FLAGS.batch_size,
+                             strategy.num_replicas_in_sync, FLAGS.accum_steps)
 
-    # Now we're ready to configure our estimator and train.
     # Determine proper name for this model.
     full_model_path = os.path.join(FLAGS.model_dir,
                                    "%s_%s" % (FLAGS.model, FLAGS.experiment))
-    # Figure out which GPUS to run on.
-    if num_gpus > 1:
-        strategy = tf.distribute.MirroredStrategy()
-    else:
-        strategy = None
-    session_config = tf.compat.v1.ConfigProto(
-        inter_op_parallelism_threads=op_threads,
-        intra_op_parallelism_threads=op_threads,
-        allow_soft_placement=True)
-    session_config.gpu_options.allow_growth = True
-    run_config = tf.estimator.RunConfig(
-        save_summary_steps=500,
-        log_step_count_steps=500,
-        save_checkpoints_secs=3600,
-        train_distribute=strategy,
-        session_config=session_config)
-    classifier = tf.estimator.Estimator(
-        model_fn=model_fn, model_dir=full_model_path, config=run_config)
-    train_spec = tf.estimator.TrainSpec(
-        input_fn=train_input_fn, max_steps=None)
-    eval_spec = tf.estimator.EvalSpec(input_fn=eval_input_fn)
-    tf.estimator.train_and_evaluate(classifier, train_spec, eval_spec)
+    trainer = Trainer(
+        model_fn,
+        optimizer_fn,
+        full_model_path,
+        global_batch_size,
+        strategy=strategy,
+        jit_compile=FLAGS.jit_compile,
+        steps_per_execution=FLAGS.steps_per_execution,
+        checkpoint_steps=FLAGS.checkpoint_steps,
+        accum_steps=FLAGS.accum_steps,
+        preprocess_fn=augment_batch if FLAGS.device_augment else None,
+        echo_factor=FLAGS.echo_factor)
+    total_steps = FLAGS.epochs * _NUM_IMAGES // (
+        global_batch_size * FLAGS.accum_steps)
+    trainer.train(
+        train_input_fn,
+        total_steps,
+        eval_dataset=eval_input_fn,
+        eval_every=FLAGS.eval_steps)
 
 
 if __name__ == '__main__':
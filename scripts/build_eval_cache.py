@@ -0,0 +1,41 @@
+import os
+import time
+from riptide.utils.eval_cache import build_eval_cache, eval_cache_dataset
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('data_path', '/data/imagenet/tfrecords',
+                    'Directory containing val* tfrecords to decode.')
+flags.DEFINE_string('output', None, 'Eval cache file to write.')
+flags.DEFINE_integer('image_size', 224,
+                     'Height and Width of cached images.')
+flags.DEFINE_integer('num_workers', 8, 'Images decoded in parallel.')
+flags.DEFINE_integer('batch_size', 256,
+                     'Batch size used to time reading the finished cache.')
+flags.mark_flag_as_required('output')
+
+
+def main(argv):
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    start = time.perf_counter()
+    count = build_eval_cache(
+        FLAGS.data_path,
+        FLAGS.output,
+        FLAGS.image_size,
+        num_workers=FLAGS.num_workers)
+    logging.info('Cached %d images in %.1f s, %.1f MB.' %
+                 (count, time.perf_counter() - start,
+                  os.path.getsize(FLAGS.output) / 2.0**20))
+    start = time.perf_counter()
+    for _ in eval_cache_dataset(FLAGS.output, FLAGS.batch_size):
+        pass
+    logging.info('Read back at %.0f images/sec.' %
+                 (count / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import tensorflow as tf
+from riptide.utils.datasets import _parse_imagenet
+from riptide.utils.preprocessing.inception_preprocessing import (
+    decode_and_crop_for_train, decode_and_crop_for_eval, decode_jpeg_at_scale)
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    'data_dir', None,
+    'Directory of TFRecords written by tf_record_writer.py, or of JPEG '
+    'files, searched recursively.')
+flags.DEFINE_list('image_sizes', ['112', '160', '224'],
+                  'Output sizes to measure decode throughput at.')
+flags.DEFINE_integer('images', 512, 'Number of images decoded per run.')
+flags.DEFINE_integer('repeats', 3,
+                     'Timed passes over the images, the fastest is kept.')
+flags.DEFINE_integer('num_workers', 1,
+                     'Parallel decode calls, 1 measures a single core.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+flags.mark_flag_as_required('data_dir')
+
+
+def load_buffers(data_dir, count):
+    """Reads `count` encoded JPEGs into memory so disk reads are not timed."""
+    records = tf.io.gfile.glob(os.path.join(data_dir, '*-*'))
+    if records:
+        ds = tf.data.TFRecordDataset(records).map(
+            lambda proto: _parse_imagenet(proto)[0])
+    else:
+        files = []
+        for root, _, names in os.walk(data_dir):
+            files.extend(
+                os.path.join(root, n) for n in names
+                if n.lower().endswith(('.jpg', '.jpeg')))
+        ds = tf.data.Dataset.from_tensor_slices(sorted(files)).map(
+            tf.io.read_file)
+    buffers = list(ds.take(count))
+    if not buffers:
+        raise ValueError('No images found in %s.' % data_dir)
+    return buffers
+
+
+def decoders(image_size):
+    """Ways of producing an image_size crop, from slowest to fastest."""
+
+    def full(buffer, is_training):
+        image = tf.io.decode_jpeg(buffer, channels=3)
+        return tf.image.resize(image, [image_size, image_size])
+
+    def fused(buffer, is_training):
+        if is_training:
+            image = decode_and_crop_for_train(buffer)
+        else:
+            image = decode_and_crop_for_eval(buffer)
+        return tf.image.resize(image, [image_size, image_size])
+
+    def dct(buffer, is_training):
+        if is_training:
+            image = decode_and_crop_for_train(buffer, min_size=image_size)
+        else:
+            image = decode_and_crop_for_eval(buffer, min_size=image_size)
+        return tf.image.resize(image, [image_size, image_size])
+
+    def dct_full(buffer, is_training):
+        image = decode_jpeg_at_scale(buffer, image_size)
+        return tf.image.resize(image, [image_size, image_size])
+
+    return [('full', full), ('fused_crop', fused), ('dct_full', dct_full),
+            ('dct_crop', dct)]
+
+
+def images_per_sec(buffers, decode_fn, is_training):
+    ds = tf.data.Dataset.from_tensor_slices(tf.stack(buffers))
+    ds = ds.map(
+        lambda b: decode_fn(b, is_training),
+        num_parallel_calls=FLAGS.num_workers)
+    ds = ds.batch(64)
+    # The first pass traces the function and warms up libjpeg.
+    for _ in ds.take(1):
+        pass
+    best = float('inf')
+    for _ in range(FLAGS.repeats):
+        start = time.perf_counter()
+        for _ in ds:
+            pass
+        best = min(best, time.perf_counter() - start)
+    return len(buffers) / best
+
+
+def main(argv):
+    buffers = load_buffers(FLAGS.data_dir, FLAGS.images)
+    shapes = [tf.image.extract_jpeg_shape(b).numpy() for b in buffers]
+    logging.info('Loaded %d images, mean size %dx%d.' %
+                 (len(buffers), sum(s[0] for s in shapes) / len(shapes),
+                  sum(s[1] for s in shapes) / len(shapes)))
+    results = []
+    for image_size in FLAGS.image_sizes:
+        image_size = int(image_size)
+        for is_training in (True, False):
+            baseline = None
+            for name, decode_fn in decoders(image_size):
+                rate = images_per_sec(buffers, decode_fn, is_training)
+                baseline = baseline or rate
+                logging.info('size %d %s %-10s %8.1f images/sec (%.2fx)' %
+                             (image_size, 'train' if is_training else 'eval ',
+                              name, rate, rate / baseline))
+                results.append({
+                    'image_size': image_size,
+                    'is_training': is_training,
+                    'decoder': name,
+                    'images_per_sec': rate,
+                    'speedup': rate / baseline,
+                })
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
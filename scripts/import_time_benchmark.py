@@ -0,0 +1,62 @@
+import sys
+import json
+import subprocess
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_list('models', ['vggnet', 'resnet50', 'squeezenet'],
+                  'Models to time construction of in a fresh interpreter.')
+flags.DEFINE_integer('repeats', 3,
+                     'Number of fresh interpreters to average over.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+# Each snippet runs in a new interpreter so module caches are cold.
+_SNIPPET = """
+import time
+start = time.perf_counter()
+from riptide.get_models import get_model
+imported = time.perf_counter()
+{build}
+built = time.perf_counter()
+print(imported - start, built - imported)
+"""
+
+
+def time_snippet(build):
+    code = _SNIPPET.format(build=build)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    import_time, build_time = output.decode().split()[-2:]
+    return float(import_time), float(build_time)
+
+
+def measure(label, build):
+    times = [time_snippet(build) for _ in range(FLAGS.repeats)]
+    import_time = sum(t[0] for t in times) / len(times)
+    build_time = sum(t[1] for t in times) / len(times)
+    logging.info('%s: import %.3f s, first model %.3f s' %
+                 (label, import_time, build_time))
+    return {
+        'model': label,
+        'import_sec': import_time,
+        'build_sec': build_time
+    }
+
+
+def main(argv):
+    results = [measure('none', 'pass')]
+    for name in FLAGS.models:
+        build = ('from riptide.binary.binary_layers import Config\n'
+                 'with Config(bits=2.0):\n'
+                 '    get_model(%r)' % name)
+        results.append(measure(name, build))
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
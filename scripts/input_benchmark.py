@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import socket
+import multiprocessing
+import tensorflow as tf
+from riptide.utils.datasets import (imagerecord_dataset, imagefolder_dataset,
+                                    _get_shard_dataset, _parse_imagenet)
+from riptide.utils.manifest import load_manifest
+from riptide.utils.preprocessing.inception_preprocessing import preprocess_image
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_enum(
+    'source', 'records', ['records', 'folder', 'tfds'],
+    'Input pipeline to measure: TFRecords read by imagerecord_dataset, an '
+    'image folder read by imagefolder_dataset, or the tfds pipeline of '
+    'scripts/train_imagenet.py.')
+flags.DEFINE_string(
+    'data_dir', None,
+    'Record directory or image folder root, tfds data_dir for tfds.')
+flags.DEFINE_integer('image_size', 224, 'Height and Width of images.')
+flags.DEFINE_integer('batch_size', 64, 'Size of each minibatch.')
+flags.DEFINE_list('workers', ['1', '2', '4', '8'],
+                  'Parallel calls of every stage to sweep.')
+flags.DEFINE_integer('images', 2048,
+                     'Images timed per stage, after warming up.')
+flags.DEFINE_integer('warmup', 256, 'Images read before timing starts.')
+flags.DEFINE_float(
+    'target_images_per_sec', None,
+    'Training speed of the model, if the input pipeline is slower the job '
+    'is input bound.')
+flags.DEFINE_integer(
+    'echo_factor', 1,
+    'Data echoing of the full records pipeline, see imagerecord_dataset. '
+    'Unique images per second are reported next to the echoed rate.')
+flags.DEFINE_enum('echo_level', 'example', ['example', 'batch'],
+                  'Echo decoded examples or finished batches.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+# Stages in pipeline order. Each stage runs everything before it, so its
+# rate is the throughput of the pipeline up to and including the stage.
+STAGES = [
+    'read', 'decode', 'preprocess_train', 'preprocess_eval', 'batch',
+    'prefetch', 'full'
+]
+# More workers have to speed the full pipeline up by at least this factor
+# to count as scaling.
+_MIN_SPEEDUP = 1.1
+
+
+def _encoded_images(workers):
+    """Returns a repeating dataset of encoded images of the source."""
+    if FLAGS.source == 'records':
+        files = _get_shard_dataset(FLAGS.data_dir, split='train')
+        ds = files.interleave(
+            tf.data.TFRecordDataset,
+            cycle_length=workers,
+            num_parallel_calls=workers)
+        ds = ds.map(
+            lambda proto: _parse_imagenet(proto)[0],
+            num_parallel_calls=workers)
+    elif FLAGS.source == 'folder':
+        manifest = load_manifest(os.path.join(FLAGS.data_dir, 'train'))
+        ds = tf.data.Dataset.from_tensor_slices(manifest.full_paths())
+        ds = ds.shuffle(len(manifest)).map(
+            tf.io.read_file, num_parallel_calls=workers)
+    else:
+        import tensorflow_datasets as tfds
+        ds = tfds.load(
+            'imagenet2012:5.0.0',
+            split=tfds.Split.TRAIN,
+            data_dir=FLAGS.data_dir,
+            shuffle_files=True,
+            decoders={'image': tfds.decode.SkipDecoding()},
+            read_config=tfds.ReadConfig(interleave_cycle_length=workers))
+        ds = ds.map(lambda data: data['image'], num_parallel_calls=workers)
+    return ds.repeat()
+
+
+def _full_pipeline(workers):
+    # The dataset a training script would use.
+    def preprocess(image):
+        return preprocess_image(
+            image, FLAGS.image_size, FLAGS.image_size, is_training=True)
+
+    if FLAGS.source == 'records':
+        ds = imagerecord_dataset(
+            FLAGS.data_dir,
+            FLAGS.batch_size,
+            image_size=FLAGS.image_size,
+            num_workers=workers,
+            echo_factor=FLAGS.echo_factor,
+            echo_level=FLAGS.echo_level)
+    elif FLAGS.source == 'folder':
+        ds = imagefolder_dataset(
+            FLAGS.data_dir,
+            FLAGS.batch_size,
+            preprocess=preprocess,
+            num_workers=workers)
+    else:
+        import tensorflow_datasets as tfds
+        ds = tfds.load(
+            'imagenet2012:5.0.0',
+            split=tfds.Split.TRAIN,
+            data_dir=FLAGS.data_dir,
+            shuffle_files=True)
+        ds = ds.shuffle(buffer_size=10000)
+        ds = ds.map(
+            lambda data: (preprocess(data['image']), data['label']),
+            num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        ds = ds.batch(FLAGS.batch_size, drop_remainder=True)
+        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
+    return ds.repeat()
+
+
+def build_stage(stage, workers):
+    """Returns the dataset ending in `stage` and its images per element."""
+    if stage == 'full':
+        return _full_pipeline(workers), FLAGS.batch_size
+    ds = _encoded_images(workers)
+    if stage == 'read':
+        return ds, 1
+    decode = lambda buffer: tf.io.decode_jpeg(buffer, channels=3)
+    if stage == 'decode':
+        return ds.map(decode, num_parallel_calls=workers), 1
+    is_training = stage != 'preprocess_eval'
+    ds = ds.map(
+        lambda buffer: preprocess_image(
+            decode(buffer),
+            FLAGS.image_size,
+            FLAGS.image_size,
+            is_training=is_training),
+        num_parallel_calls=workers)
+    if stage.startswith('preprocess'):
+        return ds, 1
+    ds = ds.batch(FLAGS.batch_size)
+    if stage == 'batch':
+        return ds, FLAGS.batch_size
+    return ds.prefetch(tf.data.experimental.AUTOTUNE), FLAGS.batch_size
+
+
+def images_per_sec(ds, images_per_element):
+    iterator = iter(ds)
+    for _ in range(max(1, FLAGS.warmup // images_per_element)):
+        next(iterator)
+    elements = max(1, FLAGS.images // images_per_element)
+    start = time.perf_counter()
+    for _ in range(elements):
+        next(iterator)
+    return elements * images_per_element / (time.perf_counter() - start)
+
+
+def bottleneck(rates):
+    """The stage that slows its predecessor down the most.
+
+    Eval preprocessing is a separate branch, it is reported but not ranked.
+    """
+    previous = {
+        'decode': 'read',
+        'preprocess_train': 'decode',
+        'preprocess_eval': 'decode',
+        'batch': 'preprocess_train',
+        'prefetch': 'batch',
+    }
+    worst, worst_ratio = 'read', 1.0
+    for stage, before in previous.items():
+        ratio = rates[stage] / rates[before]
+        if stage != 'preprocess_eval' and ratio < worst_ratio:
+            worst, worst_ratio = stage, ratio
+    return worst
+
+
+def saturation(results, workers):
+    """First worker count beyond which the full pipeline stops scaling."""
+    full = [results[w]['full'] for w in workers]
+    for i in range(1, len(workers)):
+        if full[i] < full[i - 1] * _MIN_SPEEDUP:
+            return workers[i - 1]
+    return workers[-1]
+
+
+def main(argv):
+    if FLAGS.source != 'tfds' and not FLAGS.data_dir:
+        raise app.UsageError('--data_dir is required for %s.' % FLAGS.source)
+    if FLAGS.echo_factor > 1 and FLAGS.source != 'records':
+        raise app.UsageError('--echo_factor requires --source records.')
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    workers = [int(w) for w in FLAGS.workers]
+    results = {}
+    for w in workers:
+        results[w] = {}
+        for stage in STAGES:
+            ds, images_per_element = build_stage(stage, w)
+            rate = images_per_sec(ds, images_per_element)
+            results[w][stage] = rate
+            logging.info('%2d workers %-17s %9.1f images/sec' %
+                         (w, stage, rate))
+        if FLAGS.echo_factor > 1:
+            logging.info('%2d workers %-17s %9.1f unique images/sec' %
+                         (w, 'full', results[w]['full'] / FLAGS.echo_factor))
+        logging.info('%2d workers: limited by %s.' %
+                     (w, bottleneck(results[w])))
+
+    saturated = saturation(results, workers)
+    limit = bottleneck(results[saturated])
+    best = max(results[w]['full'] for w in workers)
+    logging.info('The pipeline stops scaling at %d workers, %.1f images/sec, '
+                 'limited by %s.' % (saturated, best, limit))
+    if FLAGS.target_images_per_sec:
+        logging.info('Training needs %.1f images/sec, the job is %s.' %
+                     (FLAGS.target_images_per_sec,
+                      'input bound' if best < FLAGS.target_images_per_sec
+                      else 'not input bound'))
+    if FLAGS.output:
+        report = {
+            'host': socket.gethostname(),
+            'cpus': multiprocessing.cpu_count(),
+            'tensorflow': tf.__version__,
+            'source': FLAGS.source,
+            'image_size': FLAGS.image_size,
+            'batch_size': FLAGS.batch_size,
+            'results': [{
+                'workers': w,
+                'stage': stage,
+                'images_per_sec': results[w][stage],
+            } for w in workers for stage in STAGES],
+            'bottlenecks': {str(w): bottleneck(results[w])
+                            for w in workers},
+            'saturated_workers': saturated,
+            'saturated_stage': limit,
+            'best_images_per_sec': best,
+            'echo_factor': FLAGS.echo_factor,
+            'echo_level': FLAGS.echo_level,
+            'best_unique_images_per_sec': best / FLAGS.echo_factor,
+            'target_images_per_sec': FLAGS.target_images_per_sec,
+        }
+        with open(FLAGS.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
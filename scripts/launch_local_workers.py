@@ -0,0 +1,34 @@
+"""Runs a training script as a multi-worker cluster on one machine.
+
+Every worker gets its own TF_CONFIG, for example
+
+    python scripts/launch_local_workers.py --num_workers=2 -- \
+        python scripts/train_imagenet.py --model=vggnet --binary
+"""
+import sys
+from riptide.utils.distribute import launch_local_workers
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_integer('num_workers', 2, 'Number of worker processes.')
+flags.DEFINE_bool('cpu_only', True,
+                  'Hide GPUs so the workers share the CPU of this machine.')
+
+
+def main(argv):
+    command = argv[1:]
+    if not command:
+        raise app.UsageError('Pass the worker command after --.')
+    codes = launch_local_workers(command, FLAGS.num_workers,
+                                 cpu_only=FLAGS.cpu_only)
+    for i, code in enumerate(codes):
+        logging.info('Worker %d exited with %d.' % (i, code))
+    sys.exit(max(abs(c) for c in codes))
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,59 @@
+import numpy as np
+from riptide.get_models import get_model
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.utils.profiler import profile_model
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'vggnet', 'Name of model to profile.')
+flags.DEFINE_bool('binary', True, 'Whether to use a binarized model.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_integer('image_size', 224, 'Height and Width of input images.')
+flags.DEFINE_integer('batch_size', 1, 'Size of the profiled batch.')
+flags.DEFINE_enum('mode', 'eager', ['eager', 'graph'],
+                  'Run layers op by op or compiled with tf.function.')
+flags.DEFINE_integer('repeats', 10, 'Timed runs per layer.')
+flags.DEFINE_string(
+    'input', '', 'Optional .npy file with a real input batch, random '
+    'images are used otherwise.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def main(argv):
+    if FLAGS.binary:
+        config = Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=FLAGS.bits,
+            use_act=False,
+            use_bn=False,
+            use_maxpool=True)
+    else:
+        config = Config()
+    with config:
+        model = get_model(FLAGS.model)
+
+    if FLAGS.input:
+        inputs = np.load(FLAGS.input).astype(np.float32)
+    else:
+        inputs = np.random.uniform(
+            -1,
+            1,
+            size=[
+                FLAGS.batch_size, FLAGS.image_size, FLAGS.image_size, 3
+            ]).astype(np.float32)
+
+    result = profile_model(
+        model, inputs, mode=FLAGS.mode, repeats=FLAGS.repeats)
+    logging.info('\n' + result.table())
+    if FLAGS.output:
+        result.to_json(FLAGS.output)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,111 @@
+import json
+import time
+import tensorflow as tf
+from riptide.get_models import get_model
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'q_resnet101', 'Name of ResNet to benchmark.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_integer('image_size', 224, 'Height and Width of input images.')
+flags.DEFINE_list('batch_sizes', ['32', '64', '128'],
+                  'Per device batch sizes to sweep.')
+flags.DEFINE_integer('steps', 10, 'Timed training steps per setting.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def peak_memory(device):
+    try:
+        return tf.config.experimental.get_memory_info(device)['peak']
+    except (AttributeError, ValueError):
+        return None
+
+
+def reset_memory(device):
+    try:
+        tf.config.experimental.reset_memory_stats(device)
+    except (AttributeError, ValueError):
+        pass
+
+
+def benchmark(recompute, batch_size, device):
+    with Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=FLAGS.bits,
+            use_act=False,
+            use_bn=False,
+            use_maxpool=True):
+        model = get_model(FLAGS.model, recompute=recompute)
+    optimizer = tf.keras.optimizers.SGD(0.01, momentum=0.9)
+    images = tf.random.uniform(
+        [batch_size, FLAGS.image_size, FLAGS.image_size, 3])
+    labels = tf.random.uniform([batch_size],
+                               maxval=1000,
+                               dtype=tf.int32)
+    # Build outside of the step, blocks only recompute once built.
+    model(images[:1])
+
+    @tf.function
+    def train_step(images, labels):
+        with tf.GradientTape() as tape:
+            logits = model(images, training=True)
+            loss = tf.reduce_mean(
+                tf.keras.losses.sparse_categorical_crossentropy(
+                    labels, logits, from_logits=True))
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return loss
+
+    train_step(images, labels).numpy()
+    reset_memory(device)
+    start = time.perf_counter()
+    for _ in range(FLAGS.steps):
+        loss = train_step(images, labels)
+    loss.numpy()
+    elapsed = time.perf_counter() - start
+    return {
+        'recompute': recompute,
+        'batch_size': batch_size,
+        'images_per_sec': FLAGS.steps * batch_size / elapsed,
+        'peak_bytes': peak_memory(device),
+    }
+
+
+def main(argv):
+    device = 'GPU:0' if tf.config.experimental.list_physical_devices(
+        'GPU') else 'CPU:0'
+    results = []
+    for batch_size in [int(b) for b in FLAGS.batch_sizes]:
+        for recompute in [False, True]:
+            try:
+                result = benchmark(recompute, batch_size, device)
+            except tf.errors.ResourceExhaustedError:
+                logging.info('batch %d recompute=%s: out of memory' %
+                             (batch_size, recompute))
+                results.append({
+                    'recompute': recompute,
+                    'batch_size': batch_size,
+                    'oom': True
+                })
+                continue
+            peak = result['peak_bytes']
+            logging.info(
+                'batch %d recompute=%s: %.1f img/s, peak %s' %
+                (batch_size, recompute, result['images_per_sec'],
+                 '%.0f MB' % (peak / 2.0**20) if peak else 'unavailable'))
+            results.append(result)
+
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,76 @@
+import os
+import json
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.serving.batching import InferenceServer, keras_replica
+from riptide.serving.load_generator import run_synthetic_load
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'vggnet', 'Name of model to serve.')
+flags.DEFINE_bool('binary', 1, 'Serve a binary network.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_integer('image_size', 224,
+                     'Height and Width of served images.')
+flags.DEFINE_integer('replicas', 2, 'Number of model replicas to serve.')
+flags.DEFINE_list('max_batch_sizes', ['1', '8', '32'],
+                  'Maximum batch sizes to benchmark.')
+flags.DEFINE_float('max_latency_ms', 5.0,
+                   'Maximum time a request waits for its batch to fill.')
+flags.DEFINE_integer('clients', 32, 'Number of concurrent clients.')
+flags.DEFINE_integer('requests', 50, 'Number of requests sent per client.')
+flags.DEFINE_float('think_time_ms', 0.0,
+                   'Maximum random delay between requests of a client.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def main(argv):
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    if FLAGS.binary:
+        config = Config(
+            actQ=DQuantize,
+            weightQ=XQuantize,
+            bits=FLAGS.bits,
+            use_act=False,
+            use_bn=False,
+            use_maxpool=True)
+    else:
+        config = Config()
+    input_shape = (FLAGS.image_size, FLAGS.image_size, 3)
+    replicas = [
+        keras_replica(FLAGS.model, config, input_shape)
+        for _ in range(FLAGS.replicas)
+    ]
+
+    results = []
+    for max_batch_size in FLAGS.max_batch_sizes:
+        server = InferenceServer(
+            replicas,
+            max_batch_size=int(max_batch_size),
+            max_latency_ms=FLAGS.max_latency_ms)
+        with server:
+            summary = run_synthetic_load(
+                server,
+                input_shape,
+                num_clients=FLAGS.clients,
+                requests_per_client=FLAGS.requests,
+                think_time_ms=FLAGS.think_time_ms)
+        summary['max_batch_size'] = int(max_batch_size)
+        logging.info(
+            'max_batch %3d: p50 %.2f ms, p99 %.2f ms, %.1f img/s, mean batch %.1f'
+            % (summary['max_batch_size'], summary['p50_ms'],
+               summary['p99_ms'], summary['throughput'],
+               summary['mean_batch_size']))
+        results.append(summary)
+
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
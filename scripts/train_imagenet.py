@@ -1,19 +1,21 @@
 import os
-import multiprocessing
 import tensorflow as tf
 import tensorflow_datasets as tfds
-from functools import partial
 from riptide.get_models import get_model
 from riptide.utils.thread_helper import setup_gpu_threadpool
+from riptide.utils.training import Trainer
+from riptide.utils.distribute import get_strategy
+from riptide.utils.eval_cache import eval_cache_dataset
 from riptide.binary.binary_layers import Config, DQuantize, XQuantize
 from riptide.utils.preprocessing.inception_preprocessing import preprocess_image
 
 from absl import app
 from absl import flags
-from absl import logging
 
 FLAGS = flags.FLAGS
 
+_NUM_IMAGES = 1281167
+
 flags.DEFINE_string('model_dir', '/data/jwfromm/models',
                     'Directory to save models in.')
 flags.DEFINE_string('model', '', 'Name of model to train, must be set.')
@@ -25,12 +27,43 @@ flags.DEFINE_integer('epochs', 480, 'Number of epochs to train.')
 flags.DEFINE_integer('batch_size', 64, 'Size of each minibatch.')
 flags.DEFINE_integer('image_size', 224,
                      'Height and Width of processed images.')
-flags.DEFINE_float('learning_rate', .0128, 'Starting learning rate.')
+flags.DEFINE_float(
+    'learning_rate', .0128,
+    'Starting learning rate for a batch of batch_size, scaled linearly to '
+    'the global batch size.')
 flags.DEFINE_float('wd', 1e-4, 'Weight decay loss coefficient.')
 flags.DEFINE_float('momentum', 0.9, 'Momentum used for optimizer.')
 flags.DEFINE_bool('binary', 0, 'Use a binary network.')
 flags.DEFINE_float('bits', 2.0,
                    'Number of activation bits to use for binary model.')
+flags.DEFINE_integer(
+    'accum_steps', 1,
+    'Accumulate gradients of this many batches per optimizer step, the '
+    'effective batch size is batch_size * num_gpus * accum_steps.')
+flags.DEFINE_bool('jit_compile', True,
+                  'Compile the forward and backward pass with XLA.')
+flags.DEFINE_integer('steps_per_execution', 100,
+                     'Training steps run per call of the step function.')
+flags.DEFINE_integer('checkpoint_steps', 5000,
+                     'Steps between asynchronous checkpoints.')
+flags.DEFINE_integer('eval_steps', 50000,
+                     'Steps between evaluations of the validation set.')
+flags.DEFINE_string(
+    'eval_cache', '',
+    'Eval cache written by scripts/build_eval_cache.py at image_size, read '
+    'instead of decoding the validation set for every evaluation.')
+flags.DEFINE_enum(
+    'mixed_precision', None, ['float16', 'bfloat16'],
+    'Run activations and quantizers in this dtype while keeping latent '
+    'weights in float32, float16 also enables dynamic loss scaling.')
+
+
+def set_mixed_precision_policy(dtype):
+    name = 'mixed_%s' % dtype
+    if hasattr(tf.keras.mixed_precision, 'set_global_policy'):
+        tf.keras.mixed_precision.set_global_policy(name)
+    else:
+        tf.keras.mixed_precision.experimental.set_policy(name)
 
 
 def main(argv):
@@ -39,6 +72,13 @@ def main(argv):
     # Get thread confirguration.
     op_threads, num_workers = setup_gpu_threadpool(len(FLAGS.gpus.split(',')))
     num_gpus = len(FLAGS.gpus.split(','))
+    tf.config.threading.set_inter_op_parallelism_threads(op_threads)
+    for gpu in tf.config.experimental.list_physical_devices('GPU'):
+        tf.config.experimental.set_memory_growth(gpu, True)
+    # Uses all workers listed in TF_CONFIG, or the local GPUs without it.
+    strategy = get_strategy(num_gpus)
+    # The batch size flag is per device, as it was with the Estimator.
+    global_batch_size = FLAGS.batch_size * strategy.num_replicas_in_sync
     # Set up the data input functions.
     def train_preprocess(data):
         img = preprocess_image(
@@ -56,30 +96,42 @@ def main(argv):
             is_training=False)
         return img, data["label"]
 
-    def train_input_fn():
+    def train_input_fn(input_context):
+        # Every worker reads its own share of the dataset files.
         ds = tfds.load(
             "imagenet2012:5.0.0",
             split=tfds.Split.TRAIN,
-            shuffle_files=True)
+            shuffle_files=True,
+            read_config=tfds.ReadConfig(input_context=input_context))
         ds = ds.shuffle(buffer_size=10000)
         ds = ds.map(train_preprocess, num_parallel_calls=tf.data.experimental.AUTOTUNE)
-        ds = ds.batch(FLAGS.batch_size)
-        ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
-        return ds.repeat(FLAGS.epochs)
-
-    def eval_input_fn():
+        # Batches must be complete for the compiled step to keep static shapes.
+        ds = ds.batch(
+            input_context.get_per_replica_batch_size(global_batch_size),
+            drop_remainder=True)
+        return ds.repeat().prefetch(tf.data.experimental.AUTOTUNE)
+
+    def eval_input_fn(input_context):
+        # Every worker evaluates its own share of the validation set.
+        batch_size = input_context.get_per_replica_batch_size(
+            global_batch_size)
+        if FLAGS.eval_cache:
+            return eval_cache_dataset(
+                FLAGS.eval_cache,
+                batch_size,
+                num_shards=input_context.num_input_pipelines,
+                shard_index=input_context.input_pipeline_id,
+                image_size=FLAGS.image_size)
         ds = tfds.load(
             "imagenet2012:5.0.0",
-            split=tfds.Split.VALIDATION)
+            split=tfds.Split.VALIDATION,
+            read_config=tfds.ReadConfig(input_context=input_context))
         ds = ds.map(eval_preprocess, num_parallel_calls=tf.data.experimental.AUTOTUNE)
-        ds = ds.batch(FLAGS.batch_size)
+        ds = ds.batch(batch_size)
         ds = ds.prefetch(tf.data.experimental.AUTOTUNE)
         return ds
 
-    # Set up estimaor model function.
-    def model_fn(features, labels, mode):
-        # Generate summary for input images.
-        tf.compat.v1.summary.image('images', features, max_outputs=4)
+    def model_fn():
         if FLAGS.binary:
             actQ = DQuantize
             weightQ = XQuantize
@@ -105,91 +157,44 @@ def main(argv):
             use_maxpool=use_maxpool)
 
         with config:
-            model = get_model(FLAGS.model)
-
-        global_step = tf.compat.v1.train.get_or_create_global_step()
-        learning_rate = tf.compat.v1.train.cosine_decay_restarts(
-            FLAGS.learning_rate, global_step, 1000)
-        tf.compat.v1.summary.scalar('learning_rate', learning_rate)
-        optimizer = tf.compat.v1.train.MomentumOptimizer(
+            return get_model(FLAGS.model)
+
+    def optimizer_fn(global_step):
+        # Linear scaling of the learning rate to the effective batch size.
+        learning_rate = tf.keras.optimizers.schedules.CosineDecayRestarts(
+            FLAGS.learning_rate * global_batch_size * FLAGS.accum_steps /
+            FLAGS.batch_size, 1000)
+        optimizer = tf.keras.optimizers.SGD(
             learning_rate=learning_rate,
             momentum=FLAGS.momentum,
-            use_nesterov=False)
-        loss_object = tf.keras.losses.SparseCategoricalCrossentropy(reduction=tf.keras.losses.Reduction.NONE)
-        def loss_fn(labels, predictions):
-            per_example_loss = loss_object(labels, predictions)
-            return tf.nn.compute_average_loss(per_example_loss, global_batch_size=FLAGS.batch_size)
-
-        # Get proper mode for batchnorm and dropout, must be python bool.
-        training = (mode == tf.estimator.ModeKeys.TRAIN)
-
-        predictions = model(features, training=training)
-
-        total_loss = loss_fn(labels, predictions)
-        reg_losses = model.get_losses_for(None) + model.get_losses_for(features)
-        if reg_losses:
-            total_loss += tf.math.add_n(reg_losses)
-
-        # Compute training metrics.
-        accuracy = tf.compat.v1.metrics.accuracy(
-            labels=labels,
-            predictions=tf.math.argmax(predictions, axis=-1),
-            name='acc_op')
-        accuracy_top_5 = tf.compat.v1.metrics.mean(
-            tf.math.in_top_k(
-                predictions=predictions,
-                targets=tf.reshape(labels, [-1]),
-                k=5,
-                name='top_5_op'))
-        metrics = {'accuracy': accuracy, 'accuracy_top_5': accuracy_top_5}
-
-        # Now define optimizer function.
-        update_ops = model.get_updates_for(features) + model.get_updates_for(
-            None)
-        with tf.control_dependencies(update_ops):
-            train_op = optimizer.minimize(
-                total_loss,
-                var_list=model.trainable_variables,
-                global_step=global_step)
-        # Keep track of training accuracy.
-        if mode == tf.estimator.ModeKeys.TRAIN:
-            tf.compat.v1.summary.scalar('train_accuracy', accuracy[1])
-            tf.compat.v1.summary.scalar('train_accuracy_top_5',
-                                        accuracy_top_5[1])
-
-        return tf.estimator.EstimatorSpec(
-            mode=mode,
-            loss=total_loss,
-            train_op=train_op,
-            eval_metric_ops=metrics)
-
-    # Now we're ready to configure our estimator and train.
+            nesterov=False)
+        return optimizer, learning_rate
+
+    if FLAGS.mixed_precision:
+        set_mixed_precision_policy(FLAGS.mixed_precision)
+
     # Determine proper name for this model.
     full_model_path = os.path.join(FLAGS.model_dir,
                                    "%s_%s" % (FLAGS.model, FLAGS.experiment))
-    # Figure out which GPUS to run on.
-    if num_gpus > 1:
-        strategy = tf.distribute.MirroredStrategy()
-    else:
-        strategy = None
-    session_config = tf.compat.v1.ConfigProto(
-        inter_op_parallelism_threads=op_threads,
-        intra_op_parallelism_threads=op_threads,
-        allow_soft_placement=True,
-    )
-    session_config.gpu_options.allow_growth = True
-    run_config = tf.estimator.RunConfig(
-        save_summary_steps=500,
-        log_step_count_steps=500,
-        save_checkpoints_secs=3600,
-        train_distribute=strategy,
-        session_config=session_config)
-    classifier = tf.estimator.Estimator(
-        model_fn=model_fn, model_dir=full_model_path, config=run_config)
-    train_spec = tf.estimator.TrainSpec(
-        input_fn=train_input_fn, max_steps=None)
-    eval_spec = tf.estimator.EvalSpec(input_fn=eval_input_fn)
-    tf.estimator.train_and_evaluate(classifier, train_spec, eval_spec)
+    trainer = Trainer(
+        model_fn,
+        optimizer_fn,
+        full_model_path,
+        global_batch_size,
+        strategy=strategy,
+        jit_compile=FLAGS.jit_compile,
+        steps_per_execution=FLAGS.steps_per_execution,
+        checkpoint_steps=FLAGS.checkpoint_steps,
+        accum_steps=FLAGS.accum_steps,
+        # Small float16 gradients underflow without loss scaling.
+        loss_scale=FLAGS.mixed_precision == 'float16')
+    total_steps = FLAGS.epochs * _NUM_IMAGES // (
+        global_batch_size * FLAGS.accum_steps)
+    trainer.train(
+        train_input_fn,
+        total_steps,
+        eval_dataset=eval_input_fn,
+        eval_every=FLAGS.eval_steps)
 
 
 if __name__ == '__main__':
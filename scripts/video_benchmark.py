@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import numpy as np
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.serving.batching import keras_replica
+from riptide.serving.video import VideoPipeline
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'vggnet', 'Name of model to run on frames.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_integer('image_size', 224, 'Height and Width of model input.')
+flags.DEFINE_list('streams', ['1', '4', '8'], 'Stream counts to sweep.')
+flags.DEFINE_list(
+    'videos', [],
+    'Optional video files to use as streams, synthetic frames otherwise.')
+flags.DEFINE_integer('frames', 120,
+                     'Number of synthetic frames in each stream.')
+flags.DEFINE_float('source_fps', 30.0,
+                   'Frame rate of synthetic streams, 0 for unthrottled.')
+flags.DEFINE_integer('stride', 1, 'Process every stride-th frame.')
+flags.DEFINE_enum('mode', 'latency', ['latency', 'throughput'],
+                  'Batching mode of the pipeline.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def synthetic_stream(num_frames, size, fps):
+    frame = np.random.randint(0, 255, size=[size, size, 3], dtype=np.uint8)
+    for _ in range(num_frames):
+        if fps > 0:
+            time.sleep(1.0 / fps)
+        yield frame
+
+
+def preprocess(frame):
+    frame = frame[:FLAGS.image_size, :FLAGS.image_size]
+    return frame.astype(np.float32) / 127.5 - 1.0
+
+
+def main(argv):
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    config = Config(
+        actQ=DQuantize,
+        weightQ=XQuantize,
+        bits=FLAGS.bits,
+        use_act=False,
+        use_bn=False,
+        use_maxpool=True)
+    replica = keras_replica(FLAGS.model, config,
+                            (FLAGS.image_size, FLAGS.image_size, 3))
+
+    results = []
+    for num_streams in [int(s) for s in FLAGS.streams]:
+        if FLAGS.videos:
+            streams = [
+                FLAGS.videos[i % len(FLAGS.videos)]
+                for i in range(num_streams)
+            ]
+        else:
+            streams = [
+                synthetic_stream(FLAGS.frames, FLAGS.image_size,
+                                 FLAGS.source_fps) for _ in range(num_streams)
+            ]
+        pipeline = VideoPipeline(
+            replica,
+            streams,
+            mode=FLAGS.mode,
+            stride=FLAGS.stride,
+            preprocess=preprocess)
+        for _ in pipeline:
+            pass
+        summary = pipeline.stats.summary()
+        summary['streams'] = num_streams
+        logging.info(
+            '%d streams: %.1f frames/sec, p50 %.1f ms, p99 %.1f ms' %
+            (num_streams, summary['throughput'], summary['p50_ms'],
+             summary['p99_ms']))
+        results.append(summary)
+
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import numpy as np
+import tensorflow as tf
+from riptide.get_models import get_model
+from riptide.binary.binary_layers import Config, DQuantize, XQuantize
+from riptide.serving.shared_weights import SharedWeights, SharedWeightPool, pack_model_weights, keras_model_builder
+
+from absl import app
+from absl import flags
+from absl import logging
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('model', 'vggnet', 'Name of model to benchmark.')
+flags.DEFINE_float('bits', 2.0,
+                   'Number of activation bits to use for binary model.')
+flags.DEFINE_integer('image_size', 224,
+                     'Height and Width of benchmark images.')
+flags.DEFINE_integer('batch_size', 8, 'Size of each inference batch.')
+flags.DEFINE_integer('batches', 32,
+                     'Number of batches to run per worker count.')
+flags.DEFINE_list('workers', ['1', '2', '4'], 'Worker counts to sweep.')
+flags.DEFINE_integer(
+    'cpus_per_worker', 0,
+    'CPUs to pin each worker to, 0 splits the host evenly between workers.')
+flags.DEFINE_string('output', '', 'Optional path to write JSON results to.')
+
+
+def main(argv):
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    config_kwargs = {
+        'actQ': 'DQuantize',
+        'weightQ': 'XQuantize',
+        'bits': FLAGS.bits,
+        'use_act': False,
+        'use_bn': False,
+        'use_maxpool': True,
+    }
+    input_shape = (FLAGS.image_size, FLAGS.image_size, 3)
+    with Config(actQ=DQuantize, weightQ=XQuantize, bits=FLAGS.bits,
+                use_act=False, use_bn=False, use_maxpool=True):
+        model = get_model(FLAGS.model)
+    model(tf.zeros([1] + list(input_shape)), training=False)
+    float_bytes = sum(w.numpy().nbytes for w in model.weights)
+
+    # Pack once in the parent, every worker attaches to the same segment.
+    arrays, layout = pack_model_weights(model)
+    weights = SharedWeights.create(arrays, layout)
+    logging.info('Float weights: %.2f MB, shared packed weights: %.2f MB' %
+                 (float_bytes / 2.0**20, weights.nbytes / 2.0**20))
+
+    batch = np.random.uniform(
+        -1, 1, size=[FLAGS.batch_size] + list(input_shape)).astype(np.float32)
+    results = []
+    try:
+        for num_workers in [int(w) for w in FLAGS.workers]:
+            cpus_per_worker = FLAGS.cpus_per_worker or max(
+                len(os.sched_getaffinity(0)) // num_workers, 1)
+            with SharedWeightPool(
+                    keras_model_builder,
+                    weights,
+                    args=(FLAGS.model, config_kwargs, input_shape),
+                    num_workers=num_workers,
+                    cpus_per_worker=cpus_per_worker) as pool:
+                # Warm up every worker so model construction is not timed.
+                list(pool.map([batch] * num_workers))
+                start = time.perf_counter()
+                list(pool.map([batch] * FLAGS.batches))
+                elapsed = time.perf_counter() - start
+            throughput = FLAGS.batches * FLAGS.batch_size / elapsed
+            logging.info('%d workers (%d cpus each): %.1f img/s' %
+                         (num_workers, cpus_per_worker, throughput))
+            results.append({
+                'workers': num_workers,
+                'cpus_per_worker': cpus_per_worker,
+                'throughput': throughput,
+                'shared_bytes': weights.nbytes,
+                'float_bytes': float_bytes,
+            })
+    finally:
+        weights.close()
+
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    app.run(main)